@@ -87,7 +87,7 @@ def main(source=0):
                         print(center)
 
                 # Add FPS to the frame
-                frame_with_fps = putIterationsPerSec(frame, fps_counter.fps())
+                frame_with_fps = putIterationsPerSec(frame, fps_counter.rate())
                 video_display.frame = frame_with_fps
 
                 # Update FPS counter
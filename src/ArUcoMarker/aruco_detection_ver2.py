@@ -352,7 +352,7 @@ def main(src=1):
                         
                         
 
-                frame_with_fps = putIterationsPerSec(gray, fps_counter.fps())
+                frame_with_fps = putIterationsPerSec(gray, fps_counter.rate())
                 video_display.frame = frame_with_fps
 
                 if cv2.waitKey(1) & 0xFF == ord('q'):
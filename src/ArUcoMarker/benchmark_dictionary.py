@@ -0,0 +1,104 @@
+"""
+benchmark_dictionary.py
+
+Detection time and false positives of a restricted dictionary (only the field marker IDs) against the full
+parent dictionary.
+
+The benchmark renders cluttered frames: the field markers, markers of the same dictionary with IDs that
+were never printed for the field, and random marker-like patterns (a black border around random bits),
+on a noisy background. Every frame goes through the full dictionary's detector and through the restricted
+one from the detector registry. For each it reports the time per frame, how many field markers were found,
+and how many detections had an ID outside the field set (from the other markers or from the clutter).
+
+Usage:
+    python -m src.ArUcoMarker.benchmark_dictionary --ids 1 5 10 42 --frames 50
+
+Dependencies: argparse, time, cv2, numpy
+"""
+
+import argparse
+from time import perf_counter_ns
+
+import cv2
+import numpy as np
+
+from . import ARUCO_DICT
+from .custom_dictionary import FIELD_MARKER_IDS
+from .detector_registry import get_detector, PARAMETER_PROFILES
+from .utils import find_marker
+
+
+def random_pattern(rng, marker_size):
+    """Bits of a marker-like pattern: a black border around random cells."""
+    cells = np.zeros((marker_size + 2, marker_size + 2), dtype=np.uint8)
+    cells[1:-1, 1:-1] = rng.integers(0, 2, (marker_size, marker_size)) * 255
+    return cells
+
+
+def cluttered_frame(rng, aruco_dict, field_ids, other_ids, n_clutter, width=1280, height=720):
+    """
+    A noisy frame with the field markers, other markers of the dictionary and random patterns, each in its
+    own cell of a grid, with a white quiet zone around it.
+    """
+    frame = np.clip(rng.normal(170, 10, (height, width)), 0, 255).astype(np.uint8)
+    columns, rows = 8, 4
+    cell_w, cell_h = width // columns, height // rows
+    items = [("marker", i) for i in list(field_ids) + list(other_ids)] + [("pattern", None)] * n_clutter
+    slots = rng.permutation(columns * rows)[:len(items)]
+    for (kind, marker_id), slot in zip(items, slots):
+        size = int(rng.integers(60, 120))
+        quiet = size // (aruco_dict.markerSize + 2)  # One cell of white around the marker
+        if kind == "marker":
+            image = cv2.aruco.generateImageMarker(aruco_dict, marker_id, size)
+        else:
+            image = cv2.resize(random_pattern(rng, aruco_dict.markerSize), (size, size),
+                               interpolation=cv2.INTER_NEAREST)
+        x = (slot % columns) * cell_w + int(rng.integers(quiet, cell_w - size - quiet))
+        y = (slot // columns) * cell_h + int(rng.integers(quiet, cell_h - size - quiet))
+        frame[y - quiet:y + size + quiet, x - quiet:x + size + quiet] = 255
+        frame[y:y + size, x:x + size] = image
+    return cv2.GaussianBlur(frame, (3, 3), 0.8)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a restricted ArUco dictionary with the full one.")
+    parser.add_argument("--dict", default="DICT_5X5_1000", choices=list(ARUCO_DICT), help="Parent dictionary")
+    parser.add_argument("--profile", default="default", choices=list(PARAMETER_PROFILES), help="Parameter profile")
+    parser.add_argument("--ids", type=int, nargs="+", default=list(FIELD_MARKER_IDS), help="Field marker IDs")
+    parser.add_argument("--other-ids", type=int, default=4, help="Markers per frame with IDs outside the field set")
+    parser.add_argument("--clutter", type=int, default=20, help="Random patterns per frame")
+    parser.add_argument("--frames", type=int, default=50, help="Number of frames")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT[args.dict])
+    field_ids = set(args.ids)
+    candidates = np.array([i for i in range(len(aruco_dict.bytesList)) if i not in field_ids])
+    frames = [cluttered_frame(rng, aruco_dict, args.ids, rng.choice(candidates, args.other_ids, replace=False),
+                              args.clutter) for _ in range(args.frames)]
+
+    detectors = {
+        f"full ({len(aruco_dict.bytesList)})": get_detector(args.dict, args.profile),
+        f"restricted ({len(field_ids)})": get_detector(args.dict, args.profile, marker_ids=args.ids),
+    }
+    print(f"{args.frames} frames, {len(args.ids)} field markers, {args.other_ids} other markers and "
+          f"{args.clutter} random patterns per frame, {args.dict}")
+    print(f"{'dictionary':18}{'ms p50':>8}{'ms mean':>9}{'field found':>13}{'other IDs':>11}")
+    for name, detector in detectors.items():
+        find_marker(frames[0], detector=detector)  # warm up
+        times, found, false_positives = [], 0, 0
+        for frame in frames:
+            start = perf_counter_ns()
+            marker_array = find_marker(frame, detector=detector)
+            times.append(perf_counter_ns() - start)
+            ids = {int(marker_id) for _, marker_id in marker_array}
+            found += len(ids & field_ids)
+            false_positives += sum(1 for _, marker_id in marker_array if int(marker_id) not in field_ids)
+        total = len(field_ids) * len(frames)
+        print(f"{name:18}{np.median(times) / 1e6:8.2f}{np.mean(times) / 1e6:9.2f}"
+              f"{f'{found}/{total}':>13}{false_positives:11d}")
+
+
+if __name__ == "__main__":
+    main()
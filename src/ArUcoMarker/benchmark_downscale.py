@@ -0,0 +1,137 @@
+"""
+benchmark_downscale.py
+
+Speed and pose accuracy of coarse-to-fine marker detection (find_marker with `scale`) against full
+resolution detection, on recorded footage.
+
+Every frame is detected at full resolution (the baseline) and at every scale, once with the corners only
+scaled back and once refined with cornerSubPix on the full-resolution image. The markers found are
+undistorted and their poses estimated like in vs_motion ("points" mode). For every level the benchmark
+reports the detection time, the share of the baseline markers it found, and how far its corners, marker
+positions, orientations and pan/tilt errors are from the baseline. The baseline corners are not refined,
+so a deviation of a few tenths of a pixel is the baseline's error as much as the level's; a small, nearly
+fronto-parallel marker also flips between its two pose solutions, which shows in the rotation p95. Without
+footage it runs on a synthetic moving marker.
+
+Usage:
+    python -m src.ArUcoMarker.benchmark_downscale path/to/footage.mp4 --scales 0.5 0.25
+
+Dependencies: argparse, time, numpy
+"""
+
+import argparse
+from time import perf_counter_ns
+
+import numpy as np
+
+from . import ARUCO_DICT
+from .detector_registry import get_detector, PARAMETER_PROFILES
+from .utils import find_marker, estimate_poses, rodrigues_batch
+from ..Camera.calibrated_camera import CalibratedCamera
+from ..Camera.frame import Frame, gray_image
+from ..Camera.replay_source import ReplaySource
+from ..Camera.synthetic_scene import synthetic_frame, moving_frames
+
+
+def footage(path, max_frames, dict_name):
+    """Grayscale frames of the footage, or of a synthetic moving marker without a path."""
+    if path is None:
+        frames = moving_frames(synthetic_frame(dict_name), max_frames)
+    else:
+        frames = (frame for _, frame, _ in ReplaySource(path, pacing="fast").start().frames())
+    for count, frame in enumerate(frames):
+        if count >= max_frames:
+            break
+        yield gray_image(frame)
+
+
+def marker_poses(marker_array, calibrated_camera, marker_length):
+    """Per marker ID: (corners (4, 2) on the raw image, rvec, tvec, pan error, tilt error)."""
+    if not marker_array:
+        return {}
+    raw = np.array([marker.reshape(4, 2) for marker, _ in marker_array])
+    corners = calibrated_camera.undistort_points(raw)
+    poses = estimate_poses(corners, calibrated_camera.roi_cam_mtx, calibrated_camera.undistorted_dist,
+                           marker_length=marker_length)
+    result = {}
+    for i, (_, marker_id) in enumerate(marker_array):
+        result.setdefault(int(marker_id), (raw[i], poses.rvecs[i], poses.tvecs[i],
+                                           poses.pan_errors[i], poses.tilt_errors[i]))
+    return result
+
+
+def rotation_angle(rvec_a, rvec_b):
+    """Angle in degrees of the rotation between two orientations."""
+    relative = rodrigues_batch(rvec_a)[0].T @ rodrigues_batch(rvec_b)[0]
+    return np.degrees(np.arccos(np.clip((np.trace(relative) - 1) / 2, -1.0, 1.0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare coarse-to-fine marker detection with full resolution.")
+    parser.add_argument("path", nargs="?", default=None, help="Video file or image directory (synthetic if omitted)")
+    parser.add_argument("--dict", default="DICT_5X5_1000", choices=list(ARUCO_DICT), help="ArUco dictionary")
+    parser.add_argument("--profile", default="default", choices=list(PARAMETER_PROFILES), help="Parameter profile")
+    parser.add_argument("--scales", type=float, nargs="+", default=[0.5, 0.25], help="Downscale levels")
+    parser.add_argument("--frames", type=int, default=300, help="Maximum number of frames")
+    parser.add_argument("--marker-length", type=float, default=0.033, help="Marker side in meters")
+    parser.add_argument("--camera-matrix", default="src/Camera/calibration/pical1280720new/cameraMatrix.pkl")
+    parser.add_argument("--dist", default="src/Camera/calibration/pical1280720new/dist.pkl")
+    args = parser.parse_args()
+
+    detector = get_detector(args.dict, args.profile)
+    levels = [("full", None, False)]
+    for scale in args.scales:
+        levels += [(f"{scale:g}", scale, False), (f"{scale:g} + refine", scale, True)]
+    results = {name: {"ns": [], "found": 0, "extra": 0, "corner": [], "position": [], "rotation": [],
+                      "angle": []} for name, _, _ in levels}
+
+    calibrated_camera = None
+    frames = baseline_markers = 0
+    for gray in footage(args.path, args.frames, args.dict):
+        if calibrated_camera is None:
+            calibrated_camera = CalibratedCamera(cam_mat_path=args.camera_matrix, cam_dist_path=args.dist,
+                                                 frame_height=gray.shape[0], frame_width=gray.shape[1])
+        frames += 1
+        baseline = None
+        for name, scale, refine in levels:
+            frame = Frame(gray)  # The downscale is part of the measured detection
+            start = perf_counter_ns()
+            marker_array = find_marker(frame, detector=detector, scale=scale, refine=refine)
+            elapsed = perf_counter_ns() - start
+            poses = marker_poses(marker_array, calibrated_camera, args.marker_length)
+
+            result = results[name]
+            result["ns"].append(elapsed)
+            if baseline is None:
+                baseline = poses
+                baseline_markers += len(poses)
+            result["extra"] += len(poses.keys() - baseline.keys())
+            for marker_id, (corners, rvec, tvec, pan, tilt) in poses.items():
+                if marker_id not in baseline:
+                    continue
+                base_corners, base_rvec, base_tvec, base_pan, base_tilt = baseline[marker_id]
+                result["found"] += 1
+                result["corner"].append(np.linalg.norm(corners - base_corners, axis=1).max())
+                result["position"].append(np.linalg.norm(tvec - base_tvec) * 1e3)
+                result["rotation"].append(rotation_angle(base_rvec, rvec))
+                result["angle"].append(max(abs(pan - base_pan), abs(tilt - base_tilt)))
+
+    if not frames:
+        raise SystemExit(f"No frames could be read from {args.path}")
+    source = args.path or "synthetic moving marker"
+    print(f"{frames} frames of {source}, {baseline_markers} markers found at full resolution")
+    print(f"{'level':14}{'detect ms':>10}{'found':>8}{'extra':>7}{'corner px':>14}{'position mm':>14}"
+          f"{'rotation deg':>14}{'pan/tilt deg':>14}")
+    print(f"{'':14}{'p50':>10}{'':>8}{'':>7}" + f"{'p50/p95':>14}" * 4)
+    for name, _, _ in levels:
+        result = results[name]
+        found = result["found"] / baseline_markers * 100 if baseline_markers else 0.0
+        line = f"{name:14}{np.median(result['ns']) / 1e6:10.2f}{found:7.1f}%{result['extra']:7d}"
+        for key in ("corner", "position", "rotation", "angle"):
+            values = result[key]
+            line += f"{np.median(values):8.2f}/{np.percentile(values, 95):<5.2f}" if values else f"{'-':>14}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
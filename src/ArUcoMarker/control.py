@@ -98,7 +98,7 @@ def main(src=0):
             last_center = center
 
             # Overlay FPS information on the frame
-            frame_with_fps = putIterationsPerSec(frame_with_markers, fps_counter.fps())
+            frame_with_fps = putIterationsPerSec(frame_with_markers, fps_counter.rate())
 
             # Map the center coordinates to servo angles
             servo_x = np.interp(center[0], [0, video_stream.frame_width], [BASE_MIN, BASE_MAX])
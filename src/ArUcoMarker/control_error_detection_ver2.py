@@ -256,7 +256,7 @@ def main(src=0):
                             ANGLE_DATA.pop(0)
 
                 # Display FPS on the frame
-                frame_with_fps = putIterationsPerSec(frame, fps_counter.fps())
+                frame_with_fps = putIterationsPerSec(frame, fps_counter.rate())
                 video_display.frame = frame_with_fps
 
             # Update FPS counter
@@ -0,0 +1,95 @@
+"""
+custom_dictionary.py
+
+ArUco dictionaries restricted to the marker IDs that are actually printed.
+
+The predefined dictionaries hold up to 1000 codewords. For every marker candidate the detector compares
+the candidate's bits against every codeword in all 4 rotations, and accepts whichever one is within the
+dictionary's correction distance, so a larger dictionary costs more per candidate and turns more clutter
+(and markers from other sets) into detections with IDs we never printed. A restricted dictionary holds
+only the configured IDs, with their bits copied from the parent dictionary, so printed markers are still
+recognized and everything else is rejected.
+
+The detector of a restricted dictionary numbers its markers 0..n-1. RestrictedDetector wraps it and maps
+the IDs back to the parent dictionary's IDs, so find_marker, the trackers and the pose code see the same
+IDs (e.g. MARKER_ID 5) as with the full dictionary. Get one from the registry with
+`get_detector(dict_name, marker_ids=...)`.
+
+Usage:
+    detector = get_detector("DICT_5X5_1000", marker_ids=FIELD_MARKER_IDS)
+    marker_array = find_marker(frame, detector=detector)   # IDs 1, 5, 10 or 42 only
+
+Dependencies: cv2, numpy
+"""
+
+import cv2
+import numpy as np
+
+# IDs of the markers placed on the field (DICT_5X5_1000), see utils.draw_field
+FIELD_MARKER_IDS = (1, 5, 10, 42)
+
+
+def restricted_dictionary(parent, marker_ids, max_correction_bits=None):
+    """
+    Build a dictionary holding only some markers of a parent dictionary.
+
+    Parameters:
+    - parent (cv2.aruco.Dictionary): The dictionary the markers were printed from.
+    - marker_ids (sequence of int): IDs of the markers to keep, in the parent dictionary.
+    - max_correction_bits (int, optional): Bits the detector may correct. Defaults to the parent's.
+
+    Returns:
+    - cv2.aruco.Dictionary: Dictionary whose marker i is the parent's marker_ids[i].
+    """
+    marker_ids = [int(marker_id) for marker_id in marker_ids]
+    if not marker_ids:
+        raise ValueError("A restricted dictionary needs at least one marker ID.")
+    if len(set(marker_ids)) != len(marker_ids):
+        raise ValueError(f"Duplicate marker IDs in {marker_ids}.")
+    count = len(parent.bytesList)
+    invalid = [marker_id for marker_id in marker_ids if not 0 <= marker_id < count]
+    if invalid:
+        raise ValueError(f"Marker IDs {invalid} are not in the parent dictionary (IDs 0 to {count - 1}).")
+    if max_correction_bits is None:
+        max_correction_bits = parent.maxCorrectionBits
+    return cv2.aruco.Dictionary(parent.bytesList[marker_ids], parent.markerSize, max_correction_bits)
+
+
+class RestrictedDetector:
+    """ArucoDetector over a restricted dictionary that reports the parent dictionary's marker IDs."""
+
+    def __init__(self, parent, marker_ids, parameters=None, max_correction_bits=None):
+        """
+        Parameters:
+        - parent (cv2.aruco.Dictionary): The dictionary the markers were printed from.
+        - marker_ids (sequence of int): IDs of the markers to detect, in the parent dictionary.
+        - parameters (cv2.aruco.DetectorParameters, optional): Detection parameters. Defaults to OpenCV's.
+        - max_correction_bits (int, optional): Bits the detector may correct. Defaults to the parent's.
+        """
+        self.marker_ids = np.array([int(marker_id) for marker_id in marker_ids], dtype=np.int32)
+        self.dictionary = restricted_dictionary(parent, self.marker_ids, max_correction_bits)
+        if parameters is None:
+            parameters = cv2.aruco.DetectorParameters()
+        self.detector = cv2.aruco.ArucoDetector(self.dictionary, parameters)
+
+    def detectMarkers(self, image):
+        """
+        Detect the markers, like cv2.aruco.ArucoDetector.detectMarkers.
+
+        Parameters:
+        - image (numpy.ndarray): Grayscale or color image.
+
+        Returns:
+        - tuple: (corners, ids, rejected), with ids in the parent dictionary (or None if nothing was found).
+        """
+        corners, ids, rejected = self.detector.detectMarkers(image)
+        if ids is not None:
+            ids = self.marker_ids[ids]
+        return corners, ids, rejected
+
+    def getDictionary(self):
+        """The restricted dictionary (its marker i is the parent's marker_ids[i])."""
+        return self.dictionary
+
+    def getDetectorParameters(self):
+        return self.detector.getDetectorParameters()
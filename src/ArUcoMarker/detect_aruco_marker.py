@@ -103,7 +103,7 @@ def thread_video_stream(source=0):
                 distortion_coeff=video_stream.camera_dist
             )
             # Overlay FPS information on the frame
-            frame_with_fps = putIterationsPerSec(frame_with_markers, fps_counter.fps())
+            frame_with_fps = putIterationsPerSec(frame_with_markers, fps_counter.rate())
             video_display.frame = frame_with_fps
 
         # Update FPS counter
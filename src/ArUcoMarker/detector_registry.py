@@ -0,0 +1,129 @@
+"""
+detector_registry.py
+
+Builds each cv2.aruco.ArucoDetector once and hands out the same instance to every caller.
+
+Creating the dictionary, the detector parameters and the detector costs time on every frame, and the
+result never changes for a given dictionary. Detectors are cached by dictionary name (the keys of
+ARUCO_DICT) and parameter profile, so a tracking loop looks its detector up once before the loop and
+threads that track with the same settings share one detector. detectMarkers does not modify the
+detector, so a shared instance can be used from several threads at once.
+
+With `marker_ids` the detector only knows those markers of the dictionary (a RestrictedDetector from
+custom_dictionary): identifying a candidate is cheaper and markers with other IDs are never reported.
+
+Parameter profiles:
+    - "default": OpenCV's default DetectorParameters.
+    - "fast": Fewer adaptive threshold passes, for high frame rates when the marker is large in the image.
+    - "subpix": Sub-pixel corner refinement, for more precise pose estimates.
+
+Usage:
+    from .detector_registry import get_detector
+    detector = get_detector("DICT_5X5_1000")
+    marker_array = find_marker(frame, detector=detector)
+    field_detector = get_detector("DICT_5X5_1000", marker_ids=(1, 5, 10, 42))
+
+Dependencies: threading, cv2
+"""
+
+import threading
+
+import cv2
+
+from . import ARUCO_DICT
+from .custom_dictionary import RestrictedDetector
+
+# DetectorParameters attributes set by each profile (on top of OpenCV's defaults)
+PARAMETER_PROFILES = {
+    "default": {},
+    "fast": {
+        "adaptiveThreshWinSizeMin": 5,
+        "adaptiveThreshWinSizeMax": 21,
+        "adaptiveThreshWinSizeStep": 16,
+    },
+    "subpix": {
+        "cornerRefinementMethod": cv2.aruco.CORNER_REFINE_SUBPIX,
+        "cornerRefinementWinSize": 5,
+        "cornerRefinementMaxIterations": 30,
+        "cornerRefinementMinAccuracy": 0.01,
+    },
+}
+
+_detectors = {}
+_lock = threading.Lock()
+
+
+def dictionary_name(aruco_dict_type):
+    """
+    Get the ARUCO_DICT name of a dictionary.
+
+    Parameters:
+    - aruco_dict_type (str or int): Dictionary name (e.g. "DICT_5X5_1000") or cv2.aruco constant.
+
+    Returns:
+    - str: The dictionary name.
+    """
+    if isinstance(aruco_dict_type, str):
+        if aruco_dict_type not in ARUCO_DICT:
+            raise KeyError(f"Unknown ArUco dictionary '{aruco_dict_type}'.")
+        return aruco_dict_type
+    for name, value in ARUCO_DICT.items():
+        if value == aruco_dict_type:
+            return name
+    raise KeyError(f"Unknown ArUco dictionary type {aruco_dict_type}.")
+
+
+def build_parameters(profile="default"):
+    """
+    Create a DetectorParameters object for a profile.
+
+    Parameters:
+    - profile (str): Name of the profile in PARAMETER_PROFILES.
+
+    Returns:
+    - cv2.aruco.DetectorParameters: A new parameters object.
+    """
+    if profile not in PARAMETER_PROFILES:
+        raise KeyError(f"Unknown detector profile '{profile}', expected one of {list(PARAMETER_PROFILES)}.")
+    parameters = cv2.aruco.DetectorParameters()
+    for attribute, value in PARAMETER_PROFILES[profile].items():
+        setattr(parameters, attribute, value)
+    return parameters
+
+
+def get_detector(aruco_dict_type, profile="default", marker_ids=None):
+    """
+    Get the shared ArucoDetector for a dictionary and parameter profile, building it on first use.
+
+    Parameters:
+    - aruco_dict_type (str or int): Dictionary name from ARUCO_DICT or the cv2.aruco constant.
+    - profile (str): Parameter profile name (see PARAMETER_PROFILES).
+    - marker_ids (sequence of int, optional): Only detect these markers of the dictionary.
+
+    Returns:
+    - cv2.aruco.ArucoDetector or RestrictedDetector: The cached detector.
+    """
+    if marker_ids is not None:
+        marker_ids = tuple(sorted({int(marker_id) for marker_id in marker_ids}))
+    key = (dictionary_name(aruco_dict_type), profile, marker_ids)
+    detector = _detectors.get(key)
+    if detector is not None:
+        return detector
+
+    with _lock:
+        # Another thread may have built it while we were waiting
+        detector = _detectors.get(key)
+        if detector is None:
+            aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT[key[0]])
+            if marker_ids is None:
+                detector = cv2.aruco.ArucoDetector(aruco_dict, build_parameters(profile))
+            else:
+                detector = RestrictedDetector(aruco_dict, marker_ids, build_parameters(profile))
+            _detectors[key] = detector
+        return detector
+
+
+def clear():
+    """Drop every cached detector, e.g. after changing PARAMETER_PROFILES."""
+    with _lock:
+        _detectors.clear()
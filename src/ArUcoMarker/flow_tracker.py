@@ -0,0 +1,199 @@
+"""
+flow_tracker.py
+
+Marker tracking with full ArUco detections every few frames and optical flow in between.
+
+A full detection runs every `detect_every` frames, or whenever tracking fails. In between, the 4 corners
+of the tracked marker are propagated from the previous frame with pyramidal Lucas-Kanade optical flow,
+which costs a small fraction of a detection. A propagated quadrilateral is only accepted if:
+- every corner was tracked, and tracking it back lands within `max_backtrack_error` pixels of where it
+  started (forward-backward check),
+- it is still convex with the same corner order (winding),
+- its area and every side changed by less than `max_shape_change` relative to the previous frame.
+Otherwise a full detection runs on the same frame. The flow only looks at a window around the marker (as
+far as the coarsest pyramid level can follow it), so its cost does not grow with the frame size.
+
+With `detect_scale` the full detections run on the downscaled gray image (the camera's low-resolution
+stream when the Frame has one) and are refined on the full-resolution image; the flow always runs at full
+resolution.
+
+The output has the find_marker format, so the pose code downstream is unchanged. On flow frames only the
+tracked marker is returned.
+
+Usage:
+    tracker = HybridMarkerTracker(get_detector("DICT_5X5_1000"), marker_id=5, detect_every=4)
+    marker_array = tracker.track(frame, timestamp)
+
+Dependencies: cv2, numpy
+"""
+
+import cv2
+import numpy as np
+
+from .utils import find_marker
+from ..Camera.frame import Frame
+
+
+class HybridMarkerTracker:
+    def __init__(self, detector, marker_id=None, detect_every=4, marker_search=None, win_size=(21, 21),
+                 max_level=3, max_backtrack_error=1.0, max_shape_change=0.25, detect_scale=None):
+        """
+        Parameters:
+        - detector (cv2.aruco.ArucoDetector): Detector for the full detections.
+        - marker_id (int, optional): ID of the tracked marker. Defaults to the first marker found.
+        - detect_every (int): Run a full detection every this many frames (1 detects on every frame).
+        - marker_search (RoiMarkerSearch, optional): Run the full detections through this window search
+          instead of scanning the whole frame.
+        - win_size (tuple): Lucas-Kanade search window per pyramid level in pixels.
+        - max_level (int): Number of pyramid levels above the full resolution.
+        - max_backtrack_error (float): Forward-backward tracking error in pixels above which a corner is lost.
+        - max_shape_change (float): Largest relative change of the area and of each side between frames.
+        - detect_scale (float, optional): Run the full detections at this fraction of the resolution, e.g. 0.5.
+          A marker_search uses its own detect_scale.
+        """
+        self.detector = detector
+        self.marker_id = marker_id
+        self.detect_every = max(1, detect_every)
+        self.marker_search = marker_search
+        self.detect_scale = detect_scale
+        self.flow_params = dict(
+            winSize=tuple(win_size), maxLevel=max_level,
+            criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03)
+        )
+        self.max_backtrack_error = max_backtrack_error
+        self.max_shape_change = max_shape_change
+
+        # Statistics
+        self.detections = 0
+        self.flow_frames = 0
+        self.flow_failures = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the marker, the next frame runs a full detection."""
+        self.corners = None      # Tracked corners (4, 2) in the previous frame
+        self.tracked_id = None   # ID of the tracked marker, as returned by find_marker
+        self.previous = None     # Previous grayscale frame
+        self.since_detection = 0
+        if self.marker_search is not None:
+            self.marker_search.reset()
+
+    @property
+    def tracking(self):
+        """True while the marker is followed by optical flow between detections."""
+        return self.corners is not None
+
+    @staticmethod
+    def _shape(corners):
+        """Signed area and side lengths of a quadrilateral."""
+        x, y = corners[:, 0], corners[:, 1]
+        area = 0.5 * np.sum(x * np.roll(y, -1) - np.roll(x, -1) * y)
+        sides = np.linalg.norm(corners - np.roll(corners, -1, axis=0), axis=1)
+        return area, sides
+
+    def _consistent(self, previous, corners):
+        """Quadrilateral consistency test of the propagated corners against the previous ones."""
+        if not cv2.isContourConvex(corners.reshape(-1, 1, 2).astype(np.float32)):
+            return False
+        area_before, sides_before = self._shape(previous)
+        area, sides = self._shape(corners)
+        # Same winding, so the corner order is preserved
+        if np.sign(area) != np.sign(area_before) or area_before == 0:
+            return False
+        limit = self.max_shape_change
+        if abs(area / area_before - 1) > limit:
+            return False
+        return bool(np.all(np.abs(sides / np.maximum(sides_before, 1e-6) - 1) <= limit))
+
+    def _flow_window(self, shape):
+        """Window (x0, y0, x1, y1) around the marker that the pyramid can follow it in, clipped to the frame."""
+        height, width = shape[:2]
+        # Half of the marker size, and at least the reach of the search window at the coarsest level
+        reach = self.flow_params["winSize"][0] * 2 ** self.flow_params["maxLevel"] / 2
+        low, high = self.corners.min(axis=0), self.corners.max(axis=0)
+        margin = max(0.5 * float(np.max(high - low)), reach)
+        x0, y0 = np.maximum(np.floor(low - margin), 0).astype(int)
+        x1, y1 = np.ceil(high + margin).astype(int)
+        return x0, y0, min(x1, width), min(y1, height)
+
+    def _propagate(self, gray):
+        """Corners moved into the new frame by optical flow, or None if tracking failed."""
+        x0, y0, x1, y1 = self._flow_window(gray.shape)
+        offset = np.array([x0, y0], dtype=np.float32)
+        before, after = self.previous[y0:y1, x0:x1], gray[y0:y1, x0:x1]
+
+        points = (self.corners - offset).reshape(-1, 1, 2).astype(np.float32)
+        moved, status, _ = cv2.calcOpticalFlowPyrLK(before, after, points, None, **self.flow_params)
+        if moved is None or not status.all():
+            return None
+        back, status, _ = cv2.calcOpticalFlowPyrLK(after, before, moved, None, **self.flow_params)
+        if back is None or not status.all():
+            return None
+        if np.max(np.linalg.norm((back - points).reshape(-1, 2), axis=1)) > self.max_backtrack_error:
+            return None
+
+        corners = moved.reshape(4, 2) + offset
+        if not self._consistent(self.corners, corners):
+            return None
+        return corners
+
+    def _detect(self, frame, timestamp):
+        """Full detection on a Frame or gray image; remembers the tracked marker's corners."""
+        if self.marker_search is not None:
+            marker_array = self.marker_search.detect(frame, timestamp)
+        else:
+            marker_array = find_marker(frame, detector=self.detector, scale=self.detect_scale)
+        self.detections += 1
+        self.since_detection = 0
+
+        self.corners = None
+        for marker, marker_id in marker_array:
+            if self.marker_id is None or int(marker_id) == self.marker_id:
+                self.corners = marker.reshape(4, 2).astype(np.float32)
+                self.tracked_id = marker_id
+                break
+        return marker_array
+
+    def track(self, frame, timestamp=None):
+        """
+        Find the markers in the next frame, by optical flow or by a full detection.
+
+        Parameters:
+        - frame (numpy.ndarray or Frame): The frame, BGR or grayscale, or a Frame (its gray view is used).
+          Consecutive calls must get consecutive frames.
+        - timestamp (float, optional): Capture time of the frame in seconds (for the window search).
+
+        Returns:
+        - list: (corners, id) tuples like find_marker. On flow frames only the tracked marker.
+        """
+        if isinstance(frame, Frame):
+            gray, owned = frame.gray, False
+        elif frame.ndim == 2:
+            gray, owned = frame, False
+        else:
+            gray, owned = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), True
+
+        marker_array = None
+        if self.corners is not None and self.previous is not None and self.since_detection + 1 < self.detect_every:
+            corners = self._propagate(gray)
+            if corners is not None:
+                self.corners = corners
+                self.since_detection += 1
+                self.flow_frames += 1
+                marker_array = [(corners.reshape(1, 4, 2), self.tracked_id)]
+            else:
+                self.flow_failures += 1
+
+        if marker_array is None:
+            # A Frame keeps its downscaled views for the detection
+            marker_array = self._detect(frame if isinstance(frame, Frame) else gray, timestamp)
+
+        # A grayscale frame may be a view into the camera ring or a pooled buffer, keep a copy of it for
+        # the next flow step
+        if owned:
+            self.previous = gray
+        elif self.previous is None or self.previous.shape != gray.shape or self.previous is gray:
+            self.previous = gray.copy()
+        else:
+            np.copyto(self.previous, gray)
+        return marker_array
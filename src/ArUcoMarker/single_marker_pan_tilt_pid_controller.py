@@ -35,6 +35,8 @@ from .utils import (
     calc_dist
 )
 from ..PID import PIDController
+from ..telemetry import TelemetryRecorder
+from ..logging_utils import setup_logging, RateLimitedLogger
 
 # Logging Configuration
 # This sets the logging level, determining the lowest level of messages that will be logged.
@@ -58,12 +60,12 @@ if not os.path.exists(log_path):
     os.mkdir(log_path)
 # Define the log file path
 log_file = os.path.join(log_path, f'single_marker_pid_log_{current_date}.log')
-# Configure logging
-logging.basicConfig(
-    filename=log_file,            # Full path to the log file
-    level=logging.INFO,           # Minimum log level to save (e.g., INFO)
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Log format
-)
+# Per-frame errors and servo angles go to this CSV instead of the log
+data_file = os.path.join(log_path, f'single_marker_pid_data_{current_date}.csv')
+# Configure logging. The file is written by a background thread, so logging never waits on the disk.
+setup_logging(log_file, level=logging.INFO)
+# Per-frame messages pass at most once per second
+frame_log = RateLimitedLogger(interval=1.0)
 logging.info("Logging system initialized.")
 
 ## Define processes 
@@ -184,7 +186,7 @@ def plot_data(position_data, time_data, angle_data, error_data, current_index):
         ang_data = np.array(angle_data)   # shape: (N, 2)
         err_data = np.array(error_data)   # shape: (N, 2)
 
-        print(ang_data)
+        # print(ang_data)
 
         # 1) Distance
         line_dist.set_data(x_data, pos_data)
@@ -223,6 +225,9 @@ def main(src=0):
     start_time = time.time()
     frame_count = 0
     index = 0  # We'll keep this if you want, but won't really use it for lists.
+    telemetry = TelemetryRecorder(data_file, ["Time", "Pan_Error", "Pan_Angle", "Tilt_Error", "Tilt_Angle"])
+    # Time the controllers were last updated
+    last_control_time = None
 
     try:
         # Initialize camera and display threads (stubs or actual)
@@ -283,24 +288,24 @@ def main(src=0):
                         err_y = float(y - center[1]/ center[1])
 
 
-                        turn_x = pan_controller.compute(err_x, current_time)
-                        turn_y = tilt_controller.compute(err_y, current_time)
+                        # Time since the previous control update (not since the start of the run)
+                        dt = current_time - last_control_time if last_control_time is not None else 0
+                        last_control_time = current_time
+                        turn_x = pan_controller.compute(err_x, dt)
+                        turn_y = tilt_controller.compute(err_y, dt)
 
                         cam_pan = -turn_x
                         cam_tilt = -turn_y
 
-                        print(f'This is the current angle {pan_servo.angle}')
-                        print(f'This is how many degrees to change {cam_pan}')
-
                         cam_tilt = max(0, min(BASE_MAX, cam_tilt))
-                        print(f'This is the new pan angle {cam_pan}')
 
                         pan_servo.angle = int(cam_pan)
                         tilt_servo.angle = int(cam_tilt)
 
-                        # Logging
-                        logging.info(f"Time: {current_time:.2f}s | Error X: {err_x:.2f}, Error Y: {err_y:.2f}")
-                        logging.info(f"Pan Angle: {pan_servo.angle}, Tilt Angle: {tilt_servo.angle}")
+                        # Record the frame, and log it at INFO (the run log level) at most once per second
+                        telemetry.record(current_time, err_x, pan_servo.angle, err_y, tilt_servo.angle)
+                        frame_log.info("Time: %.2fs | Error X: %.2f, Error Y: %.2f | Pan Angle: %s, Tilt Angle: %s",
+                                       current_time, err_x, err_y, pan_servo.angle, tilt_servo.angle)
 
                         # 4) Append data for plotting (as lists)
                         TIME_DATA.append(current_time)
@@ -316,7 +321,7 @@ def main(src=0):
                             ERROR.pop(0)
 
                 # Display FPS
-                frame_with_fps = putIterationsPerSec(frame, fps_counter.fps())
+                frame_with_fps = putIterationsPerSec(frame, fps_counter.rate())
                 video_display.frame = frame_with_fps
 
             # Update FPS counter
@@ -337,6 +342,8 @@ def main(src=0):
             video_stream.stop()
         if video_display:
             video_display.stop()
+        telemetry.close()
+        logging.info(f"Saved data at: {data_file}")
         cv2.destroyAllWindows()
 
 
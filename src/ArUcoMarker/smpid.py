@@ -24,6 +24,7 @@ from . import (
     putIterationsPerSec,
     VideoShow
 )
+from .detector_registry import get_detector
 from .utils import (
     get_corner_and_center,
     find_marker,
@@ -35,6 +36,9 @@ from .utils import (
     calc_dist
 )
 from ..PID import PIDController
+from ..telemetry import TelemetryRecorder
+from ..logging_utils import setup_logging, RateLimitedLogger
+from ..stage_profiler import StageProfiler
 
 # Logging Configuration
 # This sets the logging level, determining the lowest level of messages that will be logged.
@@ -58,12 +62,12 @@ if not os.path.exists(log_path):
     os.mkdir(log_path)
 # Define the log file path
 log_file = os.path.join(log_path, f'single_marker_pid_log_{current_date}.log')
-# Configure logging
-logging.basicConfig(
-    filename=log_file,            # Full path to the log file
-    level=logging.INFO,           # Minimum log level to save (e.g., INFO)
-    format='%(asctime)s - %(levelname)s - %(message)s',  # Log format
-)
+# Per-frame errors and servo angles go to this CSV instead of the log
+data_file = os.path.join(log_path, f'single_marker_pid_data_{current_date}.csv')
+# Configure logging. The file is written by a background thread, so logging never waits on the disk.
+setup_logging(log_file, level=logging.INFO)
+# Per-frame messages pass at most once per second
+frame_log = RateLimitedLogger(interval=1.0)
 logging.info("Logging system initialized.")
 
 ## Define processes 
@@ -223,11 +227,21 @@ def main(src=0):
     start_time = time.time()
     frame_count = 0
     index = 0  # We'll keep this if you want, but won't really use it for lists.
+    telemetry = TelemetryRecorder(data_file, ["Time", "Pan_Error", "Pan_Angle", "Tilt_Error", "Tilt_Angle"])
+    # Per-stage latency, drawn on the video feed and summarized in the log at the end
+    profiler = StageProfiler()
 
     try:
         # Initialize camera and display threads (stubs or actual)
-        video_stream = WebcamVideoStreamThreaded(src).start()
+        video_stream = WebcamVideoStreamThreaded(src)
+        video_stream.profiler = profiler
+        video_stream.start()
         video_display = VideoShow(video_stream.frame).start()
+        frames = video_stream.bus.subscribe()
+        # Capture time of the frame the controllers were last updated with
+        last_control_time = None
+        # Build the detector once and reuse it for every frame
+        detector = get_detector(ARUCO_DICT_TYPE)
         fps_counter = FPS().start()
 
         # 2) If we show plots, start them in a separate thread
@@ -241,13 +255,17 @@ def main(src=0):
 
         # 3) Main loop: Acquire data
         while True:
-            frame_count += 1
-            current_time = time.time() - start_time
-
             if video_stream.stopped or video_display.stopped:
                 break
 
-            frame = video_stream.frame
+            # Wait for a frame we have not processed yet
+            item = frames.wait(timeout=1.0)
+            if item is None:
+                continue
+            _, frame, timestamp = item
+
+            frame_count += 1
+            current_time = time.time() - start_time
 
             # Skip frames
             if frame_count % FRAME_SKIP != 0:
@@ -259,9 +277,8 @@ def main(src=0):
                 center = (int(frame_width // 2), int(frame_height // 2))
 
                 draw_center_frame(frame, center)
-                aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT_TYPE)
-                parameters = cv2.aruco.DetectorParameters()
-                marker_array = find_marker(frame, aruco_dict, parameters)
+                with profiler.span("detect"):
+                    marker_array = find_marker(frame, detector=detector)
 
                 if marker_array:
                     for marker, marker_id in marker_array:
@@ -270,14 +287,15 @@ def main(src=0):
                         center_aruco = coord[-1]
                         total_dist = calc_dist(center, center_aruco)
 
-                        transformation_matrix = track_and_render_marker(
-                            frame,
-                            marker,
-                            marker_id,
-                            camera_matrix=video_stream.camera_matrix,
-                            distortion_coefficient=video_stream.camera_dist,
-                            marker_length = 0.046
-                        )
+                        with profiler.span("pose"):
+                            transformation_matrix = track_and_render_marker(
+                                frame,
+                                marker,
+                                marker_id,
+                                camera_matrix=video_stream.camera_matrix,
+                                distortion_coefficient=video_stream.camera_dist,
+                                marker_length = 0.046
+                            )
 
                         # Extract translation vector components
                         tvec = transformation_matrix[:-1,-1] # Last column all the rows
@@ -290,12 +308,16 @@ def main(src=0):
                         error_angle_deg = pan_angle * 180 / np.pi
 
                         # Compute the PID output for pan (assumes pan_controller is defined)
-                        turn_x = pan_controller.compute(error_angle_deg, current_time)
+                        # Time since the previous control update (not since the start of the run)
+                        dt = timestamp - last_control_time if last_control_time is not None else 0
+                        last_control_time = timestamp
+                        turn_x = pan_controller.compute(error_angle_deg, dt)
                         new_pan_angle = pan_servo.angle - turn_x
 
                         # Clamp the new pan angle between BASE_MIN and BASE_MAX.
                         new_pan_angle = np.clip(new_pan_angle, BASE_MIN, BASE_MAX)
-                        pan_servo.angle = int(new_pan_angle)
+                        with profiler.span("servo_write"):
+                            pan_servo.angle = int(new_pan_angle)
 
                         # ---- Tilt Correction ----
                         # Compute the tilt error (using y and z)
@@ -303,18 +325,20 @@ def main(src=0):
                         error_tilt_deg = tilt_angle * 180 / np.pi
 
                         # Compute the PID output for tilt (assumes tilt_controller is defined)
-                        turn_y = tilt_controller.compute(error_tilt_deg, current_time)
+                        turn_y = tilt_controller.compute(error_tilt_deg, dt)
                         new_tilt_angle = tilt_servo.angle - turn_y
 
                         # Clamp the new tilt angle between BASE_MIN and BASE_MAX.
                         new_tilt_angle = np.clip(new_tilt_angle, BASE_MIN, BASE_MAX)
-                        tilt_servo.angle = int(new_tilt_angle)
+                        with profiler.span("servo_write"):
+                            tilt_servo.angle = int(new_tilt_angle)
 
-                        # Logging for debugging
-                        print(f"Pan: Current servo angle: {pan_servo.angle}, Error: {error_angle_deg:.2f}�")
-                        print(f"Tilt:  Current servo angle: {tilt_servo.angle}, Error: {error_tilt_deg:.2f}�")
-                        logging.info(f"Time: {current_time:.2f}s | Error X (Pan): {error_angle_deg:.2f}�, Error Y (Tilt): {error_tilt_deg:.2f}�")
-                        logging.info(f"Pan Angle: {pan_servo.angle}, Tilt Angle: {tilt_servo.angle}")
+                        # Record the frame, and log it at INFO (the run log level) at most once per second
+                        telemetry.record(current_time, error_angle_deg, pan_servo.angle,
+                                         error_tilt_deg, tilt_servo.angle)
+                        frame_log.info("Time: %.2fs | Error X (Pan): %.2f�, Error Y (Tilt): %.2f� | "
+                                       "Pan Angle: %s, Tilt Angle: %s", current_time, error_angle_deg,
+                                       error_tilt_deg, pan_servo.angle, tilt_servo.angle)
 
                         # Append data for plotting
                         TIME_DATA.append(current_time)
@@ -329,13 +353,16 @@ def main(src=0):
                             ANGLE_DATA.pop(0)
                             ERROR.pop(0)
 
-                # Display FPS on frame
-                frame_with_fps = putIterationsPerSec(frame, fps_counter.fps())
+                # Display FPS and the stage latencies on frame
+                profiler.draw(frame)
+                frame_with_fps = putIterationsPerSec(frame, fps_counter.rate())
                 video_display.frame = frame_with_fps
 
             # Update FPS counter
             fps_counter.update()
 
+        logging.info(f"Frame rate: {fps_counter.format_stats()}")
+
         # Stop camera threads
         video_stream.video_thread.join()
         video_display.video_thread.join()
@@ -352,6 +379,9 @@ def main(src=0):
             video_stream.stop()
         if video_display:
             video_display.stop()
+        telemetry.close()
+        logging.info(f"Saved data at: {data_file}")
+        logging.info(f"Stage latency: {profiler.format_stats()}")
         cv2.destroyAllWindows()
 
 
@@ -3,24 +3,56 @@ import cv2.aruco as aruco
 import time
 import numpy as np
 import math
+from collections import namedtuple
+
+from ..Camera.frame import Frame, gray_image
 
 # Constants
 ARUCO_DICT_TYPE = cv2.aruco.DICT_6X6_250
+# cornerSubPix stopping criteria for corners detected on a downscaled image
+REFINE_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+
+# Result of estimate_poses, one row per marker
+MarkerPoses = namedtuple("MarkerPoses", ["transforms", "rvecs", "tvecs", "distances", "pan_errors", "tilt_errors"])
 
-def find_marker(frame, aruco_dict, parameters):
+def find_marker(frame, aruco_dict=None, parameters=None, detector=None, scale=None, refine=True):
     """
     Detects ArUco markers in a given frame.
 
+    Pass a detector from `detector_registry.get_detector` to avoid building a new detector on every
+    call. The (aruco_dict, parameters) form is kept for older scripts and builds the detector each time.
+
+    With `scale` the markers are detected on the gray image downscaled by that factor (a Frame's
+    low-resolution camera stream when it has one, see Frame.set_scaled) and the corners are mapped back
+    and refined with cornerSubPix on the full-resolution gray image. The detection cost drops roughly
+    with the pixel ratio; markers must stay large enough to be found at the lower resolution.
+    benchmark_downscale reports the speed and pose accuracy of each scale on recorded footage.
+
     Parameters:
-        frame (numpy.ndarray): The input frame (grayscale or color image) in which to detect ArUco markers.
-        aruco_dict (cv2.aruco.Dictionary): The ArUco dictionary to use for marker detection.
-        parameters (cv2.aruco.DetectorParameters): Detection parameters for the ArUco detector.
+        frame (numpy.ndarray or Frame): The input frame (grayscale or color image) in which to detect ArUco
+            markers. For a Frame its shared gray view is used.
+        aruco_dict (cv2.aruco.Dictionary, optional): The ArUco dictionary to use for marker detection.
+        parameters (cv2.aruco.DetectorParameters, optional): Detection parameters for the ArUco detector.
+        detector (cv2.aruco.ArucoDetector, optional): A prebuilt detector, used instead of aruco_dict/parameters.
+        scale (float, optional): Detect at this fraction of the resolution, e.g. 0.5 or 0.25.
+        refine (bool): With scale, refine the corners on the full-resolution image (otherwise they are
+            only scaled back).
 
     Returns:
         list: A list of tuples, where each tuple contains the detected marker's corners and its ID.
               Example: [((corner1, corner2, corner3, corner4), id), ...]
     """
-    detector = aruco.ArucoDetector(aruco_dict, parameters)
+    if detector is None:
+        if aruco_dict is None:
+            raise ValueError("find_marker needs either a detector or an aruco_dict.")
+        if parameters is None:
+            parameters = aruco.DetectorParameters()
+        detector = aruco.ArucoDetector(aruco_dict, parameters)
+    if scale is not None and scale != 1:
+        marker_arr = upscale_markers(find_marker(downscaled_gray(frame, scale), detector=detector), scale)
+        return refine_markers(gray_image(frame), marker_arr, scale) if refine else marker_arr
+    if isinstance(frame, Frame):
+        frame = frame.gray
     markers, ids, _ = detector.detectMarkers(frame)
 
     marker_arr = []
@@ -30,6 +62,64 @@ def find_marker(frame, aruco_dict, parameters):
 
     return marker_arr
 
+def downscaled_gray(frame, scale):
+    """
+    Gray image downscaled by a factor (INTER_AREA), the software equivalent of a low-resolution camera stream.
+
+    Parameters:
+        frame (numpy.ndarray or Frame): The frame. A Frame returns its (memoized) scaled gray view, which
+            is the camera's low-resolution stream when the source provided one.
+        scale (float): Scale factor, e.g. 0.5.
+
+    Returns:
+        numpy.ndarray: The downscaled gray image.
+    """
+    if isinstance(frame, Frame):
+        return frame.scaled(scale, gray=True)
+    gray = gray_image(frame)
+    height, width = gray.shape[:2]
+    size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+    return cv2.resize(gray, size, interpolation=cv2.INTER_AREA)
+
+def upscale_markers(marker_array, scale, offset=(0, 0)):
+    """
+    Map marker corners found on a downscaled image back to full-resolution pixel coordinates.
+
+    Parameters:
+        marker_array (list): (corners, id) tuples from find_marker on the downscaled image.
+        scale (float): Scale factor of the downscaled image.
+        offset (tuple): Position (x, y) in the downscaled image of the crop the markers were found in.
+
+    Returns:
+        list: (corners, id) tuples in full-resolution coordinates.
+    """
+    offset = np.asarray(offset, dtype=np.float32)
+    # Pixel centers: pixel i of the downscaled image covers full-resolution pixels i/scale to (i+1)/scale
+    return [(((marker + offset + 0.5) / scale - 0.5).astype(np.float32), marker_id)
+            for marker, marker_id in marker_array]
+
+def refine_markers(gray, marker_array, scale):
+    """
+    Refine upscaled marker corners on the full-resolution gray image with cornerSubPix.
+
+    Only a small window around every corner is read, sized to the error left by the downscale.
+
+    Parameters:
+        gray (numpy.ndarray): Full-resolution grayscale image.
+        marker_array (list): (corners, id) tuples in full-resolution coordinates.
+        scale (float): Scale factor the corners were detected at.
+
+    Returns:
+        list: (corners, id) tuples with the refined corners.
+    """
+    if not marker_array:
+        return marker_array
+    corners = np.concatenate([marker.reshape(-1, 2) for marker, _ in marker_array]).astype(np.float32)
+    half = max(2, int(math.ceil(1.5 / scale)))
+    cv2.cornerSubPix(gray, corners.reshape(-1, 1, 2), (half, half), (-1, -1), REFINE_CRITERIA)
+    return [(corners[4 * i:4 * i + 4].reshape(1, 4, 2), marker_id)
+            for i, (_, marker_id) in enumerate(marker_array)]
+
 def get_corner_and_center(marker):
     """
     Calculates the corner coordinates and center point of an ArUco marker.
@@ -55,6 +145,99 @@ def get_corner_and_center(marker):
 
     return [top_left, top_right, bottom_right, bottom_left, center]
 
+def marker_object_points(marker_length):
+    """
+    Corner coordinates of a square marker in its own frame, in the order SOLVEPNP_IPPE_SQUARE expects
+    (top-left, top-right, bottom-right, bottom-left, matching the detector's corner order).
+
+    Parameters:
+        marker_length (float): The physical length of the marker in meters.
+
+    Returns:
+        numpy.ndarray: (4, 3) object points.
+    """
+    half = marker_length / 2.0
+    return np.array([[-half, half, 0.0],
+                     [half, half, 0.0],
+                     [half, -half, 0.0],
+                     [-half, -half, 0.0]], dtype=np.float64)
+
+def rodrigues_batch(rvecs):
+    """
+    Converts a stack of rotation vectors to rotation matrices (vectorized cv2.Rodrigues).
+
+    Parameters:
+        rvecs (numpy.ndarray): (N, 3) rotation vectors.
+
+    Returns:
+        numpy.ndarray: (N, 3, 3) rotation matrices.
+    """
+    rvecs = np.asarray(rvecs, dtype=np.float64).reshape(-1, 3)
+    theta = np.linalg.norm(rvecs, axis=1)
+    # Rotation axes; the axis of a zero rotation does not matter
+    axes = rvecs / np.where(theta > 1e-12, theta, 1.0)[:, None]
+    kx, ky, kz = axes[:, 0], axes[:, 1], axes[:, 2]
+    zero = np.zeros_like(kx)
+    K = np.stack([zero, -kz, ky,
+                  kz, zero, -kx,
+                  -ky, kx, zero], axis=1).reshape(-1, 3, 3)
+    sin = np.sin(theta)[:, None, None]
+    cos = np.cos(theta)[:, None, None]
+    return np.eye(3) + sin * K + (1 - cos) * (K @ K)
+
+def estimate_poses(corners, camera_matrix, distortion_coeff, marker_length=0.1, target_point=None):
+    """
+    Estimates the pose of every detected marker at once.
+
+    Each marker is solved with cv2.solvePnP using SOLVEPNP_IPPE_SQUARE, the rest (rotation matrices,
+    transforms, distances and error angles) is computed for all markers together with numpy.
+
+    Parameters:
+        corners (sequence of numpy.ndarray): Marker corners as returned by the detector, (1, 4, 2) each,
+            or a single (N, 4, 2) array.
+        camera_matrix (numpy.ndarray): Camera intrinsic matrix.
+        distortion_coeff (numpy.ndarray): Camera distortion coefficients.
+        marker_length (float): The physical length of the markers in meters (default is 0.1).
+        target_point (numpy.ndarray, optional): Homogeneous point (4,) in the marker frame to compute the
+            pan/tilt errors for, instead of the marker center.
+
+    Returns:
+        MarkerPoses: Arrays with one row per marker:
+            - transforms (numpy.ndarray): (N, 4, 4) marker to camera transformation matrices.
+            - rvecs (numpy.ndarray): (N, 3) rotation vectors.
+            - tvecs (numpy.ndarray): (N, 3) translation vectors in meters.
+            - distances (numpy.ndarray): (N,) distances to the markers in centimeters.
+            - pan_errors (numpy.ndarray): (N,) horizontal angles to the markers in degrees.
+            - tilt_errors (numpy.ndarray): (N,) vertical angles to the markers in degrees.
+    """
+    image_points = np.asarray(corners, dtype=np.float64).reshape(-1, 4, 2)
+    count = len(image_points)
+    object_points = marker_object_points(marker_length)
+
+    rvecs = np.zeros((count, 3))
+    tvecs = np.zeros((count, 3))
+    for i in range(count):
+        _, rvec, tvec = cv2.solvePnP(object_points, image_points[i], camera_matrix, distortion_coeff,
+                                     flags=cv2.SOLVEPNP_IPPE_SQUARE)
+        rvecs[i] = rvec.ravel()
+        tvecs[i] = tvec.ravel()
+
+    transforms = np.zeros((count, 4, 4))
+    transforms[:, :3, :3] = rodrigues_batch(rvecs)
+    transforms[:, :3, 3] = tvecs
+    transforms[:, 3, 3] = 1.0
+
+    distances = np.linalg.norm(tvecs, axis=1) * 100
+
+    if target_point is None:
+        points = tvecs
+    else:
+        points = (transforms @ np.asarray(target_point, dtype=np.float64).reshape(4))[:, :3]
+    pan_errors = np.degrees(np.arctan2(points[:, 0], points[:, 2]))
+    tilt_errors = np.degrees(np.arctan2(points[:, 1], points[:, 2]))
+
+    return MarkerPoses(transforms, rvecs, tvecs, distances, pan_errors, tilt_errors)
+
 def estimatePoseAndTransformation(marker, camera_matrix, distortion_coeff, marker_length=0.1):
     """
     Estimates the pose of an ArUco marker and returns the transformation matrix along with its distance,
@@ -73,16 +256,10 @@ def estimatePoseAndTransformation(marker, camera_matrix, distortion_coeff, marke
             - rvec (numpy.ndarray): Rotation vector.
             - tvec (numpy.ndarray): Translation vector.
     """
-    # Estimate pose of the marker and get the transformation matrix
-    rvec, tvec, _ = cv2.aruco.estimatePoseSingleMarkers(marker, marker_length, camera_matrix, distortion_coeff)
-    R, _ = cv2.Rodrigues(rvec)
-    # print(f"This is the marker length{marker_length}")
-    transformation_matrix = np.hstack((R, tvec[0].T))
-    transformation_matrix = np.vstack((transformation_matrix, np.array([0, 0, 0, 1])))
-
-    # Calculate the norm distance of the marker in centimeters
-    distance = np.linalg.norm(tvec) * 100
-    return transformation_matrix, distance, rvec, tvec
+    poses = estimate_poses([marker], camera_matrix, distortion_coeff, marker_length)
+    rvec = poses.rvecs.reshape(1, 1, 3)
+    tvec = poses.tvecs.reshape(1, 1, 3)
+    return poses.transforms[0], poses.distances[0], rvec, tvec
 
 def track_and_render_marker(frame, marker, marker_id, camera_matrix, distortion_coefficient, marker_length):
     """
@@ -110,6 +287,25 @@ def track_and_render_marker(frame, marker, marker_id, camera_matrix, distortion_
     cv2.drawFrameAxes(frame, camera_matrix, distortion_coefficient, rvec, tvec, marker_length)
     return transformation_matrix
 
+def render_markers(frame, marker_array, poses, camera_matrix, distortion_coefficient, marker_length):
+    """
+    Renders the square frame, ID, distance and axes of every marker, using poses from estimate_poses.
+
+    Parameters:
+        frame (numpy.ndarray): The frame to draw on.
+        marker_array (list): (corners, id) tuples as returned by find_marker.
+        poses (MarkerPoses): The poses of the markers, in the same order as marker_array.
+        camera_matrix (numpy.ndarray): The camera's intrinsic matrix.
+        distortion_coefficient (numpy.ndarray): The camera's distortion coefficients.
+        marker_length (float): The physical length of the markers in meters.
+    """
+    for (marker, marker_id), rvec, tvec, distance in zip(marker_array, poses.rvecs, poses.tvecs, poses.distances):
+        marker_coordinates = get_corner_and_center(marker)
+        draw_square_frame(frame, marker_coordinates)
+        draw_id(frame, marker_coordinates, marker_id)
+        display_distance_marker(frame, marker_id, distance)
+        cv2.drawFrameAxes(frame, camera_matrix, distortion_coefficient, rvec, tvec, marker_length)
+
 
 
 def draw_square_frame(frame, coordinates):
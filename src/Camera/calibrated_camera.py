@@ -0,0 +1,168 @@
+"""
+calibrated_camera.py
+
+Camera calibration data for a fixed frame size: loads the camera matrix and distortion coefficients
+produced by calibration.py, computes the optimal new camera matrix and ROI, and undistorts frames with
+precomputed remap maps, or only a few points (e.g. marker corners) detected on the raw frame. Kept free of Picamera2/Flask so it can be used on any machine.
+
+Dependencies: os, pickle, logging, threading, dataclasses, cv2, numpy
+"""
+
+import os
+import pickle
+import logging
+import threading
+from dataclasses import dataclass
+
+import cv2
+import numpy as np
+
+
+@dataclass
+class CalibratedCamera:
+    cam_mat_path: str
+    cam_dist_path: str
+    frame_height: int
+    frame_width: int
+
+    def __post_init__(self):
+        """Load calibration parameters, calibrate the camera and prepare the undistortion maps."""
+        self.load_calibration_parameters()
+        self.calibrate_camera()
+        self.init_undistort_maps()
+
+    def load_calibration_parameters(self):
+        """
+        Load the camera matrix and distortion coefficients from disk.
+        The file paths are constructed relative to the current working directory.
+        """
+        camera_matrix_path = os.path.join(os.getcwd(), self.cam_mat_path)
+        camera_distortion_path = os.path.join(os.getcwd(), self.cam_dist_path)
+        self.calibration_dir = os.path.dirname(camera_matrix_path)
+
+        try:
+            with open(camera_matrix_path, "rb") as file:
+                self.camera_matrix = pickle.load(file)
+            with open(camera_distortion_path, "rb") as file:
+                self.camera_dist = pickle.load(file)
+        except Exception as e:
+            # print(f"Error Loading Camera Calibration: {e}")
+            logging.error(f"Error Loading Camera Calibration: {e}")
+
+    def calibrate_camera(self):
+        """
+        Compute an optimal new camera matrix and region of interest for undistortion.
+        Uses the stored camera matrix and distortion coefficients.
+        """
+        self.new_cam_mtx, self.roi = cv2.getOptimalNewCameraMatrix(
+            self.camera_matrix, self.camera_dist,
+            (self.frame_width, self.frame_height), 1,
+            (self.frame_width, self.frame_height)
+        )
+        x, y, w, h = self.roi
+        if w == 0 or h == 0:
+            # Degenerate ROI, keep the full frame
+            self.roi = (0, 0, self.frame_width, self.frame_height)
+            x, y = 0, 0
+
+        # Intrinsics of the cropped, undistorted image (principal point shifted to the ROI origin)
+        self.roi_cam_mtx = np.array(self.new_cam_mtx, dtype=np.float64)
+        self.roi_cam_mtx[0, 2] -= x
+        self.roi_cam_mtx[1, 2] -= y
+        # Undistorted frames and points have no distortion left; pair this with roi_cam_mtx
+        self.undistorted_dist = np.zeros(5)
+
+    def undistort_maps_path(self):
+        """Path of the cached undistortion maps, stored next to the calibration pickles."""
+        return os.path.join(
+            self.calibration_dir,
+            f"undistortMaps_{self.frame_width}x{self.frame_height}.pkl"
+        )
+
+    def init_undistort_maps(self):
+        """
+        Build the fixed-point undistortion maps used by undistort_frame.
+
+        The maps are created once with cv2.initUndistortRectifyMap and sized directly to the
+        region of interest, so the remapped image is already cropped. They are saved next to
+        the calibration pickles and loaded on the next start if the calibration still matches.
+        """
+        _, _, w, h = self.roi
+        maps_path = self.undistort_maps_path()
+
+        self.map1, self.map2 = None, None
+        if os.path.exists(maps_path):
+            try:
+                with open(maps_path, "rb") as file:
+                    cached = pickle.load(file)
+                if (tuple(cached["roi"]) == tuple(self.roi)
+                        and np.array_equal(cached["camera_matrix"], self.camera_matrix)
+                        and np.array_equal(cached["camera_dist"], self.camera_dist)):
+                    self.map1, self.map2 = cached["map1"], cached["map2"]
+                else:
+                    logging.info(f"Undistortion maps at {maps_path} are stale, rebuilding.")
+            except Exception as e:
+                logging.error(f"Error Loading Undistortion Maps: {e}")
+
+        if self.map1 is None:
+            self.map1, self.map2 = cv2.initUndistortRectifyMap(
+                self.camera_matrix, self.camera_dist, None,
+                self.roi_cam_mtx, (w, h), cv2.CV_16SC2
+            )
+            try:
+                with open(maps_path, "wb") as file:
+                    pickle.dump({
+                        "roi": tuple(self.roi),
+                        "camera_matrix": self.camera_matrix,
+                        "camera_dist": self.camera_dist,
+                        "map1": self.map1,
+                        "map2": self.map2,
+                    }, file)
+                logging.info(f"Saved undistortion maps at: {maps_path}")
+            except Exception as e:
+                logging.error(f"Error Saving Undistortion Maps: {e}")
+
+        # Output buffers are reused across frames, one set per calling thread
+        self._buffers = threading.local()
+
+    def undistort_frame(self, frame, dst=None):
+        """
+        Undistort the provided frame using the precomputed undistortion maps.
+
+        The result is written into a buffer that is reused on the next call from the same
+        thread, so copy it if it has to outlive the next frame.
+
+        Args:
+            frame (numpy.ndarray): The distorted input image.
+            dst (numpy.ndarray, optional): Output buffer of the ROI size to write into.
+
+        Returns:
+            numpy.ndarray: The undistorted and cropped image.
+        """
+        if dst is None:
+            _, _, w, h = self.roi
+            shape = (h, w) + frame.shape[2:]
+            dst = getattr(self._buffers, "frame", None)
+            if dst is None or dst.shape != shape or dst.dtype != frame.dtype:
+                dst = np.empty(shape, dtype=frame.dtype)
+                self._buffers.frame = dst
+        return cv2.remap(frame, self.map1, self.map2, cv2.INTER_LINEAR, dst=dst)
+
+    def undistort_points(self, points):
+        """
+        Undistort pixel coordinates found on the raw (distorted) frame, without remapping the image.
+
+        The points are mapped into the coordinates of the cropped image returned by undistort_frame,
+        so they go with roi_cam_mtx and undistorted_dist for pose estimation and can be drawn on that image.
+
+        Args:
+            points (numpy.ndarray): Pixel coordinates in any shape ending in 2, e.g. (N, 1, 4, 2) marker corners.
+
+        Returns:
+            numpy.ndarray: The undistorted points (float32) in the same shape.
+        """
+        points = np.asarray(points, dtype=np.float32)
+        undistorted = cv2.undistortPoints(
+            points.reshape(-1, 1, 2), self.camera_matrix, self.camera_dist, P=self.roi_cam_mtx
+        )
+        return undistorted.reshape(points.shape)
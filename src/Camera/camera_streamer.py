@@ -15,6 +15,7 @@ from dataclasses import dataclass
 import logging
 from picamera2.devices.imx500 import IMX500
 from .utils import define_camera_settings, load_camera_calibration
+from .calibrated_camera import CalibratedCamera
 
 
 # Should return the camera folder
@@ -22,48 +23,6 @@ base_path = os.path.dirname(os.path.abspath(__file__))
 
 
 
-@dataclass
-class CalibratedCamera:
-    cam_mat_path: str
-    cam_dist_path: str
-    frame_height: int
-    frame_width: int
-    
-    def __post_init__(self):
-        self.load_calibration_parameters()
-        self.calibrate_camera()
-    
-    def load_calibration_parameters(self):
-        camera_matrix_path = os.path.join(os.getcwd(), self.cam_mat_path)
-        camera_distortion_path = os.path.join(os.getcwd(), self.cam_dist_path)
-        
-        try: 
-            with open(camera_matrix_path, "rb") as file:
-                self.camera_matrix = pickle.load(file)
-            with open(camera_distortion_path, "rb") as file:
-                self.camera_dist = pickle.load(file)
-        except Exception as e:
-            print(f"Error Loading Camera Calibration : {e}")
-            logging.error(f"Error Loading Camera Calibration : {e}")
-            
-    def calibrate_camera(self):
-        # Use self.frame_height instead of self.height
-        self.new_cam_mtx, self.roi = cv2.getOptimalNewCameraMatrix(
-            self.camera_matrix, self.camera_dist, (self.frame_width, self.frame_height), 1, (self.frame_width, self.frame_height)
-        )
-    
-    def undistort_frame(self, frame):
-        """Undistort a frame"""
-        undistorted_frame = cv2.undistort(
-            frame, self.camera_matrix, self.camera_dist, None, self.new_cam_mtx
-        )
-        x, y, w, h = self.roi
-        return undistorted_frame[y: y + h, x: x + w]
-
-
-
-
-
 class PiVideo:
     def __init__(self, calibrated_camera: CalibratedCamera, framerate=60, format="XBGR8888",brightness=0.0, contrast=0.8, saturation=1.3):
          
@@ -71,7 +30,9 @@ class PiVideo:
         self.height = calibrated_camera.frame_height
         self.framerate = framerate
         self.calibrated_camera = calibrated_camera
-        self.camera_matrix = self.calibrated_camera.new_cam_mtx
+        # Intrinsics of the undistorted, cropped frames from undistort_frame (no distortion left)
+        self.camera_matrix = self.calibrated_camera.roi_cam_mtx
+        self.camera_dist = self.calibrated_camera.undistorted_dist
 
          
          # Threading lock 
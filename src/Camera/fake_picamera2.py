@@ -0,0 +1,241 @@
+"""
+fake_picamera2.py
+
+Stand-in for Picamera2 that produces YUV420 buffers of a synthetic scene, to run and benchmark PiVideo
+without a camera.
+
+FakePicamera2 implements the part of the Picamera2 API that PiVideo uses: create_video_configuration,
+configure, camera_configuration, start, stop, capture_buffers and helpers.make_array, with a `main` and an
+optional `lores` stream. capture_buffers returns a fresh flat I420 buffer per stream and the
+SensorTimestamp metadata, like the real camera. Like the real camera, the rows of every plane are padded
+to a stride (the width rounded up to STRIDE_ALIGN), so consumers have to crop the planes to the configured
+size. The scene is a marker moving over a light gray background, rendered and converted to I420 once up
+front, so the fake itself costs one buffer copy per frame.
+
+The benchmark runs the marker detection on PiVideo frames with the eager BGR conversion in the capture
+thread, with the luma path (lazy_color=True), where detection reads the Y plane and BGR is only
+converted for a viewer, and with the luma path plus a lores stream that the detection runs on.
+
+Usage:
+    stream = PiVideo(calibrated_camera, lazy_color=True, picam2=FakePicamera2()).start()
+
+    python -m src.Camera.fake_picamera2 --frames 600 --size 1080 1080
+
+Dependencies: argparse, threading, time, cv2, numpy
+"""
+
+import argparse
+import threading
+from time import monotonic, monotonic_ns, perf_counter_ns, sleep
+
+import cv2
+import numpy as np
+
+from ..ArUcoMarker.detector_registry import get_detector
+from ..ArUcoMarker.utils import find_marker
+from ..stage_profiler import StageProfiler
+from .calibrated_camera import CalibratedCamera
+from .frame import Frame
+from .pi_camera_streamer import PiVideo
+from .synthetic_scene import synthetic_frame, moving_frames
+
+# Row alignment of the YUV420 planes in bytes (the Y stride is a multiple of it)
+STRIDE_ALIGN = 64
+
+
+def padded_i420(bgr, stride):
+    """
+    Flat YUV420 buffer of a BGR image with the rows padded to a stride, laid out like a Picamera2 buffer.
+
+    Parameters:
+    - bgr (numpy.ndarray): The image, with an even width and height.
+    - stride (int): Bytes per row of the Y plane (the chroma planes use stride // 2).
+
+    Returns:
+    - numpy.ndarray: Flat uint8 buffer of height * 3 // 2 * stride bytes.
+    """
+    height, width = bgr.shape[:2]
+    i420 = cv2.cvtColor(bgr, cv2.COLOR_BGR2YUV_I420)
+    buffer = np.zeros(height * 3 // 2 * stride, np.uint8)
+    buffer[:height * stride].reshape(height, stride)[:, :width] = i420[:height]
+    chroma = buffer[height * stride:].reshape(2, height // 2, stride // 2)
+    chroma[:, :, :width // 2] = i420[height:].reshape(2, height // 2, width // 2)
+    return buffer
+
+
+class _Helpers:
+    """The Picamera2 `helpers` used by PiVideo."""
+
+    @staticmethod
+    def make_array(buffer, config):
+        """Reshape a flat YUV420 buffer to (height * 3 // 2, stride), as Picamera2 does."""
+        _, height = config["size"]
+        return buffer.reshape(height * 3 // 2, config["stride"])
+
+
+class FakePicamera2:
+    def __init__(self, camera_num=0, framerate=None, n_frames=120, marker_id=5):
+        """
+        Parameters:
+        - camera_num (int): Ignored, for the Picamera2 signature.
+        - framerate (float, optional): Frames per second delivered by capture_buffers. Unpaced by default.
+        - n_frames (int): Length of the scene loop in frames.
+        - marker_id (int): ID of the DICT_5X5_1000 marker in the scene.
+        """
+        self.framerate = framerate
+        self.n_frames = n_frames
+        self.marker_id = marker_id
+        self.helpers = _Helpers()
+        self.config = None
+        self.frames = None  # Per stream, the scene loop as flat I420 buffers
+        self.started = False
+        self.captured = 0
+        self.lock = threading.Lock()
+        self._next_time = None
+
+    def create_video_configuration(self, main=None, lores=None, controls=None, buffer_count=4):
+        """Build a configuration dict like Picamera2's (only the fields PiVideo reads)."""
+        main = dict(main or {})
+        main.setdefault("size", (1280, 720))
+        main.setdefault("format", "YUV420")
+        config = {"main": main, "controls": dict(controls or {}), "buffer_count": buffer_count}
+        if lores is not None:
+            config["lores"] = dict(lores)
+        return config
+
+    def configure(self, config):
+        """Apply a configuration, set the stride of every stream and render the scene at its size."""
+        streams = [name for name in ("main", "lores") if config.get(name) is not None]
+        for name in streams:
+            stream = config[name]
+            if stream.get("format", "YUV420") != "YUV420":
+                raise ValueError(f"FakePicamera2 only produces YUV420, not {stream['format']}.")
+            if stream["size"][0] % 2 or stream["size"][1] % 2:
+                raise ValueError("YUV420 needs an even frame size.")
+            stream["stride"] = -(-stream["size"][0] // STRIDE_ALIGN) * STRIDE_ALIGN
+        self.config = config
+        width, height = config["main"]["size"]
+        marker_size = min(width, height) // 4
+        scene = synthetic_frame("DICT_5X5_1000", width, height, marker_id=self.marker_id, marker_size=marker_size)
+        frames = moving_frames(scene, self.n_frames)
+        # Per stream, the scene loop; the lores stream is the main one downscaled, like the ISP output
+        self.frames = {
+            name: [padded_i420(cv2.resize(frame, tuple(config[name]["size"]), interpolation=cv2.INTER_AREA),
+                               config[name]["stride"]) for frame in frames]
+            for name in streams
+        }
+
+    def camera_configuration(self):
+        return self.config
+
+    def start(self):
+        if self.config is None:
+            raise RuntimeError("FakePicamera2 must be configured before start().")
+        self.started = True
+        self._next_time = monotonic()
+
+    def stop(self):
+        self.started = False
+
+    def capture_buffers(self, names=("main",)):
+        """
+        Capture the next frame of the scene.
+
+        Parameters:
+        - names (sequence of str): Streams to capture, "main" and (if configured) "lores".
+
+        Returns:
+        - tuple: (list of flat uint8 buffers, one per name, metadata dict with SensorTimestamp in ns)
+        """
+        if not self.started:
+            raise RuntimeError("Camera is not started.")
+        if self.framerate:
+            # Block until the next frame is due, like the sensor
+            delay = self._next_time - monotonic()
+            if delay > 0:
+                sleep(delay)
+            self._next_time = max(self._next_time + 1 / self.framerate, monotonic() - 1 / self.framerate)
+        with self.lock:
+            index = self.captured % self.n_frames
+            self.captured += 1
+        buffers = []
+        for name in names:
+            if name not in self.frames:
+                raise ValueError(f"FakePicamera2 has no stream {name!r}.")
+            # Picamera2 copies the buffer out of the camera's dmabuf as well
+            buffers.append(self.frames[name][index].copy())
+        return buffers, {"SensorTimestamp": monotonic_ns()}
+
+
+# ========================
+# Benchmark
+# ========================
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the eager BGR capture with the luma path on a fake camera.")
+    parser.add_argument("--frames", type=int, default=600, help="Frames per run")
+    parser.add_argument("--fps", type=float, default=60.0, help="Camera frame rate")
+    parser.add_argument("--size", type=int, nargs=2, default=[1280, 720], metavar=("WIDTH", "HEIGHT"),
+                        help="Frame size (a width that is not a multiple of 64 gets padded rows, e.g. 1080 1080)")
+    parser.add_argument("--lores-scale", type=float, default=0.5, help="Resolution of the lores detection stream")
+    parser.add_argument("--view-every", type=int, default=0,
+                        help="Also take the color image of every N-th frame, like a connected viewer (0: never)")
+    args = parser.parse_args()
+
+    calibrated_camera = CalibratedCamera(
+        cam_mat_path="src/Camera/calibration/pical1280720new/cameraMatrix.pkl",
+        cam_dist_path="src/Camera/calibration/pical1280720new/dist.pkl",
+        frame_width=args.size[0],
+        frame_height=args.size[1]
+    )
+    detector = get_detector(cv2.aruco.DICT_5X5_1000)
+
+    def run(lazy_color, lores_scale=None):
+        profiler = StageProfiler()
+        stream = PiVideo(calibrated_camera, framerate=args.fps, lazy_color=lazy_color, lores_scale=lores_scale,
+                         picam2=FakePicamera2(framerate=args.fps))
+        stream.profiler = profiler
+        stream.clients += 1
+        frames = stream.bus.subscribe()
+        stream.start()
+
+        found = viewed = 0
+        gray_ns = detect_ns = color_ns = 0
+        start = monotonic()
+        while viewed < args.frames:
+            item = frames.wait(timeout=1.0)
+            if item is None:
+                break
+            seq, raw_frame, timestamp = item
+            frame = raw_frame if isinstance(raw_frame, Frame) else Frame(raw_frame, timestamp, seq)
+            begin = perf_counter_ns()
+            frame.gray  # The Y plane on the luma path, a conversion otherwise
+            gray_ns += perf_counter_ns() - begin
+            begin = perf_counter_ns()
+            found += bool(find_marker(frame, detector=detector, scale=lores_scale))
+            detect_ns += perf_counter_ns() - begin
+            if args.view_every and viewed % args.view_every == 0:
+                begin = perf_counter_ns()
+                frame.image  # Converted here on the luma path
+                color_ns += perf_counter_ns() - begin
+            viewed += 1
+        elapsed = monotonic() - start
+        stream.stop()
+
+        stats = profiler.stats()
+        capture_ms = sum(stats[stage]["mean_ms"] for stage in ("capture", "decode") if stage in stats)
+        return (capture_ms, gray_ns / viewed / 1e6, color_ns / viewed / 1e6, detect_ns / viewed / 1e6,
+                viewed / elapsed, found / viewed)
+
+    viewer = f"color image every {args.view_every} frames" if args.view_every else "no viewer"
+    print(f"{args.frames} frames at {args.size[0]}x{args.size[1]}, {args.fps:.0f} fps, {viewer}")
+    results = {"eager BGR": run(False), "luma": run(True), "luma+lores": run(True, args.lores_scale)}
+    print(f"{'':32}" + "".join(f"{name:>12}" for name in results))
+    for i, label in enumerate(("capture thread per frame (ms)", "gray view per frame (ms)",
+                               "color image per frame (ms)", "detection per frame (ms)", "frames per second",
+                               "marker found")):
+        print(f"{label:32}" + "".join(f"{values[i]:12.2f}" for values in results.values()))
+
+
+if __name__ == "__main__":
+    main()
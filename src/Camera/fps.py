@@ -1,26 +1,40 @@
-import datetime
+import threading
+from time import monotonic
+
 import cv2
+import numpy as np
 
 """
 Overview:
-This script provides utilities to measure and display the performance of video processing tasks. 
-It includes a class to calculate frames per second (FPS) and a function to overlay the FPS 
+This script provides utilities to measure and display the performance of video processing tasks.
+It includes a class to calculate frames per second (FPS) and a function to overlay the FPS
 or iterations per second on a video frame.
 
 Key Features:
 1. FPS Measurement:
-   - Tracks the number of frames processed and calculates the elapsed time.
-   - Provides methods to compute the current FPS.
+   - Tracks the number of frames processed and calculates the elapsed time on the monotonic clock.
+   - Average FPS since start() (`fps`) and an exponentially weighted FPS that follows stalls and
+     recoveries within a few frames (`rate`).
+   - Keeps the last frame intervals in a fixed-size ring for min/max/percentile frame times.
+   - Counts dropped frames, from gaps in the frame sequence numbers or from intervals longer than
+     1.5 nominal frame periods.
 
 2. FPS Overlay:
-   - Adds the iterations per second as text on the video frames.
+   - Adds the iterations per second as text in the lower-left corner, placed and scaled relative to
+     the frame size. The text is only rendered again when it changes.
 
 Modules Used:
-- datetime: For measuring the elapsed time during FPS calculations.
+- time: Monotonic clock for the frame timing.
+- threading: Guards the shared overlay cache.
+- NumPy: Frame interval ring and percentiles.
 - OpenCV (cv2): For overlaying text on video frames.
 
 Usage:
 This module can be imported and used as part of a video processing pipeline to track and display performance metrics.
+    fps_counter = FPS(nominal_fps=30).start()
+    fps_counter.update()                  # or fps_counter.update(seq=seq) with frame bus sequence numbers
+    frame = putIterationsPerSec(frame, fps_counter.rate())
+    print(fps_counter.format_stats())
 """
 
 class FPS:
@@ -28,18 +42,34 @@ class FPS:
     A class for measuring frames per second (FPS) in video processing tasks.
 
     Attributes:
-    - _start (datetime): The time when the FPS counter starts.
-    - _end (datetime): The time when the FPS counter stops (currently unused).
+    - _start (float): The monotonic time when the FPS counter starts.
+    - _end (float): The monotonic time when the FPS counter stops (currently unused).
     - _numFrames (int): The number of frames processed since the counter started.
+    - dropped (int): Frames detected as dropped since the counter started.
     """
 
-    def __init__(self):
+    def __init__(self, alpha=0.1, window=1024, nominal_fps=None):
         """
         Initializes the FPS counter with default values.
+
+        Parameters:
+        - alpha (float): Weight of the newest frame interval in the exponentially weighted rate.
+        - window (int): Number of frame intervals kept for the frame time statistics.
+        - nominal_fps (float, optional): Expected frame rate. Without sequence numbers, an interval longer
+          than 1.5 nominal periods counts the missing frames as dropped.
         """
         self._start = None
         self._end = None
         self._numFrames = 0
+        self.alpha = alpha
+        self.nominal_fps = nominal_fps
+
+        self._last = None
+        self._last_seq = None
+        self._ewma_interval = None
+        self._intervals = np.zeros(window)
+        self._numIntervals = 0
+        self.dropped = 0
 
     def start(self):
         """
@@ -48,15 +78,40 @@ class FPS:
         Returns:
         - self: The instance of the class to allow method chaining.
         """
-        self._start = datetime.datetime.now()
+        self._start = monotonic()
+        # The first interval starts at the first frame, frames may carry their own (capture) timestamps
+        self._last = None
         return self
 
-    def update(self):
+    def update(self, timestamp=None, seq=None):
         """
         Increments the frame count by 1. Should be called after processing each frame.
+
+        Parameters:
+        - timestamp (float, optional): Time of the frame on the monotonic clock (e.g. its capture
+          timestamp). Defaults to now.
+        - seq (int, optional): Sequence number of the frame. Gaps count as dropped frames.
         """
+        now = monotonic() if timestamp is None else timestamp
         self._numFrames += 1
 
+        if self._last is not None:
+            interval = now - self._last
+            self._intervals[self._numIntervals % len(self._intervals)] = interval
+            self._numIntervals += 1
+            if self._ewma_interval is None:
+                self._ewma_interval = interval
+            else:
+                self._ewma_interval += self.alpha * (interval - self._ewma_interval)
+            if seq is None and self.nominal_fps and interval > 1.5 / self.nominal_fps:
+                self.dropped += int(round(interval * self.nominal_fps)) - 1
+        self._last = now
+
+        if seq is not None:
+            if self._last_seq is not None and seq > self._last_seq + 1:
+                self.dropped += seq - self._last_seq - 1
+            self._last_seq = seq
+
     def elapsed(self):
         """
         Calculates the total elapsed time since the counter started.
@@ -64,35 +119,97 @@ class FPS:
         Returns:
         - float: Elapsed time in seconds.
         """
-        return (datetime.datetime.now() - self._start).total_seconds()
+        return monotonic() - self._start
 
     def fps(self):
         """
-        Calculates the current frames per second (FPS).
+        Calculates the average frames per second (FPS) since the counter started.
 
         Returns:
-        - float: Current FPS based on the number of frames processed and elapsed time.
+        - float: Average FPS based on the number of frames processed and elapsed time.
         """
         return self._numFrames / self.elapsed()
 
+    def rate(self):
+        """
+        Exponentially weighted frames per second, which follows stalls and recoveries.
+
+        Returns:
+        - float: Current FPS, 0.0 before the first frame interval.
+        """
+        if not self._ewma_interval:
+            return 0.0
+        return 1.0 / self._ewma_interval
+
+    def frame_times(self):
+        """
+        Frame time statistics over the last frame intervals (up to `window`).
 
-def putIterationsPerSec(frame, iterations_per_sec):
+        Returns:
+        - dict: frames, dropped, and the min, max, p50, p95 and p99 frame time in milliseconds.
+        """
+        intervals = self._intervals[:min(self._numIntervals, len(self._intervals))]
+        stats = {"frames": self._numFrames, "dropped": self.dropped}
+        if len(intervals):
+            p50, p95, p99 = np.percentile(intervals, (50, 95, 99)) * 1e3
+            stats.update(min_ms=intervals.min() * 1e3, max_ms=intervals.max() * 1e3,
+                         p50_ms=p50, p95_ms=p95, p99_ms=p99)
+        return stats
+
+    def format_stats(self):
+        """Frame rate and frame time statistics as one log line."""
+        stats = self.frame_times()
+        line = f"Frames: {stats['frames']}, Dropped: {stats['dropped']}, FPS: {self.rate():.1f}"
+        if "p50_ms" in stats:
+            line += (f", Frame time min: {stats['min_ms']:.1f} ms, P50: {stats['p50_ms']:.1f} ms, "
+                     f"P95: {stats['p95_ms']:.1f} ms, P99: {stats['p99_ms']:.1f} ms, Max: {stats['max_ms']:.1f} ms")
+        return line
+
+
+# Last rendered overlay text: its (text, scale, thickness, channels, dtype, color), the text mask and a
+# patch of the text color
+_overlay_cache = {"key": None, "mask": None, "patch": None}
+_overlay_lock = threading.Lock()
+
+
+def putIterationsPerSec(frame, iterations_per_sec, color=(255, 255, 255)):
     """
     Adds the iterations per second text to the lower-left corner of a video frame.
 
+    The position and font size follow the frame size. The text is rendered once into a mask and only
+    rendered again when it changes (e.g. the rounded rate changes); every other frame only gets the
+    masked pixels copied in.
+
     Parameters:
     - frame (numpy.ndarray): The video frame to modify.
     - iterations_per_sec (float): The current iterations per second to display.
+    - color (tuple): Text color.
 
     Returns:
     - frame (numpy.ndarray): The modified video frame with text overlay.
     """
-    cv2.putText(
-        frame,
-        "{:.0f} iterations/sec".format(iterations_per_sec),
-        (10, 450),
-        cv2.FONT_HERSHEY_SIMPLEX,
-        1.0,
-        (255, 255, 255),
-    )
+    height, width = frame.shape[:2]
+    text = "{:.0f} iterations/sec".format(iterations_per_sec)
+    scale = max(0.4, height / 480)
+    thickness = max(1, int(round(scale)))
+    key = (text, scale, thickness, frame.shape[2:], frame.dtype, tuple(color))
+
+    with _overlay_lock:
+        if _overlay_cache["key"] != key:
+            (text_width, text_height), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+            mask = np.zeros((text_height + baseline + thickness, text_width + thickness), np.uint8)
+            cv2.putText(mask, text, (0, text_height), cv2.FONT_HERSHEY_SIMPLEX, scale, 255, thickness)
+            # Repeat the color over every channel of the frame (1, 3 or 4)
+            patch = np.empty(mask.shape + frame.shape[2:], frame.dtype)
+            patch[:] = np.resize(np.asarray(color, dtype=frame.dtype), frame.shape[2:])
+            _overlay_cache.update(key=key, mask=mask, patch=patch)
+        mask, patch = _overlay_cache["mask"], _overlay_cache["patch"]
+
+    # Lower-left corner with a margin of 2% of the frame height, clipped to the frame
+    margin = max(2, int(height * 0.02))
+    y0 = max(0, height - margin - mask.shape[0])
+    h = min(mask.shape[0], height - y0)
+    w = min(mask.shape[1], width - margin)
+    if h > 0 and w > 0:
+        cv2.copyTo(patch[:h, :w], mask[:h, :w], frame[y0:y0 + h, margin:margin + w])
     return frame
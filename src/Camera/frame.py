@@ -0,0 +1,291 @@
+"""
+frame.py
+
+A captured frame together with the views derived from it, each computed at most once.
+
+Face detection, marker detection and the drawing code all want the same few conversions of a frame:
+grayscale, a downscaled copy, the undistorted image. A Frame holds the raw pixels with their capture
+timestamp and sequence number and computes every derived view lazily, the first time it is asked for,
+then hands out the same array to every later caller. Running several detectors on one Frame therefore
+pays for each conversion once.
+
+The views are written into buffers from a FramePool instead of being allocated per frame. The pool keeps
+a small ring of buffers per kind of view, so a view stays intact until the pool has handed out `slots`
+more buffers of the same kind (i.e. `slots` frames later); copy a view that has to live longer. Frames
+without a pool allocate their views.
+
+YuvFrame wraps a planar YUV420 (I420) capture buffer as delivered by Picamera2: its gray view is the Y
+plane itself (a view, no conversion) and the BGR image is only converted when something asks for it.
+
+Views:
+    - image: the raw pixels (BGR, BGRA or grayscale). The views never write to it; draw on it only if
+      the caller owns it and after the views it needs were computed.
+    - gray: grayscale.
+    - half, quarter: the image downscaled by 2 and 4 (INTER_AREA).
+    - undistorted: undistorted and cropped with the CalibratedCamera's maps.
+    - scaled(scale, gray=False): any other downscale, of the image or of the gray view. A source that
+      captures a second, low-resolution stream hands it over with set_scaled, so the view costs nothing.
+
+Usage:
+    pool = FramePool()
+    frame = Frame(pixels, timestamp, seq, calibrated_camera=camera, pool=pool)
+    marker_array = find_marker(frame, detector=detector)   # uses frame.gray
+    frame = detect_faces(frame)                              # same gray view, no second conversion
+
+Dependencies: threading, cv2, numpy
+"""
+
+import threading
+
+import cv2
+import numpy as np
+
+# Color conversion to grayscale per number of channels
+GRAY_CONVERSIONS = {3: cv2.COLOR_BGR2GRAY, 4: cv2.COLOR_BGRA2GRAY}
+
+
+class FramePool:
+    def __init__(self, slots=4):
+        """
+        Parameters:
+        - slots (int): Buffers per kind of view. A view is reused after this many frames.
+        """
+        if slots < 1:
+            raise ValueError("FramePool needs at least 1 slot.")
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.rings = {}  # Per view name: (list of buffers, index of the next one)
+        self.allocations = 0
+
+    def buffer(self, name, shape, dtype=np.uint8):
+        """
+        Get the next buffer for a kind of view, reallocating the ring if the shape or type changed.
+
+        Parameters:
+        - name (str): Kind of view, e.g. "gray".
+        - shape (tuple): Shape of the view.
+        - dtype (numpy.dtype): Pixel data type.
+
+        Returns:
+        - numpy.ndarray: An uninitialized buffer.
+        """
+        shape = tuple(shape)
+        with self.lock:
+            buffers, index = self.rings.get(name, (None, 0))
+            if buffers is None or buffers[0].shape != shape or buffers[0].dtype != dtype:
+                buffers = [np.empty(shape, dtype=dtype) for _ in range(self.slots)]
+                self.allocations += self.slots
+                index = 0
+            self.rings[name] = (buffers, (index + 1) % self.slots)
+            return buffers[index]
+
+    def frame(self, pixels, timestamp=None, seq=None, calibrated_camera=None):
+        """Wrap camera pixels in a Frame whose views come from this pool."""
+        return Frame(pixels, timestamp, seq, calibrated_camera=calibrated_camera, pool=self)
+
+
+class Frame:
+    __slots__ = ("_image", "timestamp", "seq", "calibrated_camera", "pool", "_views", "_lock")
+
+    def __init__(self, image, timestamp=None, seq=None, calibrated_camera=None, pool=None):
+        """
+        Parameters:
+        - image (numpy.ndarray): The raw pixels. The views only read them.
+        - timestamp (float, optional): Capture time in seconds.
+        - seq (int, optional): Sequence number of the frame.
+        - calibrated_camera (CalibratedCamera, optional): Needed for the undistorted view.
+        - pool (FramePool, optional): Where the views are written. Without one they are allocated.
+        """
+        self._image = image
+        self.timestamp = timestamp
+        self.seq = seq
+        self.calibrated_camera = calibrated_camera
+        self.pool = pool
+        self._views = {}
+        self._lock = threading.RLock()  # Views may be computed from other views
+
+    @property
+    def image(self):
+        """The raw pixels."""
+        return self._image
+
+    @property
+    def shape(self):
+        """Shape of the raw image."""
+        return self._image.shape
+
+    def _buffer(self, name, shape, dtype):
+        if self.pool is None:
+            return None
+        return self.pool.buffer(name, shape, dtype)
+
+    def _view(self, name, compute):
+        """Memoized view: computed by `compute()` the first time, from any thread."""
+        view = self._views.get(name)
+        if view is None:
+            with self._lock:
+                view = self._views.get(name)
+                if view is None:
+                    view = self._views[name] = compute()
+        return view
+
+    @property
+    def gray(self):
+        """Grayscale view (the image itself if it already is grayscale)."""
+        return self._view("gray", self._compute_gray)
+
+    def _compute_gray(self):
+        image = self.image
+        if image.ndim == 2:
+            return image
+        conversion = GRAY_CONVERSIONS[image.shape[2]]
+        return cv2.cvtColor(image, conversion, dst=self._buffer("gray", image.shape[:2], image.dtype))
+
+    @property
+    def half(self):
+        """The image downscaled by 2."""
+        return self.scaled(0.5)
+
+    @property
+    def quarter(self):
+        """The image downscaled by 4."""
+        return self.scaled(0.25)
+
+    def scaled(self, scale, gray=False):
+        """
+        Downscaled view (INTER_AREA).
+
+        Parameters:
+        - scale (float): Scale factor, e.g. 0.5.
+        - gray (bool): Downscale the gray view instead of the image.
+
+        Returns:
+        - numpy.ndarray: The downscaled view.
+        """
+        name = f"{'gray' if gray else 'image'}@{scale:g}"
+
+        def compute():
+            source = self.gray if gray else self.image
+            height, width = source.shape[:2]
+            size = (max(1, int(round(width * scale))), max(1, int(round(height * scale))))
+            dst = self._buffer(name, (size[1], size[0]) + source.shape[2:], source.dtype)
+            return cv2.resize(source, size, dst=dst, interpolation=cv2.INTER_AREA)
+
+        return self._view(name, compute)
+
+    def set_scaled(self, scale, view, gray=False):
+        """
+        Provide a downscaled view computed elsewhere, e.g. the camera's low-resolution stream, so that
+        scaled(scale, gray) returns it instead of resizing.
+
+        Parameters:
+        - scale (float): Scale factor of the view.
+        - view (numpy.ndarray): The downscaled pixels.
+        - gray (bool): Whether the view is grayscale.
+        """
+        with self._lock:
+            self._views[f"{'gray' if gray else 'image'}@{scale:g}"] = view
+
+    @property
+    def undistorted(self):
+        """Undistorted and cropped view (needs the calibrated camera)."""
+        return self._view("undistorted", self._compute_undistorted)
+
+    def _compute_undistorted(self):
+        camera = self.calibrated_camera
+        if camera is None:
+            raise ValueError("The undistorted view needs a Frame with a calibrated_camera.")
+        _, _, w, h = camera.roi
+        dst = self._buffer("undistorted", (h, w) + self.image.shape[2:], self.image.dtype)
+        if dst is None:
+            dst = np.empty((h, w) + self.image.shape[2:], self.image.dtype)
+        return camera.undistort_frame(self.image, dst=dst)
+
+
+class YuvFrame(Frame):
+    __slots__ = ("yuv", "size")
+
+    def __init__(self, yuv, timestamp=None, seq=None, calibrated_camera=None, pool=None, size=None):
+        """
+        Parameters:
+        - yuv (numpy.ndarray): Planar YUV420 (I420) buffer of shape (height * 3 // 2, stride): the Y plane,
+          then the quarter-size U and V planes, with rows padded to the stride as from make_array.
+        - timestamp, seq, calibrated_camera, pool: As for Frame.
+        - size (tuple of int, optional): (width, height) of the image, i.e. the stream's configured size.
+          Defaults to an unpadded buffer.
+        """
+        super().__init__(None, timestamp, seq, calibrated_camera=calibrated_camera, pool=pool)
+        self.yuv = yuv
+        if size is None:
+            size = (yuv.shape[1], yuv.shape[0] * 2 // 3)
+        self.size = tuple(size)
+
+    @property
+    def shape(self):
+        """Shape of the BGR image, which is only converted on demand."""
+        width, height = self.size
+        return (height, width, 3)
+
+    @property
+    def image(self):
+        """BGR image, converted from the YUV buffer the first time it is asked for."""
+        return self._view("image", self._compute_image)
+
+    def _compute_image(self):
+        width, height = self.size
+        # Packing only copies when the rows are padded to a stride
+        packed = self._buffer("i420", (height * 3 // 2, width), self.yuv.dtype)
+        i420 = pack_i420(self.yuv, width, height, out=packed)
+        dst = self._buffer("image", self.shape, self.yuv.dtype)
+        return cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420, dst=dst)
+
+    def _compute_gray(self):
+        # The luma plane, without the stride padding, is the grayscale image
+        width, height = self.size
+        return self.yuv[:height, :width]
+
+
+def pack_i420(yuv, width, height, out=None):
+    """
+    Compact I420 buffer of a YUV420 capture whose rows may be padded to a stride.
+
+    Picamera2's make_array returns YUV420 as (height * 3 // 2, stride): the Y plane with `stride` bytes
+    per row, then the U and V planes with `stride // 2` bytes per row, two chroma rows per array row.
+    OpenCV's I420 conversion needs the planes packed at the image width.
+
+    Parameters:
+    - yuv (numpy.ndarray): The capture buffer, of shape (height * 3 // 2, stride) with stride >= width.
+    - width (int): Width of the image.
+    - height (int): Height of the image.
+    - out (numpy.ndarray, optional): Buffer of shape (height * 3 // 2, width) to pack into when padded.
+
+    Returns:
+    - numpy.ndarray: The buffer itself if it is not padded, otherwise `out` (allocated if None).
+    """
+    stride = yuv.shape[1]
+    if stride == width:
+        return yuv[:height * 3 // 2]
+    if out is None:
+        out = np.empty((height * 3 // 2, width), yuv.dtype)
+    out[:height] = yuv[:height, :width]
+    # Each chroma plane is height // 2 rows of stride // 2 bytes, cropped to width // 2
+    chroma = yuv[height:height * 3 // 2].reshape(2, height // 2, stride // 2)
+    out[height:].reshape(2, height // 2, width // 2)[:] = chroma[:, :, :width // 2]
+    return out
+
+
+def gray_image(frame):
+    """
+    Grayscale pixels of a Frame or an image, for the detectors that accept both.
+
+    Parameters:
+    - frame (Frame or numpy.ndarray): The frame.
+
+    Returns:
+    - numpy.ndarray: frame.gray for a Frame (shared, do not modify), otherwise the image converted to gray.
+    """
+    if isinstance(frame, Frame):
+        return frame.gray
+    if frame.ndim == 2:
+        return frame
+    return cv2.cvtColor(frame, GRAY_CONVERSIONS[frame.shape[2]])
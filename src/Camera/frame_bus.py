@@ -0,0 +1,138 @@
+"""
+frame_bus.py
+
+Latest-frame publish/subscribe between a producer thread (camera capture, tracking loop) and its consumers
+(HTTP viewers, display windows, detection loops).
+
+Producers call `publish` for every new frame. Consumers create a `Subscription` and block in `wait`
+on a shared Condition until a frame they have not seen yet is available, instead of polling in a loop.
+Each subscription tracks the last sequence number it was given, so the same frame is never delivered
+twice, and slow subscribers simply skip to the newest frame. A subscription can also be rate capped,
+e.g. to limit an HTTP viewer to 15 fps while the tracking loop runs at the camera rate.
+
+Dependencies: threading, time
+"""
+
+import threading
+from time import monotonic, sleep
+
+
+class FrameBus:
+    def __init__(self):
+        """Create an empty bus."""
+        self.condition = threading.Condition()
+        self.seq = 0
+        self.frame = None
+        self.timestamp = None
+        self.closed = False
+
+    def publish(self, frame, timestamp=None, seq=None):
+        """
+        Publish a new frame and wake up every waiting subscriber.
+
+        Args:
+            frame (numpy.ndarray): The frame. It is handed out as is, without copying.
+            timestamp (float, optional): Capture time (monotonic clock). Defaults to now.
+            seq (int, optional): Sequence number to publish the frame under, e.g. the frame ring
+                sequence number. Must increase; defaults to the previous one plus one.
+
+        Returns:
+            int: The sequence number of the published frame.
+        """
+        with self.condition:
+            self.seq = self.seq + 1 if seq is None else seq
+            self.frame = frame
+            self.timestamp = monotonic() if timestamp is None else timestamp
+            self.condition.notify_all()
+            return self.seq
+
+    def latest(self):
+        """
+        Get the newest frame without waiting.
+
+        Returns:
+            tuple: (seq, frame, timestamp), (0, None, None) if nothing was published yet.
+        """
+        with self.condition:
+            return self.seq, self.frame, self.timestamp
+
+    def close(self):
+        """Close the bus and wake up every waiting subscriber so it can exit."""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+    def subscribe(self, max_rate=None):
+        """
+        Create a new subscription.
+
+        Args:
+            max_rate (float, optional): Maximum number of frames per second delivered to this subscriber.
+
+        Returns:
+            Subscription: The subscription to wait on.
+        """
+        return Subscription(self, max_rate)
+
+
+class Subscription:
+    def __init__(self, bus, max_rate=None):
+        """
+        Args:
+            bus (FrameBus): The bus to listen on.
+            max_rate (float, optional): Maximum delivery rate in frames per second (None for no cap).
+        """
+        self.bus = bus
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.last_seq = 0
+        self.next_time = 0.0
+
+    def wait(self, timeout=None):
+        """
+        Block until a frame newer than the last delivered one is published.
+
+        Args:
+            timeout (float, optional): Maximum time to wait in seconds (None to wait forever).
+
+        Returns:
+            tuple or None: (seq, frame, timestamp), or None on timeout or when the bus is closed.
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+
+        # Respect the rate cap before looking at the bus, so we deliver the newest frame after the pause
+        if self.min_interval:
+            delay = self.next_time - monotonic()
+            if delay > 0:
+                if deadline is not None and monotonic() + delay > deadline:
+                    sleep(max(0.0, deadline - monotonic()))
+                    return None
+                sleep(delay)
+
+        bus = self.bus
+        with bus.condition:
+            remaining = None if deadline is None else max(0.0, deadline - monotonic())
+            ready = bus.condition.wait_for(
+                lambda: bus.seq > self.last_seq or bus.closed, timeout=remaining
+            )
+            if not ready or bus.seq <= self.last_seq:
+                return None
+            self.last_seq = bus.seq
+            item = (bus.seq, bus.frame, bus.timestamp)
+
+        if self.min_interval:
+            self.next_time = monotonic() + self.min_interval
+        return item
+
+    def poll(self):
+        """
+        Get the newest frame if it has not been delivered yet, without blocking or rate capping.
+
+        Returns:
+            tuple or None: (seq, frame, timestamp), or None if there is nothing new.
+        """
+        bus = self.bus
+        with bus.condition:
+            if bus.seq <= self.last_seq:
+                return None
+            self.last_seq = bus.seq
+            return bus.seq, bus.frame, bus.timestamp
@@ -0,0 +1,101 @@
+"""
+frame_ring.py
+
+A preallocated ring of raw frame buffers shared between one capture thread and any number of readers.
+
+The capture thread writes straight into the next slot and commits it with a sequence number. Readers get a
+view of the slot (no copy) together with its sequence number and capture timestamp. A slot is only reused
+after the writer has gone all the way around the ring, so a reader that is at most (slots - 1) frames
+behind can keep using its view; `is_valid` tells it whether the slot has been reused in the meantime.
+
+Dependencies: threading, numpy
+"""
+
+import threading
+
+import numpy as np
+
+
+class FrameRing:
+    def __init__(self, shape, dtype=np.uint8, slots=4):
+        """
+        Allocate the ring buffers.
+
+        Args:
+            shape (tuple): Shape of a single frame, e.g. (height, width, 3).
+            dtype (numpy.dtype): Pixel data type.
+            slots (int): Number of frames kept in the ring (at least 2).
+        """
+        if slots < 2:
+            raise ValueError("FrameRing needs at least 2 slots.")
+        self.size = slots
+        self.shape = tuple(shape)
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(slots)]
+        self.timestamps = [0.0] * slots
+
+        self.lock = threading.Lock()
+        # Sequence number of the newest committed frame (0 while the ring is empty)
+        self.seq = 0
+        # Sequence number of the frame currently being written
+        self._writing = 0
+
+    def begin_write(self):
+        """
+        Reserve the next slot for the capture thread.
+
+        Returns:
+            numpy.ndarray: The buffer to write the new frame into.
+        """
+        with self.lock:
+            self._writing = self.seq + 1
+            return self.buffers[self._writing % self.size]
+
+    def commit(self, timestamp):
+        """
+        Publish the slot reserved by begin_write.
+
+        Args:
+            timestamp (float): Capture time of the frame (seconds, monotonic clock).
+
+        Returns:
+            int: The sequence number of the committed frame.
+        """
+        with self.lock:
+            index = self._writing % self.size
+            self.timestamps[index] = timestamp
+            self.seq = self._writing
+            return self.seq
+
+    def latest(self):
+        """
+        Get the newest committed frame without copying it.
+
+        Returns:
+            tuple: (seq, frame, timestamp), or (0, None, None) if nothing was captured yet.
+        """
+        with self.lock:
+            if self.seq == 0:
+                return 0, None, None
+            index = self.seq % self.size
+            return self.seq, self.buffers[index], self.timestamps[index]
+
+    def get(self, seq):
+        """
+        Get a specific frame by sequence number without copying it.
+
+        Returns:
+            tuple: (frame, timestamp), or (None, None) if the frame is not in the ring anymore.
+        """
+        with self.lock:
+            if not self._is_valid(seq):
+                return None, None
+            index = seq % self.size
+            return self.buffers[index], self.timestamps[index]
+
+    def is_valid(self, seq):
+        """Check that the slot holding `seq` has not been reused by the writer."""
+        with self.lock:
+            return self._is_valid(seq)
+
+    def _is_valid(self, seq):
+        return 0 < seq <= self.seq and seq > self._writing - self.size
@@ -0,0 +1,67 @@
+"""
+frame_source.py
+
+Common interface for everything that produces frames: the Pi camera (PiVideo), USB webcams
+(WebcamVideoStreamThreaded) and recorded footage (ReplaySource).
+
+A source captures on its own thread once started and publishes every frame on its `bus` (a FrameBus)
+together with the frame's capture timestamp. Tracking loops only talk to this interface, so the same
+loop can run on the Pi, on a laptop webcam, or on recorded field footage for profiling.
+
+Every source exposes:
+    - width, height (int): Frame size in pixels.
+    - framerate (float): Nominal frame rate.
+    - stopped (bool): True once the source has stopped producing frames.
+    - bus (FrameBus): Where new frames are published.
+    - profiler (StageProfiler or None): Receives the capture and decode time of every frame when set.
+
+Dependencies: abc
+"""
+
+from abc import ABC, abstractmethod
+
+
+class FrameSource(ABC):
+    profiler = None
+
+    @abstractmethod
+    def start(self):
+        """
+        Start producing frames.
+
+        Returns:
+            FrameSource: The source itself, to allow method chaining.
+        """
+
+    @abstractmethod
+    def stop(self):
+        """Stop producing frames and wake up every consumer waiting on the bus."""
+
+    def read(self):
+        """
+        Get the newest frame without waiting.
+
+        Returns:
+            tuple: (seq, frame, timestamp), or (0, None, None) if no frame was produced yet.
+        """
+        return self.bus.latest()
+
+    def frames(self, timeout=1.0, max_rate=None):
+        """
+        Iterate over new frames until the source stops.
+
+        Each frame is yielded at most once; if the consumer is slower than the source, it skips to
+        the newest frame.
+
+        Args:
+            timeout (float): How long to wait for a frame before checking again whether the source stopped.
+            max_rate (float, optional): Maximum number of frames per second to yield.
+
+        Yields:
+            tuple: (seq, frame, timestamp)
+        """
+        subscription = self.bus.subscribe(max_rate)
+        while not self.stopped:
+            item = subscription.wait(timeout)
+            if item is not None:
+                yield item
@@ -52,7 +52,7 @@ def noThreading(source=0):
             break
 
         # Overlay the iterations per second (FPS) on the frame
-        frame = putIterationsPerSec(frame, fps_counter.fps())
+        frame = putIterationsPerSec(frame, fps_counter.rate())
 
         # Display the frame
         cv2.imshow("Video", frame)
@@ -6,11 +6,23 @@ It loads calibration parameters for the camera, performs image undistortion, cap
 and serves them via an HTTP endpoint. This is a simple test to verify that the camera is
 working and that streaming functions correctly; it does not integrate the full pi_camera_streamer functionality.
 
+The camera delivers planar YUV420. By default the capture thread converts every frame to BGR into the
+frame ring. With lazy_color=True it publishes YuvFrames over the captured buffers instead: detection reads
+the Y plane as its grayscale image, without a conversion or a copy, and the BGR conversion only runs when a
+viewer or a color overlay asks for `frame.image`.
+
+With lores_scale the camera also produces a low-resolution YUV420 `lores` stream. Its Y plane is attached
+to every published Frame as the downscaled gray view (Frame.set_scaled), so detectors asking for
+`frame.scaled(lores_scale, gray=True)` (e.g. find_marker(..., scale=lores_scale)) get it without resizing;
+the main stream is only used for display and the final sub-pixel corner refinement.
+
+Off the Pi, pass a FakePicamera2 (fake_picamera2.py) as `picam2` to run the stream without a camera.
+
 Dependencies:
     - OpenCV (cv2)
     - NumPy
     - Flask
-    - Picamera2
+    - Picamera2 (only to use the Pi camera)
     - Standard libraries: io, os, pickle, signal, threading, time, logging
     - Utility functions from .utils: define_camera_settings, load_camera_calibration
 """
@@ -19,7 +31,7 @@ import io
 import os
 import pickle
 import signal
-from time import sleep, time
+from time import sleep, time, monotonic, perf_counter_ns
 import logging
 import threading
 from threading import Thread
@@ -27,75 +39,27 @@ from threading import Thread
 import cv2
 import numpy as np
 from flask import Flask, Response
-from picamera2 import Picamera2
-from dataclasses import dataclass
 
-from .utils import define_camera_settings, load_camera_calibration
+try:
+    from picamera2 import Picamera2
+except ImportError:  # Not on the Pi, PiVideo needs a camera passed as `picam2`
+    Picamera2 = None
+
+from .utils import define_camera_settings, load_camera_calibration, JpegCache
+from .frame import Frame, FramePool, YuvFrame, pack_i420
+from .frame_ring import FrameRing
+from .frame_bus import FrameBus
+from .frame_source import FrameSource
+from .calibrated_camera import CalibratedCamera
 
 # Get the base directory for the camera folder
 base_path = os.path.dirname(os.path.abspath(__file__))
 
 
-@dataclass
-class CalibratedCamera:
-    cam_mat_path: str
-    cam_dist_path: str
-    frame_height: int
-    frame_width: int
-
-    def __post_init__(self):
-        """Load calibration parameters and calibrate the camera."""
-        self.load_calibration_parameters()
-        self.calibrate_camera()
-
-    def load_calibration_parameters(self):
-        """
-        Load the camera matrix and distortion coefficients from disk.
-        The file paths are constructed relative to the current working directory.
-        """
-        camera_matrix_path = os.path.join(os.getcwd(), self.cam_mat_path)
-        camera_distortion_path = os.path.join(os.getcwd(), self.cam_dist_path)
-
-        try:
-            with open(camera_matrix_path, "rb") as file:
-                self.camera_matrix = pickle.load(file)
-            with open(camera_distortion_path, "rb") as file:
-                self.camera_dist = pickle.load(file)
-        except Exception as e:
-            # print(f"Error Loading Camera Calibration: {e}")
-            logging.error(f"Error Loading Camera Calibration: {e}")
-
-    def calibrate_camera(self):
-        """
-        Compute an optimal new camera matrix and region of interest for undistortion.
-        Uses the stored camera matrix and distortion coefficients.
-        """
-        self.new_cam_mtx, self.roi = cv2.getOptimalNewCameraMatrix(
-            self.camera_matrix, self.camera_dist,
-            (self.frame_width, self.frame_height), 1,
-            (self.frame_width, self.frame_height)
-        )
-
-    def undistort_frame(self, frame):
-        """
-        Undistort the provided frame using the calibrated camera parameters.
-
-        Args:
-            frame (numpy.ndarray): The distorted input image.
-
-        Returns:
-            numpy.ndarray: The undistorted and cropped image.
-        """
-        undistorted_frame = cv2.undistort(
-            frame, self.camera_matrix, self.camera_dist, None, self.new_cam_mtx
-        )
-        x, y, w, h = self.roi
-        return undistorted_frame[y: y + h, x: x + w]
-
-
-class PiVideo:
+class PiVideo(FrameSource):
     def __init__(self, calibrated_camera: CalibratedCamera, framerate=60, format="XBGR8888",
-                 brightness=0.0, contrast=0.8, saturation=1.3):
+                 brightness=0.0, contrast=0.8, saturation=1.3, ring_slots=4, lazy_color=False, lores_scale=None,
+                 picam2=None):
         """
         Initialize the PiVideo stream with a calibrated camera and camera settings.
 
@@ -106,16 +70,24 @@ class PiVideo:
             brightness (float): Camera brightness.
             contrast (float): Camera contrast.
             saturation (float): Camera saturation.
+            ring_slots (int): Number of raw frames kept in the frame ring.
+            lazy_color (bool): Publish YuvFrames over the captured YUV420 buffers instead of BGR frames.
+                Their gray view is the Y plane; the BGR image is converted on first use.
+            lores_scale (float, optional): Also capture a `lores` stream at this fraction of the resolution
+                (e.g. 0.5) for detection. The frames are then published as Frames carrying it.
+            picam2 (Picamera2, optional): Camera to capture from, e.g. a FakePicamera2. Defaults to Picamera2(0).
         """
         self.width = calibrated_camera.frame_width
         self.height = calibrated_camera.frame_height
         self.framerate = framerate
         self.calibrated_camera = calibrated_camera
-        self.camera_matrix = self.calibrated_camera.new_cam_mtx
+        self.lazy_color = lazy_color
+        self.lores_scale = lores_scale
+        # The published frames are the raw sensor frames, so they go with the raw intrinsics
+        self.camera_matrix = self.calibrated_camera.camera_matrix
         self.camera_dist = self.calibrated_camera.camera_dist
 
-        # Threading lock and event for safe frame access and stopping the stream
-        self.lock = threading.Lock()
+        # Event for stopping the stream
         self.stop_event = threading.Event()
 
         # Frame counter and client tracking
@@ -124,7 +96,11 @@ class PiVideo:
         self.clients_lock = threading.Lock()
 
         # Initialize the PiCamera2 and configure it
-        self.picam2 = Picamera2(0)
+        if picam2 is None:
+            if Picamera2 is None:
+                raise RuntimeError("picamera2 is not installed; pass a camera as picam2, e.g. a FakePicamera2.")
+            picam2 = Picamera2(0)
+        self.picam2 = picam2
         config = self.picam2.create_video_configuration(
             main={"size": (self.width, self.height), "format": "YUV420"},  # Valid format
             controls={
@@ -137,14 +113,33 @@ class PiVideo:
             },
             buffer_count=4
         )
+        if lores_scale is not None:
+            # YUV420 needs even sizes
+            lores_size = tuple(2 * max(1, round(size * lores_scale / 2)) for size in (self.width, self.height))
+            config["lores"] = {"size": lores_size, "format": "YUV420"}
+        self.streams = ["main", "lores"] if lores_scale is not None else ["main"]
 
         self.picam2.configure(config)
-        # Initialize the frame buffer
-        self.buffer = io.BytesIO()
-        self.frame_buffer = None
+        if lazy_color or lores_scale is not None:
+            self.frame_pool = FramePool(slots=ring_slots)
+        if lazy_color:
+            # Every capture comes in a fresh buffer, which the published YuvFrame keeps; only the BGR
+            # images converted on demand go into pooled buffers
+            self.ring = None
+        else:
+            # Raw BGR frames are published through a preallocated ring; JPEG encoding only happens
+            # on demand for HTTP viewers
+            self.ring = FrameRing((self.height, self.width, 3), np.uint8, slots=ring_slots)
+            # The YUV420 planes are packed here first when the camera pads its rows to a stride
+            self.i420_buffer = np.empty((self.height * 3 // 2, self.width), np.uint8)
+        self.jpeg_cache = JpegCache()
+        # Consumers wait on the bus for new frames instead of polling the ring
+        self.bus = FrameBus()
 
     def start(self):
-        """Start capturing video frames in a separate thread."""
+        """Start capturing video frames in a separate thread (only once, the ring has a single writer)."""
+        if getattr(self, 'capture_thread', None) is not None and self.capture_thread.is_alive():
+            return self
         self.picam2.start()
         self.capture_thread = threading.Thread(
             target=self._capture_frames,
@@ -157,11 +152,47 @@ class PiVideo:
     def stop(self):
         """Stop the video streaming."""
         self.stop_event.set()
+        self.bus.close()
         if hasattr(self, 'picam2'):
             self.picam2.stop()
 
+    @property
+    def stopped(self):
+        """True once stop() has been called."""
+        return self.stop_event.is_set()
+
+    def read(self):
+        """
+        Get the newest raw frame without copying it.
+
+        The returned array is a view into the frame ring. It stays intact until the capture thread has
+        written `ring_slots - 1` more frames; check `self.ring.is_valid(seq)` if that matters, and never
+        draw on it directly. With lazy_color the frame is a YuvFrame, with lores_scale a Frame.
+
+        Returns:
+            tuple: (seq, frame, timestamp), or (0, None, None) if no frame has been captured yet.
+        """
+        if self.ring is None or self.lores_scale is not None:
+            return self.bus.latest()
+        return self.ring.latest()
+
+    def get_jpeg(self):
+        """Get the newest frame as JPEG bytes, encoded at most once per frame for all HTTP viewers."""
+        seq, frame, _ = self.read()
+        if frame is None:
+            return None
+        return self.jpeg_cache.encode(seq, frame)
+
+    def _attach_lores(self, frame, buffers, configuration):
+        """Attach the Y plane of the captured lores stream to a Frame as its downscaled gray view."""
+        if self.lores_scale is None:
+            return
+        lores = self.picam2.helpers.make_array(buffers[1], configuration["lores"])
+        width, height = configuration["lores"]["size"]
+        frame.set_scaled(self.lores_scale, lores[:height, :width], gray=True)
+
     def _capture_frames(self):
-        """Continuously capture frames from the camera, undistort, encode, and store them."""
+        """Continuously capture frames from the camera and publish them to the frame ring."""
         frame_interval = 1 / self.framerate
         retries = 0
         max_retries = 3
@@ -170,29 +201,48 @@ class PiVideo:
             try:
                 start_time = time()
 
-                # Capture if there are clients or if no frame is in the buffer
-                if self.clients > 0 or self.frame_buffer is None:
-                    self.buffer.seek(0)
-                    self.buffer.truncate()
-
-                    (buffers, metadata) = self.picam2.capture_buffers(["main"])
-                    buffer = buffers[0]
-                    image_array = self.picam2.helpers.make_array(
-                        buffer, self.picam2.camera_configuration()["main"]
-                    )
-                    
-                    
-                    # Undistort the captured frame before JPEG encoding
-                    ret, jpeg = cv2.imencode('.jpg',image_array)
-
-                    with self.lock:
-                        if ret:
-                            # print(jpeg)
-                            self.frame_buffer = jpeg.tobytes()
+                # Capture if there are clients or if no frame was published yet
+                if self.clients > 0 or self.bus.seq == 0:
+                    capture_start = perf_counter_ns()
+                    (buffers, metadata) = self.picam2.capture_buffers(self.streams)
+                    configuration = self.picam2.camera_configuration()
+                    image_array = self.picam2.helpers.make_array(buffers[0], configuration["main"])
+
+                    sensor_timestamp = metadata.get("SensorTimestamp")
+                    timestamp = sensor_timestamp / 1e9 if sensor_timestamp else monotonic()
+
+                    if self.lazy_color:
+                        # The buffer is already ours: publish it as is, the Y plane is the gray image
+                        if self.profiler is not None:
+                            self.profiler.record("capture", perf_counter_ns() - capture_start)
+                        seq = self.bus.seq + 1
+                        frame = YuvFrame(image_array, timestamp, seq, calibrated_camera=self.calibrated_camera,
+                                         pool=self.frame_pool, size=configuration["main"]["size"])
+                        self._attach_lores(frame, buffers, configuration)
+                        self.bus.publish(frame, timestamp, seq=seq)
+                    else:
+                        # Convert straight into the next ring slot, no intermediate copies
+                        decode_start = perf_counter_ns()
+                        width, height = configuration["main"]["size"]
+                        i420 = pack_i420(image_array, width, height, out=self.i420_buffer)
+                        slot = self.ring.begin_write()
+                        # OpenCV silently allocates a new array when dst does not fit, check it did not
+                        if cv2.cvtColor(i420, cv2.COLOR_YUV2BGR_I420, dst=slot) is not slot:
+                            raise ValueError(f"A {width}x{height} frame does not fit the "
+                                             f"{slot.shape[1]}x{slot.shape[0]} frame ring.")
+                        if self.profiler is not None:
+                            self.profiler.record("capture", decode_start - capture_start)
+                            self.profiler.record("decode", perf_counter_ns() - decode_start)
+                        seq = self.ring.commit(timestamp)
+                        if self.lores_scale is not None:
+                            slot = Frame(slot, timestamp, seq, calibrated_camera=self.calibrated_camera,
+                                         pool=self.frame_pool)
+                            self._attach_lores(slot, buffers, configuration)
+                        self.bus.publish(slot, timestamp, seq=seq)
 
                     if self.frame_count % 300 == 0:
                         logging.info(f"Stream stats - Frame: {self.frame_count}, "
-                                     f"Size: {len(self.frame_buffer) if self.frame_buffer else 0} bytes, "
+                                     f"Seq: {seq}, "
                                      f"Clients: {self.clients}")
                     self.frame_count += 1
                     retries = 0  # Reset retries on success
@@ -234,17 +284,19 @@ def create_app(stream_instance):
             stream_instance.clients += 1
             logging.info(f"Client connected. Total clients: {stream_instance.clients}")
 
+        # Wake up only when a new frame is captured, never send the same frame twice
+        frames = stream_instance.bus.subscribe(max_rate=stream_instance.framerate)
         try:
-            while True:
-                frame_data = None
-                with stream_instance.lock:
-                    if stream_instance.frame_buffer is not None:
-                        frame_data = stream_instance.frame_buffer
+            while not stream_instance.stop_event.is_set():
+                item = frames.wait(timeout=1.0)
+                if item is None:
+                    continue
+                seq, frame, _ = item
+                frame_data = stream_instance.jpeg_cache.encode(seq, frame)
 
                 if frame_data is not None:
                     yield (b'--frame\r\n'
                            b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n\r\n')
-                sleep(1 / stream_instance.framerate)
         finally:
             with stream_instance.clients_lock:
                 stream_instance.clients -= 1
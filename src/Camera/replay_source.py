@@ -0,0 +1,235 @@
+"""
+replay_source.py
+
+Replays recorded footage (a video file or a directory of images) as a FrameSource, so detection and the
+tracking pipeline can be profiled on a dev box without the Pi camera.
+
+Pacing modes:
+    - "realtime": Frames are published at the pace they were recorded, based on their original timestamps.
+    - "fixed": Frames are published at a fixed rate given by `fps`.
+    - "fast": No pacing at all. Frames are decoded on demand by the consumer (see `frames`), so every frame
+      is processed exactly once and the loop runs as fast as the pipeline allows.
+
+Frames keep their original timestamps (in seconds):
+    - Video files: the container position of each frame (CAP_PROP_POS_MSEC).
+    - Image directories: taken from a `timestamps.csv` file (`filename,timestamp` rows) if the directory has
+      one, otherwise from the file modification times.
+
+Usage:
+    python -m src.Camera.replay_source path/to/footage.mp4 --pacing fast
+
+Dependencies: os, csv, threading, time, argparse, logging, cv2
+"""
+
+import os
+import csv
+import logging
+import argparse
+import threading
+from time import monotonic, perf_counter_ns, sleep
+
+import cv2
+
+from .frame_bus import FrameBus
+from .frame_source import FrameSource
+from .fps import FPS
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+PACING_MODES = ("realtime", "fixed", "fast")
+
+
+class ReplaySource(FrameSource):
+    def __init__(self, path, pacing="realtime", fps=None, loop=False, calibrated_camera=None):
+        """
+        Open the recorded footage.
+
+        Args:
+            path (str): Video file or directory of images.
+            pacing (str): One of "realtime", "fixed" or "fast".
+            fps (float, optional): Publishing rate for the "fixed" mode. Defaults to the recorded rate.
+            loop (bool): Start over at the end of the footage instead of stopping.
+            calibrated_camera (CalibratedCamera, optional): Calibration of the camera the footage was
+                recorded with, exposed as `camera_matrix` / `camera_dist` like the live sources.
+        """
+        if pacing not in PACING_MODES:
+            raise ValueError(f"Unknown pacing mode '{pacing}', expected one of {PACING_MODES}.")
+        self.path = path
+        self.pacing = pacing
+        self.loop = loop
+        self.bus = FrameBus()
+        self.stopped = False
+        self.frame_count = 0
+
+        if calibrated_camera is not None:
+            self.calibrated_camera = calibrated_camera
+            self.camera_matrix = calibrated_camera.camera_matrix
+            self.camera_dist = calibrated_camera.camera_dist
+
+        if os.path.isdir(path):
+            self.capture = None
+            self.images, self.image_timestamps = self._list_images(path)
+            if not self.images:
+                raise ValueError(f"No images found in {path}.")
+            self.index = 0
+            duration = self.image_timestamps[-1] - self.image_timestamps[0]
+            recorded_fps = (len(self.images) - 1) / duration if duration > 0 else 30
+        else:
+            self.capture = cv2.VideoCapture(path)
+            if not self.capture.isOpened():
+                raise ValueError(f"Unable to open video {path}.")
+            recorded_fps = self.capture.get(cv2.CAP_PROP_FPS) or 30
+
+        self.framerate = fps or recorded_fps
+
+        # Peek at the first frame for the frame size, then rewind
+        frame, _ = self._decode()
+        if frame is None:
+            raise ValueError(f"No frames could be read from {path}.")
+        self.height, self.width = frame.shape[:2]
+        self._rewind()
+
+    @staticmethod
+    def _list_images(path):
+        """Sorted image paths of a directory with their timestamps."""
+        names = sorted(f for f in os.listdir(path) if f.lower().endswith(IMAGE_EXTENSIONS))
+        images = [os.path.join(path, name) for name in names]
+
+        timestamps_file = os.path.join(path, "timestamps.csv")
+        if os.path.exists(timestamps_file):
+            with open(timestamps_file, newline="") as file:
+                recorded = {row[0]: float(row[1]) for row in csv.reader(file)
+                            if len(row) >= 2 and row[0] in names}
+            if len(recorded) == len(names):
+                return images, [recorded[name] for name in names]
+            logging.warning(f"{timestamps_file} does not cover every image, using file times instead.")
+
+        return images, [os.path.getmtime(image) for image in images]
+
+    def _rewind(self):
+        if self.capture is None:
+            self.index = 0
+        else:
+            self.capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+
+    def _decode(self):
+        """Decode the next frame. Returns (frame, timestamp), (None, None) at the end of the footage."""
+        start = perf_counter_ns()
+        if self.capture is None:
+            if self.index >= len(self.images):
+                return None, None
+            frame = cv2.imread(self.images[self.index])
+            timestamp = self.image_timestamps[self.index]
+            self.index += 1
+        else:
+            grabbed, frame = self.capture.read()
+            if not grabbed:
+                return None, None
+            timestamp = self.capture.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+        if self.profiler is not None:
+            self.profiler.record("decode", perf_counter_ns() - start)
+        return frame, timestamp
+
+    def next_frame(self):
+        """
+        Decode the next frame and publish it on the bus.
+
+        Returns:
+            tuple or None: (seq, frame, timestamp), or None once the footage is exhausted.
+        """
+        frame, timestamp = self._decode()
+        if frame is None and self.loop and self.frame_count > 0:
+            self._rewind()
+            frame, timestamp = self._decode()
+        if frame is None:
+            self.stop()
+            if self.capture is not None:
+                self.capture.release()
+            return None
+        self.frame_count += 1
+        seq = self.bus.publish(frame, timestamp)
+        return seq, frame, timestamp
+
+    def start(self):
+        """Start publishing frames. In "fast" mode nothing runs until a consumer pulls frames."""
+        if self.pacing != "fast":
+            self.replay_thread = threading.Thread(target=self._replay, daemon=True, name='ReplayThread')
+            self.replay_thread.start()
+        return self
+
+    def stop(self):
+        """Stop the replay and wake up every consumer waiting on the bus."""
+        self.stopped = True
+        self.bus.close()
+
+    def frames(self, timeout=1.0, max_rate=None):
+        """
+        Iterate over frames. In "fast" mode every frame is decoded on demand and yielded exactly once;
+        otherwise this behaves like any other FrameSource.
+        """
+        if self.pacing != "fast":
+            yield from super().frames(timeout, max_rate)
+            return
+        while not self.stopped:
+            item = self.next_frame()
+            if item is None:
+                break
+            yield item
+
+    def _replay(self):
+        """Publish frames on a background thread, paced by the recorded timestamps or a fixed rate."""
+        wall_start = monotonic()
+        first_timestamp = None
+        published = 0
+
+        while not self.stopped:
+            frame, timestamp = self._decode()
+            if frame is None:
+                if not self.loop or published == 0:
+                    break
+                # Start the pacing over from the beginning of the footage
+                self._rewind()
+                wall_start, first_timestamp, published = monotonic(), None, 0
+                continue
+
+            if self.pacing == "realtime":
+                if first_timestamp is None:
+                    first_timestamp = timestamp
+                due = wall_start + (timestamp - first_timestamp)
+            else:
+                due = wall_start + published / self.framerate
+            delay = due - monotonic()
+            if delay > 0:
+                sleep(delay)
+
+            self.bus.publish(frame, timestamp)
+            self.frame_count += 1
+            published += 1
+
+        self.stop()
+        if self.capture is not None:
+            self.capture.release()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded footage and report the achieved frame rate.")
+    parser.add_argument("path", help="Video file or directory of images")
+    parser.add_argument("--pacing", choices=PACING_MODES, default="fast")
+    parser.add_argument("--fps", type=float, default=None, help="Rate for the fixed pacing mode")
+    parser.add_argument("--show", action="store_true", help="Display the frames while replaying")
+    args = parser.parse_args()
+
+    source = ReplaySource(args.path, pacing=args.pacing, fps=args.fps).start()
+    fps_counter = FPS().start()
+    for seq, frame, timestamp in source.frames():
+        fps_counter.update(seq=seq)
+        if args.show:
+            cv2.imshow("Replay", frame)
+            if cv2.waitKey(1) == ord("q"):
+                source.stop()
+    print(f"Replayed {source.frame_count} frames from {args.path} "
+          f"at {fps_counter.fps():.1f} frames/sec ({args.pacing} pacing)")
+    print(fps_counter.format_stats())
+
+
+if __name__ == "__main__":
+    main()
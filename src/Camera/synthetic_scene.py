@@ -0,0 +1,40 @@
+"""
+synthetic_scene.py
+
+Synthetic camera scenes with an ArUco marker, for the benchmarks and the fake camera when there is no
+footage or no camera.
+
+synthetic_frame renders one marker in the middle of a light gray frame. moving_frames turns a frame into a
+sequence where it shifts and slightly rotates a little more in every frame, like a slowly moving marker.
+
+Usage:
+    frames = moving_frames(synthetic_frame("DICT_5X5_1000"), 120)
+
+Dependencies: cv2, numpy
+"""
+
+import cv2
+import numpy as np
+
+
+def synthetic_frame(dict_name, width=1280, height=720, marker_id=5, marker_size=200):
+    """A light gray frame with a single marker in the middle."""
+    aruco_dict = cv2.aruco.getPredefinedDictionary(getattr(cv2.aruco, dict_name))
+    marker = cv2.aruco.generateImageMarker(aruco_dict, marker_id, marker_size)
+    frame = np.full((height, width), 200, dtype=np.uint8)
+    y, x = (height - marker_size) // 2, (width - marker_size) // 2
+    frame[y:y + marker_size, x:x + marker_size] = marker
+    return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+
+
+def moving_frames(frame, n_frames, speed=4.0):
+    """The frame shifted and slightly rotated a little more in every frame, like a slowly moving marker."""
+    height, width = frame.shape[:2]
+    frames = []
+    for k in range(n_frames):
+        angle = 5 * np.sin(2 * np.pi * k / n_frames)
+        matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+        matrix[0, 2] += speed * k - speed * n_frames / 2
+        matrix[1, 2] += 40 * np.sin(4 * np.pi * k / n_frames)
+        frames.append(cv2.warpAffine(frame, matrix, (width, height), borderValue=(200, 200, 200)))
+    return frames
@@ -22,10 +22,13 @@ Modules Used:
 """
 
 from threading import Thread
+from time import perf_counter_ns
 import cv2
 import os
 import pickle
 from .fps import FPS, putIterationsPerSec
+from .frame_bus import FrameBus
+from .frame_source import FrameSource
 
 # Paths for camera calibration data
 CAMERA_MATRIX_PATH = "src/Camera/cameraMatrix.pkl"
@@ -67,7 +70,7 @@ def load_camera_calibration():
 
 
 
-class WebcamVideoStreamThreaded():
+class WebcamVideoStreamThreaded(FrameSource):
     """
     A class for threaded video capture from a webcam.
 
@@ -76,6 +79,7 @@ class WebcamVideoStreamThreaded():
     - grabbed (bool): Indicates if the frame was successfully grabbed.
     - frame (numpy.ndarray): The current frame from the video stream.
     - stopped (bool): Flag to stop the video stream thread.
+    - bus (FrameBus): Every grabbed frame is published here; consumers wait on it instead of polling `frame`.
     """
 
     def __init__(self, src=0):
@@ -91,10 +95,16 @@ class WebcamVideoStreamThreaded():
             exit()
         self.frame_width = self.stream.get(cv2.CAP_PROP_FRAME_WIDTH)
         self.frame_height = self.stream.get(cv2.CAP_PROP_FRAME_HEIGHT)
+        self.width = int(self.frame_width)
+        self.height = int(self.frame_height)
+        self.framerate = self.stream.get(cv2.CAP_PROP_FPS) or 30
 
         self.camera_matrix, self.camera_dist = load_camera_calibration()
         self.grabbed, self.frame = self.stream.read()
         self.stopped = False
+        self.bus = FrameBus()
+        if self.grabbed:
+            self.bus.publish(self.frame)
 
     def start(self):
         """
@@ -113,12 +123,17 @@ class WebcamVideoStreamThreaded():
         """
         while not self.stopped:
             if not self.grabbed:
-                self.grabbed.release()
+                self.stream.release()
                 self.stop()
             else:
+                start = perf_counter_ns()
                 self.grabbed, self.frame = self.stream.read()
-                self.calibrate_camera()
-                self.undistort_frame()
+                if self.profiler is not None:
+                    self.profiler.record("capture", perf_counter_ns() - start)
+                if self.grabbed:
+                    self.bus.publish(self.frame)
+                    self.calibrate_camera()
+                    self.undistort_frame()
 
     def calibrate_camera(self):
         """
@@ -148,6 +163,7 @@ class WebcamVideoStreamThreaded():
         Stop the video stream thread by setting the stopped flag to True.
         """
         self.stopped = True
+        self.bus.close()
         
     
         
@@ -164,6 +180,7 @@ def thread_video_get(src=0):
     - Press 'q' to exit the video stream.
     """
     video_getter = WebcamVideoStreamThreaded(src).start()
+    frames = video_getter.bus.subscribe()
     fps_counter = FPS().start()
 
     while True:
@@ -171,8 +188,12 @@ def thread_video_get(src=0):
             video_getter.stop()
             break
 
-        frame = video_getter.frame
-        frame = putIterationsPerSec(frame, fps_counter.fps())
+        # Wait for a frame we have not shown yet
+        item = frames.wait(timeout=0.1)
+        if item is None:
+            continue
+        frame = item[1]
+        frame = putIterationsPerSec(frame, fps_counter.rate())
         cv2.imshow("Video", frame)
         fps_counter.update()
         
@@ -182,12 +203,23 @@ class VideoShow:
     Handles displaying frames in a separate thread.
 
     Attributes:
-    - frame: Current frame to be displayed.
+    - frame: Current frame to be displayed. Assigning a frame publishes it to `bus`.
     - stopped: Flag to stop the thread.
+    - bus (FrameBus): Frames waiting to be displayed.
     """
     def __init__(self, frame=None):
-        self.frame = frame
+        self.bus = FrameBus()
         self.stopped = False
+        self.frame = frame
+
+    @property
+    def frame(self):
+        return self.bus.latest()[1]
+
+    @frame.setter
+    def frame(self, frame):
+        if frame is not None:
+            self.bus.publish(frame)
 
     def start(self,):
         """
@@ -201,11 +233,14 @@ class VideoShow:
 
     def show(self):
         """
-        Continuously displays the video frame until stopped.
+        Displays each new frame once until stopped.
         """
+        frames = self.bus.subscribe()
         while not self.stopped:
-            if self.frame is not None:
-                cv2.imshow('Video', self.frame)
+            # Short timeout so the window keeps processing GUI events while no frame arrives
+            item = frames.wait(timeout=0.03)
+            if item is not None:
+                cv2.imshow('Video', item[1])
             if cv2.waitKey(1) == ord("q"):
                 self.stopped = True
 
@@ -214,6 +249,7 @@ class VideoShow:
         Stops the video display thread by setting the stopped flag to True.
         """
         self.stopped = True
+        self.bus.close()
 
 
 
@@ -1,5 +1,11 @@
 import pickle
 import os 
+import threading
+from time import perf_counter_ns
+
+import cv2
+
+from .frame import Frame
 
 def define_camera_settings(camera_matrix_path, camera_distortion_path):
     """
@@ -29,4 +35,45 @@ def load_camera_calibration(CAMERA_MATRIX_PATH,CAMERA_DISTORTION_PATH):
     """
     camera_matrix_path = os.path.join(os.getcwd(), CAMERA_MATRIX_PATH)
     camera_distortion_path = os.path.join(os.getcwd(), CAMERA_DISTORTION_PATH)
-    return define_camera_settings(camera_matrix_path, camera_distortion_path)
\ No newline at end of file
+    return define_camera_settings(camera_matrix_path, camera_distortion_path)
+
+class JpegCache:
+    """
+    Encodes frames to JPEG at most once per sequence number.
+
+    Every HTTP viewer asks the cache for the current frame, so the encode cost is paid once per frame
+    no matter how many viewers are connected, and not at all when nobody is watching.
+    """
+
+    def __init__(self, quality=95, profiler=None):
+        self.params = [int(cv2.IMWRITE_JPEG_QUALITY), quality]
+        # StageProfiler receiving the encode time of every frame, if any
+        self.profiler = profiler
+        self.lock = threading.Lock()
+        self.seq = None
+        self.data = None
+
+    def encode(self, seq, frame):
+        """
+        Get the JPEG bytes for a frame, encoding it only if `seq` differs from the cached one.
+
+        Parameters:
+        - seq (int): Sequence number of the frame.
+        - frame (numpy.ndarray or Frame): The image to encode. A Frame's BGR image is used, which converts
+          a YuvFrame only when a viewer needs it.
+
+        Returns:
+        - bytes or None: The JPEG data, or None if encoding failed and nothing is cached.
+        """
+        with self.lock:
+            if seq != self.seq:
+                if isinstance(frame, Frame):
+                    frame = frame.image
+                start = perf_counter_ns()
+                ret, jpeg = cv2.imencode('.jpg', frame, self.params)
+                if self.profiler is not None:
+                    self.profiler.record("encode", perf_counter_ns() - start)
+                if ret:
+                    self.seq = seq
+                    self.data = jpeg.tobytes()
+            return self.data
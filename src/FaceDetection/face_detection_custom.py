@@ -69,7 +69,7 @@ def main(src=0):
         frame = video_stream.frame
         if frame is not None:
             frame = detect_faces(frame)
-            frame_with_fps = putIterationsPerSec(frame, fps_counter.fps())
+            frame_with_fps = putIterationsPerSec(frame, fps_counter.rate())
             # video_display.frame = frame_with_fps
 
         # Update FPS counter
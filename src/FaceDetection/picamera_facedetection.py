@@ -47,19 +47,23 @@ def create_app(stream_instance):
             stream_instance.clients += 1
             logging.info(f"Client connected. Total clients: {stream_instance.clients}")
 
+        # Block on the frame bus instead of polling the stream
+        frames = stream_instance.bus.subscribe()
+
         try:
             while True:
-                frame_data = None
-                with stream_instance.lock:
-                    if stream_instance.frame_buffer is not None:
-                        frame_data = stream_instance.frame_buffer
-
-                if frame_data is not None:
-                    
-                    nparr = np.frombuffer(frame_data, dtype=np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                    
-                    frame, face_bboxes = face_detector.findFaces(frame, draw=False)
+                # Wait for the next captured frame (a view into the frame ring, no copy)
+                item = frames.wait(timeout=1.0)
+                if item is None:
+                    if stream_instance.stop_event.is_set():
+                        break
+                    continue
+                seq, raw_frame, _ = item
+
+                if raw_frame is not None:
+                    # Detect on the raw pixels, annotate a copy so the ring slot is never modified
+                    _, face_bboxes = face_detector.findFaces(raw_frame, draw=False)
+                    frame = raw_frame.copy()
                     if face_bboxes:
                         for bbox in face_bboxes:
                             # Extract bounding box details
@@ -84,12 +88,13 @@ def create_app(stream_instance):
                                 2
                             )
                     ret, jpeg = cv2.imencode('.jpg', frame)
-                    if ret:
-                        frame_data = jpeg.tobytes()
-                    
+                    if not ret:
+                        logging.error("Failed to encode frame to JPEG")
+                        continue
+                    frame_data = jpeg.tobytes()
+
                     yield (b'--frame\r\n'
                            b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n\r\n')
-                sleep(1 / stream_instance.framerate)
         finally:
             with stream_instance.clients_lock:
                 stream_instance.clients -= 1
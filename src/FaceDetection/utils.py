@@ -1,5 +1,6 @@
 import cv2
 
+from ..Camera.frame import Frame, gray_image
 
 HAAR_CASCADE_FACE = r'src/FaceDetection/haarcascade_frontalface_default.xml'
 HAAR_CASCADE_EYES = r'src/FaceDetection/haarcascade_eye.xml'
@@ -9,8 +10,11 @@ faceClassifier = cv2.CascadeClassifier(HAAR_CASCADE_FACE)
 eyeClassifier = cv2.CascadeClassifier(HAAR_CASCADE_EYES)
 
 def detect_faces(img_frame):
-    # Convert to gray scale for faster processing
-    gray = cv2.cvtColor(img_frame, cv2.COLOR_BGR2GRAY)
+    # Gray scale for faster processing. A Frame shares its gray view with the other detectors, and the
+    # annotations are drawn on its image.
+    gray = gray_image(img_frame)
+    if isinstance(img_frame, Frame):
+        img_frame = img_frame.image
 
     # Ensure classifiers are loaded
     if faceClassifier.empty() or eyeClassifier.empty():
@@ -1,21 +1,31 @@
+import numpy as np
+
 class PIDController:
     def __init__(self,Kp,Ki,Kd):
         
         self.Kp = Kp
         self.Ki = Ki
         self.Kd = Kd
-        self.previous_error = 0
+        self.previous_error = None
+        self.integral = 0
+
+    def reset(self):
+        # Forget the integral and the previous error, e.g. after losing the target
+        self.previous_error = None
         self.integral = 0
         
     def compute(self,error, dt):
-        # Calculate error
+        # dt is the time since the previous call in seconds (not the time since the start of the run)
         # Proportional term
         P_out = self.Kp*error
         # Integral term
         self.integral += error*dt
         I_out = self.Ki*self.integral
-        # Derivative term 
-        derivative = (error-self.previous_error)/dt
+        # Derivative term (skipped on the first call and when no time has passed)
+        if dt > 0 and self.previous_error is not None:
+            derivative = (error-self.previous_error)/dt
+        else:
+            derivative = 0
         D_out = self.Kd*derivative
         
         # Comptue total output
@@ -26,7 +36,7 @@ class PIDController:
         return output
     def update_PD(self,error):
         P_out = self.Kp*error
-        D_out = self.Kd*(error-self.previous_error)
+        D_out = self.Kd*(error-self.previous_error) if self.previous_error is not None else 0
 
         self.previous_error = error
         return P_out+D_out
@@ -36,6 +46,137 @@ class PIDController:
         return msg
         
 
+class MultiAxisPID:
+    """
+    PID controller for any number of axes (pan, tilt, ...), updated for all axes in one call.
+
+    Gains, limits and state are numpy arrays with one entry per axis. The errors passed in can also have
+    leading batch dimensions, e.g. (n_runs, n_axes) to control many simulated trajectories at once; the
+    state takes the shape of the first error it sees (call reset() to change it).
+
+    The output is an angular rate (deg/s). `command` integrates it into new servo positions, clamped to
+    the servo limits:
+        position_new = clip(position + sign * output * dt, position_min, position_max)
+
+    On top of the plain PID terms:
+    - The output is clamped to +-output_limits.
+    - The integral is clamped to +-integral_limits, and stops integrating while the output saturates or
+      a servo is pinned at its limit in the direction the error pushes (anti-windup).
+    - The derivative is low-pass filtered with time constant derivative_tau (seconds).
+    """
+
+    def __init__(self, Kp, Ki, Kd, position_limits=None, signs=1.0, output_limits=None,
+                 integral_limits=None, derivative_tau=0.0):
+        """
+        Parameters:
+        - Kp, Ki, Kd (float or array): Gains, one per axis (Kp in 1/s, Ki in 1/s^2, Kd unitless).
+        - position_limits (tuple, optional): (minimums, maximums) servo angles per axis,
+          e.g. ([PAN_MIN, TILT_MIN], [PAN_MAX, TILT_MAX]).
+        - signs (float or array): Direction each servo turns to reduce a positive error (-1 or +1).
+        - output_limits (float or array, optional): Maximum absolute output (deg/s) per axis.
+        - integral_limits (float or array, optional): Maximum absolute integral per axis.
+        - derivative_tau (float): Time constant of the derivative filter in seconds (0 for no filtering).
+        """
+        gains = np.broadcast_arrays(*(np.atleast_1d(np.asarray(k, dtype=np.float64)) for k in (Kp, Ki, Kd)))
+        self.Kp, self.Ki, self.Kd = (g.copy() for g in gains)
+        self.n_axes = self.Kp.shape[-1]
+
+        def per_axis(value, default):
+            return np.broadcast_to(np.asarray(default if value is None else value, dtype=np.float64),
+                                   (self.n_axes,)).copy()
+
+        low, high = position_limits if position_limits is not None else (None, None)
+        self.position_min = per_axis(low, -np.inf)
+        self.position_max = per_axis(high, np.inf)
+        self.signs = per_axis(signs, 1.0)
+        self.output_limits = per_axis(output_limits, np.inf)
+        self.integral_limits = per_axis(integral_limits, np.inf)
+        self.derivative_tau = derivative_tau
+
+        self.integral = None
+        self.previous_error = None
+        self.derivative = None
+
+    def reset(self, shape=None):
+        """
+        Clear the state of every axis.
+
+        Parameters:
+        - shape (tuple, optional): Shape of the errors from now on, (..., n_axes). Defaults to the
+          current shape, or (n_axes,) before the first update.
+        """
+        if shape is None:
+            shape = self.integral.shape if self.integral is not None else (self.n_axes,)
+        self.integral = np.zeros(shape)
+        self.derivative = np.zeros(shape)
+        self.previous_error = None
+
+    def compute(self, error, dt):
+        """
+        Compute the outputs of all axes (and batches) at once.
+
+        Parameters:
+        - error (array): Errors, shape (..., n_axes).
+        - dt (float or array): Time since the previous update in seconds, broadcastable to the batch,
+          e.g. (n_runs, 1).
+
+        Returns:
+        - numpy.ndarray: The clamped outputs (deg/s), same shape as error.
+        """
+        error = np.asarray(error, dtype=np.float64)
+        dt = np.asarray(dt, dtype=np.float64)
+        if self.integral is None or self.integral.shape != error.shape:
+            self.reset(error.shape)
+
+        valid = dt > 0
+        integral = np.clip(self.integral + error * np.where(valid, dt, 0.0),
+                           -self.integral_limits, self.integral_limits)
+
+        if self.previous_error is not None:
+            raw = (error - self.previous_error) / np.where(valid, dt, np.inf)
+            alpha = np.where(valid, dt / (self.derivative_tau + np.where(valid, dt, 1.0)), 0.0)
+            self.derivative = self.derivative + alpha * (raw - self.derivative)
+        self.previous_error = error.copy()
+
+        output = self.Kp * error + self.Ki * integral + self.Kd * self.derivative
+        clamped = np.clip(output, -self.output_limits, self.output_limits)
+
+        # Anti-windup: do not integrate further while the output saturates in the error's direction
+        windup = (clamped != output) & (np.sign(error) == np.sign(output))
+        self.integral = np.where(windup, self.integral, integral)
+        return clamped
+
+    def command(self, position, error, dt):
+        """
+        Compute the new servo positions of all axes (and batches) at once.
+
+        Parameters:
+        - position (array): Current servo angles, shape (..., n_axes).
+        - error (array): Errors, shape (..., n_axes).
+        - dt (float or array): Time since the previous update in seconds.
+
+        Returns:
+        - numpy.ndarray: New servo angles clamped to the position limits.
+        """
+        integral = self.integral
+        dt = np.asarray(dt, dtype=np.float64)
+        target = np.asarray(position, dtype=np.float64) + self.signs * self.compute(error, dt) * dt
+        new_position = np.clip(target, self.position_min, self.position_max)
+
+        # Anti-windup at the servo limits: an axis pinned at a limit keeps its previous integral, but only
+        # while the error pushes it further into that limit, so an integral that drove it there can unwind
+        push = np.sign(error) * self.signs
+        pinned = (((target > self.position_max) & (push > 0)) |
+                  ((target < self.position_min) & (push < 0)))
+        if integral is not None and integral.shape == self.integral.shape and pinned.any():
+            self.integral = np.where(pinned, integral, self.integral)
+        return new_position
+
+    def get_specs(self):
+        msg = f'\n KP: {self.Kp}\n KI: {self.Ki}\n KD: {self.Kd}'
+        return msg
+
+
 # class PIDController:
 #     def __init__(self, Kp=0, Kd=0, Ki=0, set_point=0):
 #         self.Kp = Kp
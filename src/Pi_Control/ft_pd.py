@@ -21,6 +21,10 @@ from gpiozero.pins.pigpio import PiGPIOFactory
 from ..Camera.pi_camera_streamer import CalibratedCamera, PiVideo
 from ..ArUcoMarker.utils import find_marker, track_and_render_marker, draw_center_frame
 from ..PID import PIDController
+from ..telemetry import TelemetryRecorder
+from ..logging_utils import setup_logging, RateLimitedLogger
+from ..stage_profiler import StageProfiler
+from ..ServoController.servo_driver import ServoDriver
 
 # =======================
 # Global Configuration
@@ -34,13 +38,11 @@ timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S").replace(":", "
 current_run = os.path.join(face_run_path, f"run_{timestamp}")
 os.makedirs(current_run, exist_ok=True)
 
-# Configure logging (log file stored in the face_runs directory)
+# Configure logging (log file stored in the face_runs directory, written by a background thread).
+# Per-frame messages are rate limited, the per-frame numbers are in the telemetry CSV.
 log_file = os.path.join(face_run_path, f"Face_Motion_{timestamp}.log")
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+setup_logging(log_file, level=logging.INFO)
+frame_log = RateLimitedLogger(interval=1.0)
 logging.info("Face tracking logging system initialized.")
 
 # =======================
@@ -80,6 +82,15 @@ tilt_servo = AngularServo(
 pan_servo.angle = 0
 tilt_servo.angle = 0
 
+# The PWM writes go out from the driver's writer thread, not from the detection loop
+SERVO_WRITE_RATE = 50  # Hz
+SERVO_DEADBAND = 0.25  # deg, smaller changes are not written to the servos
+# Per-stage latency, logged when a viewer disconnects and drawn on the stream
+profiler = StageProfiler()
+servo_driver = ServoDriver((pan_servo, tilt_servo), rate=SERVO_WRITE_RATE, deadband=SERVO_DEADBAND,
+                           profiler=profiler)
+pan_output, tilt_output = servo_driver.channels
+
 
 
 # Initialize PID controllers for pan and tilt
@@ -110,9 +121,10 @@ def create_app(stream_instance):
     app = Flask(__name__)
     start_time = time()
 
-    # Initialize an empty data array to store run data.
-    # Columns: Time, Pan_Error, Pan_Angle, Face_Confidence
-    data_array = np.empty((0, 4))
+    # Run data, appended to the CSV in chunks while tracking.
+    data_file = os.path.join(current_run, 'data_face.csv')
+    telemetry = TelemetryRecorder(data_file, ["Time", "Pan_Error", "Pan_Angle", "Face_Confidence"])
+    app.telemetry = telemetry
 
     def generate_frames():
         """Generator that yields JPEG frames as multipart responses."""
@@ -120,29 +132,37 @@ def create_app(stream_instance):
             stream_instance.clients += 1
             logging.info(f"Client connected. Total clients: {stream_instance.clients}")
 
+        # Block on the frame bus instead of polling the stream
+        frames = stream_instance.bus.subscribe()
+        # Capture time of the frame the controllers were last updated with
+        last_control_time = None
+
         try:
             while True:
-                frame_data = None
-                with stream_instance.lock:
-                    if stream_instance.frame_buffer is not None:
-                        frame_data = stream_instance.frame_buffer
+                # Wait for the next captured frame (a view into the frame ring, no copy)
+                item = frames.wait(timeout=1.0)
+                if item is None:
+                    if stream_instance.stop_event.is_set():
+                        break
+                    continue
+                seq, raw_frame, timestamp = item
 
                 elapsed_time = time() - start_time
 
-                if frame_data is not None:
+                if raw_frame is not None:
                     width = stream_instance.width
                     height = stream_instance.height
                     frame_center = (width // 2, height // 2)
 
-                    # Decode the image from the frame buffer.
-                    nparr = np.frombuffer(frame_data, dtype=np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+                    # Detect faces directly on the raw pixels.
+                    with profiler.span("detect"):
+                        _, face_bboxes = face_detector.findFaces(raw_frame, draw=False)
+
+                    # Annotate a copy so the shared ring slot is never modified.
+                    frame = raw_frame.copy()
 
                     # Draw a center marker.
                     draw_center_frame(frame, frame_center)
-
-                    # Detect faces in the frame.
-                    frame, face_bboxes = face_detector.findFaces(frame, draw=False)
                     face_confidence = 0  # Default confidence in case no face is found.
                     if face_bboxes:
                         for bbox in face_bboxes:
@@ -172,26 +192,33 @@ def create_app(stream_instance):
                             tilt_error = (y_f - y_r)/y_r*100
                             
                             
-                            logging.info(f"Elapsed Time: {elapsed_time:.2f}s | Pan Error: {pan_error:.2f} | Face Confidence: {face_confidence}%")
-                            
-                            current_pan = pan_servo.angle if pan_servo.angle is not None else 0
-                            pan_correction = pan_controller.compute(pan_error, elapsed_time)
-                            new_pan = np.clip(current_pan - pan_correction, PAN_MIN, PAN_MAX)
-                            pan_servo.angle = new_pan
+                            frame_log.info("Elapsed Time: %.2fs | Pan Error: %.2f | Face Confidence: %d%%",
+                                           elapsed_time, pan_error, face_confidence)
                             
-                            # Compute tilt error and apply PID correction
-                            current_tilt = tilt_servo.angle if tilt_servo.angle is not None else 0
-                            tilt_correction = tilt_controller.compute(tilt_error, elapsed_time)
-                            new_tilt = np.clip(current_tilt + tilt_correction, TILT_MIN, TILT_MAX)
-                            tilt_servo.angle = new_tilt
+                            # Time since the previous control update (not since the start of the run)
+                            dt = timestamp - last_control_time if last_control_time is not None else 0
+                            last_control_time = timestamp
+
+                            with profiler.span("control"):
+                                current_pan = pan_output.angle if pan_output.angle is not None else 0
+                                pan_correction = pan_controller.compute(pan_error, dt)
+                                new_pan = np.clip(current_pan - pan_correction, PAN_MIN, PAN_MAX)
+                                pan_output.angle = new_pan
+
+                                # Compute tilt error and apply PID correction
+                                current_tilt = tilt_output.angle if tilt_output.angle is not None else 0
+                                tilt_correction = tilt_controller.compute(tilt_error, dt)
+                                new_tilt = np.clip(current_tilt + tilt_correction, TILT_MIN, TILT_MAX)
+                                tilt_output.angle = new_tilt
                             
                             # Log and store data (only one face is used for control).
-                            data_entry = np.array([[elapsed_time, pan_error, new_pan, face_confidence]])
-                            data_array[:] = np.vstack((data_array, data_entry))
+                            telemetry.record(elapsed_time, pan_error, new_pan, face_confidence)
                             break  # Process only the first detected face.
                             
+                    profiler.draw(frame)
                     # Re-encode the processed frame to JPEG bytes.
-                    ret, jpeg = cv2.imencode('.jpg', frame)
+                    with profiler.span("encode"):
+                        ret, jpeg = cv2.imencode('.jpg', frame)
                     if ret:
                         frame_data = jpeg.tobytes()
                     else:
@@ -200,18 +227,16 @@ def create_app(stream_instance):
 
                     yield (b'--frame\r\n'
                            b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n\r\n')
-                sleep(1 / stream_instance.framerate)
         except KeyboardInterrupt:
             logging.info("Ctrl-C detected. Exiting gracefully...")
         finally:
             with stream_instance.clients_lock:
                 stream_instance.clients -= 1
                 logging.info(f"Client disconnected. Remaining clients: {stream_instance.clients}")
-            # Save the run data to a CSV file.
-            fname = os.path.join(current_run, 'data_face.csv')
-            np.savetxt(fname, data_array, delimiter=",",
-                       header="Time,Pan_Error,Pan_Angle,Face_Confidence", comments="", fmt="%.5f")
-            logging.info(f"Saved data at: {fname}")
+            # Write out the rows recorded so far; the file is closed when the app exits.
+            telemetry.flush()
+            logging.info(f"Saved data at: {data_file}")
+            logging.info(f"Stage latency: {profiler.format_stats()}")
             # Optionally, call a plotting function here if desired.
             # plot_data(fname, config, face_run_path)
 
@@ -271,7 +296,15 @@ if __name__ == "__main__":
         brightness=0.0,
         saturation=1,
         contrast=1
-    ).start()
+    )
+    stream.profiler = profiler
+    stream.start()
     # Create and run the Flask application.
     app = create_app(stream)
-    app.run(host='0.0.0.0', port=5000)
+    servo_driver.start()
+    try:
+        app.run(host='0.0.0.0', port=5000)
+    finally:
+        servo_driver.stop()
+        app.telemetry.close()
+        stream.stop()
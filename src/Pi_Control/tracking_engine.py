@@ -0,0 +1,209 @@
+"""
+tracking_engine.py
+
+A single background thread that owns detection and control, decoupled from the HTTP viewers.
+
+The engine subscribes to the camera's frame bus and calls `process` for every new frame, whether or not
+anybody is watching, so the control loop rate does not depend on the browser. Viewers never run any
+tracking code: they subscribe to the engine's own bus of annotated frames, and every annotated frame is
+JPEG encoded at most once no matter how many viewers are connected. Annotation is skipped entirely while
+nobody is watching.
+
+Subclasses implement `process` (detect, control, optionally draw) and may implement `finish` to save
+their run data once the engine stops.
+
+With a StageProfiler, the engine also hands it to the camera stream (capture/decode) and to the JPEG
+encoder, and logs the stage latency percentiles every `stats_interval` seconds and when it stops.
+Subclasses time their own stages with `self.profiler.span(...)`.
+
+Usage:
+    engine = MyTrackingEngine(stream).start()
+    Response(engine.mjpeg_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+Dependencies: abc, logging, threading, time, numpy
+"""
+
+import logging
+import threading
+from abc import ABC, abstractmethod
+from time import monotonic
+
+import numpy as np
+
+from ..Camera.frame_bus import FrameBus
+from ..Camera.frame_ring import FrameRing
+from ..Camera.utils import JpegCache
+from ..logging_utils import RateLimitedLogger
+
+
+class TrackingEngine(ABC):
+    def __init__(self, stream, name="TrackingEngine", jpeg_quality=95, ring_slots=4, profiler=None,
+                 stats_interval=10.0):
+        """
+        Args:
+            stream (FrameSource): The camera stream to track on.
+            name (str): Name of the engine thread.
+            jpeg_quality (int): JPEG quality of the viewer stream.
+            ring_slots (int): Number of annotated frames kept for the viewers.
+            profiler (StageProfiler, optional): Per-stage latency profiler shared with the stream and encoder.
+            stats_interval (float): Seconds between stage latency summaries in the log (0 to disable).
+        """
+        self.stream = stream
+        self.name = name
+        self.ring_slots = ring_slots
+        self.profiler = profiler
+        self.stats_interval = stats_interval
+        if profiler is not None and getattr(stream, "profiler", None) is None:
+            stream.profiler = profiler
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        # Annotated frames for the viewers, written into a ring so a frame is not overwritten while encoded
+        self.ring = None
+        self._buffer = None  # Ring slot handed out by annotation_buffer for the current frame
+        self.bus = FrameBus()
+        self.jpeg_cache = JpegCache(quality=jpeg_quality, profiler=profiler)
+        self.viewers = 0
+        self.viewers_lock = threading.Lock()
+
+        self.frame_count = 0
+        # A frame that fails is logged at most once per second, with the count of the failures in between
+        self.error_log = RateLimitedLogger(interval=1.0)
+
+    @property
+    def watched(self):
+        """True while at least one viewer is connected."""
+        return self.viewers > 0
+
+    def start(self):
+        """Start the engine thread (only once)."""
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        # The engine is a consumer of the camera like any client, keep the capture running for it
+        if hasattr(self.stream, "clients_lock"):
+            with self.stream.clients_lock:
+                self.stream.clients += 1
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=5.0):
+        """Stop the engine, wait for the thread to finish and wake up every viewer."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        self.bus.close()
+
+    def annotation_buffer(self, shape, dtype=np.uint8):
+        """
+        Get the buffer to draw the next annotated frame into.
+
+        Call this from `process` and return the buffer; it is then published to the viewers.
+
+        Args:
+            shape (tuple): Shape of the annotated frame.
+            dtype (numpy.dtype): Pixel data type.
+
+        Returns:
+            numpy.ndarray: The next slot of the annotation ring.
+        """
+        if self.ring is None or self.ring.shape != tuple(shape):
+            self.ring = FrameRing(shape, dtype, slots=self.ring_slots)
+        self._buffer = self.ring.begin_write()
+        return self._buffer
+
+    @abstractmethod
+    def process(self, seq, raw_frame, timestamp, annotate):
+        """
+        Handle one camera frame. Runs on the engine thread for every new frame.
+
+        Args:
+            seq (int): Sequence number of the camera frame.
+            raw_frame (numpy.ndarray or Frame): The camera frame (a YuvFrame from a lazy_color PiVideo). Do not
+                draw on it, other consumers share it.
+            timestamp (float): Capture time of the frame in seconds.
+            annotate (bool): True if a viewer is connected and an annotated frame is wanted.
+
+        Returns:
+            numpy.ndarray or None: The annotated frame (from `annotation_buffer`), or None.
+        """
+
+    def finish(self):
+        """Called on the engine thread once it stops, e.g. to save the run data."""
+
+    def _run(self):
+        """Engine loop: process every new camera frame until stopped."""
+        frames = self.stream.bus.subscribe()
+        logging.info(f"{self.name} started.")
+        last_stats = monotonic()
+        try:
+            while not self.stop_event.is_set():
+                item = frames.wait(timeout=1.0)
+                if item is None:
+                    if self.stream.stopped:
+                        break
+                    continue
+                seq, raw_frame, timestamp = item
+
+                try:
+                    annotated = self.process(seq, raw_frame, timestamp, self.watched)
+                except Exception as e:
+                    self.error_log.error("%s failed to process frame %d: %s", self.name, seq, e)
+                    continue
+                self.frame_count += 1
+
+                if annotated is not None:
+                    # Frames drawn elsewhere are copied into the ring so viewers can encode them safely
+                    if annotated is not self._buffer:
+                        np.copyto(self.annotation_buffer(annotated.shape, annotated.dtype), annotated)
+                    annotated_seq = self.ring.commit(timestamp)
+                    self.bus.publish(self._buffer, timestamp, seq=annotated_seq)
+                self._buffer = None
+
+                if self.profiler is not None and self.stats_interval and monotonic() - last_stats >= self.stats_interval:
+                    logging.info(f"{self.name} stage latency: {self.profiler.format_stats()}")
+                    last_stats = monotonic()
+        finally:
+            if hasattr(self.stream, "clients_lock"):
+                with self.stream.clients_lock:
+                    self.stream.clients -= 1
+            self.bus.close()
+            try:
+                self.finish()
+            finally:
+                logging.info(f"{self.name} stopped after {self.frame_count} frames.")
+                if self.profiler is not None:
+                    logging.info(f"{self.name} stage latency: {self.profiler.format_stats()}")
+
+    def mjpeg_frames(self, max_rate=None):
+        """
+        Generator of the annotated frames as multipart JPEG chunks for an HTTP viewer.
+
+        Args:
+            max_rate (float, optional): Maximum number of frames per second sent to this viewer.
+
+        Yields:
+            bytes: One multipart chunk per annotated frame.
+        """
+        with self.viewers_lock:
+            self.viewers += 1
+            logging.info(f"Viewer connected. Total viewers: {self.viewers}")
+
+        frames = self.bus.subscribe(max_rate)
+        try:
+            while not self.stop_event.is_set():
+                item = frames.wait(timeout=1.0)
+                if item is None:
+                    if self.bus.closed:
+                        break
+                    continue
+                seq, frame, _ = item
+                frame_data = self.jpeg_cache.encode(seq, frame)
+                if frame_data is not None:
+                    yield (b'--frame\r\n'
+                           b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n\r\n')
+        finally:
+            with self.viewers_lock:
+                self.viewers -= 1
+                logging.info(f"Viewer disconnected. Remaining viewers: {self.viewers}")
@@ -24,16 +24,28 @@ import cv2
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-from time import sleep, time
+from time import sleep, time, perf_counter_ns
 from flask import Flask, Response
 from gpiozero import Device, AngularServo, Servo
 from gpiozero.pins.pigpio import PiGPIOFactory
 from picamera2 import Picamera2
 from ..Camera.fps import FPS, putIterationsPerSec
 # Import custom modules
-from ..ArUcoMarker.utils import find_marker, track_and_render_marker, draw_center_frame
-from ..PID import PIDController
+from ..ArUcoMarker.detector_registry import get_detector
+from ..ArUcoMarker.custom_dictionary import FIELD_MARKER_IDS
+from ..ArUcoMarker.roi_tracker import RoiMarkerSearch
+from ..ArUcoMarker.flow_tracker import HybridMarkerTracker
+from ..ArUcoMarker.utils import find_marker, estimate_poses, render_markers, draw_center_frame
+from ..PID import MultiAxisPID
+from ..telemetry import TelemetryRecorder
+from ..logging_utils import setup_logging, RateLimitedLogger
+from ..stage_profiler import StageProfiler
+from ..control_loop import ControlLoop
+from ..target_estimator import TargetEstimator
+from ..ServoController.servo_driver import ServoDriver
 from ..Camera.pi_camera_streamer import CalibratedCamera, PiVideo
+from ..Camera.frame import Frame, FramePool
+from .tracking_engine import TrackingEngine
 import time
 
 
@@ -51,12 +63,31 @@ PAN_SERVO_PIN, TILT_SERVO_PIN = 17, 27
 ARUCO_DICT_TYPE = cv2.aruco.DICT_5X5_1000
 MARKER_LENGTH = 0.033 # meters
 MARKER_ID = 5     # ID of the marker to track
+MARKER_IDS = FIELD_MARKER_IDS  # Only these IDs of the dictionary are detected (None: all of them)
+# "points": detect on the raw frame and undistort only the marker corners (the frame is undistorted for the viewer only)
+# "frame": undistort the full frame and detect on it
+UNDISTORT_MODE = "points"
+ROI_SEARCH = True   # Search a window around the last marker position instead of the full frame
+ROI_MAX_MISSES = 3  # Misses in a row before going back to full frame scans
+FLOW_TRACKING = True  # Follow the marker corners with optical flow between full detections
+DETECT_EVERY = 4      # Frames per full detection while the flow keeps up
 TRACK_POINT = False # Whether to track an offset point
-marker_point = np.array([0.1, 0, 0, 1]).reshape(4, 1)  # Offset of the point to track in meters
+marker_point = np.array([0.1, 0, 0, 1])  # Offset of the point to track in meters
 
 # PID Controller parameters
-kp_pan, ki_pan, kd_pan = 0.5, 0.0, 0.5
-kp_tilt, ki_tilt, kd_tilt = 0.5, 0.0, 0.5
+# The controllers output servo rates (deg/s): Kp in 1/s, Ki in 1/s^2, Kd unitless
+kp_pan, ki_pan, kd_pan = 30.0, 0.0, 0.5
+kp_tilt, ki_tilt, kd_tilt = 30.0, 0.0, 0.5
+CONTROL_RATE = 100  # Hz, servo update rate, independent of the camera frame rate
+MAX_SERVO_RATE = 300.0  # deg/s, output clamp of the controllers
+MAX_INTEGRAL = 20.0     # deg*s, integrator clamp
+DERIVATIVE_TAU = 0.02   # s, derivative low-pass filter time constant
+SERVO_DEADBAND = 0.25   # deg, smaller changes are not written to the servos
+TARGET_PREDICTION = True  # Steer towards the target position predicted for now, not the last detection
+FRAME_LOG_INTERVAL = 1.0  # s, shortest time between two per-frame log messages
+PROFILE_OVERLAY = True    # Draw the per-stage latency percentiles on the viewer stream
+LUMA_CAPTURE = True       # Detect on the camera's Y plane, convert to BGR only for the viewers
+DETECT_SCALE = 0.5        # Detect on the camera's lores stream at this resolution, refine at full resolution (None: off)
 
 # ======================
 # Hardware Initialization
@@ -78,11 +109,26 @@ tilt_servo = AngularServo(
 pan_servo.angle = 0
 tilt_servo.angle = 0
 
+# Per-stage latency of the whole pipeline, from capture to the servo writes and the viewer stream
+profiler = StageProfiler()
 
+# The PWM writes go out from the driver's writer thread; the control loop only sets targets
+servo_driver = ServoDriver((pan_servo, tilt_servo), rate=CONTROL_RATE, deadband=SERVO_DEADBAND,
+                           profiler=profiler)
+pan_output, tilt_output = servo_driver.channels
 
-# Initialize PID controllers for pan and tilt
-pan_controller = PIDController(Kp=kp_pan, Ki=ki_pan, Kd=kd_pan)
-tilt_controller = PIDController(Kp=kp_tilt, Ki=ki_tilt, Kd=kd_tilt)
+
+
+# One PID controller for both axes (pan, tilt), clamped to the servo limits.
+# Pan turns the opposite way of its error, tilt the same way.
+controller = MultiAxisPID(
+    Kp=[kp_pan, kp_tilt], Ki=[ki_pan, ki_tilt], Kd=[kd_pan, kd_tilt],
+    position_limits=([PAN_MIN, TILT_MIN], [PAN_MAX, TILT_MAX]),
+    signs=[-1, 1],
+    output_limits=MAX_SERVO_RATE,
+    integral_limits=MAX_INTEGRAL,
+    derivative_tau=DERIVATIVE_TAU
+)
 
 # Store PID parameters in a configuration dictionary
 config = {
@@ -104,13 +150,11 @@ timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S").replace(":", "
 current_run = os.path.join(run_path, f"run_{timestamp}")
 os.makedirs(current_run,exist_ok=True)
 
-# Set up log file path and configure logging
+# Set up log file path and configure logging. The file is written by a background thread, and the
+# per-frame messages are rate limited (the per-frame numbers are in the telemetry CSV).
 log_file = os.path.join(current_run, f"Vs_Motion_{timestamp}.log")
-logging.basicConfig(
-    filename=log_file,
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-)
+setup_logging(log_file, level=logging.INFO)
+frame_log = RateLimitedLogger(interval=FRAME_LOG_INTERVAL)
 logging.info("Logging system initialized.")
 
 # Log the running parameters for reference
@@ -120,8 +164,9 @@ Pan and Tilt Mechanism:
 Current Date: {timestamp}
 
 {'-' * msg_n} Running Parameters {'-' * msg_n}
-Pan Servo: Pin {PAN_SERVO_PIN}, PID Values: {pan_controller.get_specs()}, Angle Range {PAN_MIN}-{PAN_MAX}, Current Angle {tilt_servo.angle}
-Tilt Servo: Pin {TILT_SERVO_PIN}, PID Values: {tilt_controller.get_specs()}, Angle Range {TILT_MIN}-{TILT_MAX}, Current Angle {pan_servo.angle}
+Pan Servo: Pin {PAN_SERVO_PIN}, Angle Range {PAN_MIN}-{PAN_MAX}, Current Angle {pan_servo.angle}
+Tilt Servo: Pin {TILT_SERVO_PIN}, Angle Range {TILT_MIN}-{TILT_MAX}, Current Angle {tilt_servo.angle}
+PID Values (pan, tilt): {controller.get_specs()}
 
 Tracking Point: {TRACK_POINT}
 {'-' * (msg_n * 2)}
@@ -189,135 +234,163 @@ def plot_data(fname, config, path_to_save=current_run):
 # Main Application Function
 # ========================
 
+class MarkerTrackingEngine(TrackingEngine):
+    """
+    Detects the ArUco marker on its own thread, for every camera frame, independently of the HTTP
+    viewers, and feeds the errors to the fixed-rate servo control loop. The run data is saved and plotted when the engine stops.
+    """
+
+    def __init__(self, stream_instance):
+        super().__init__(stream_instance, name="MarkerTrackingEngine", profiler=profiler)
+        self.calibrated_camera = stream_instance.calibrated_camera
+
+        # Run data, appended to the CSV in chunks while tracking
+        self.data_file = os.path.join(current_run, 'data_pan.csv')
+        self.telemetry = TelemetryRecorder(
+            self.data_file, ["Time", "Pan_Error", "Pan_Angle", "Tilt_Error", "Tilt_Angle"]
+        )
+
+        # Build the detector once and reuse it for every frame
+        self.detector = get_detector(ARUCO_DICT_TYPE, marker_ids=MARKER_IDS)
+        # Buffers for the derived views (gray, ...) of every frame, shared by the detection stages
+        self.frame_pool = FramePool()
+        # Search only around the last position of the tracked marker once it is found
+        self.marker_search = RoiMarkerSearch(self.detector, marker_id=MARKER_ID, max_misses=ROI_MAX_MISSES,
+                                             detect_scale=DETECT_SCALE)
+        # Between full detections, propagate the tracked marker's corners with optical flow
+        self.marker_tracker = HybridMarkerTracker(
+            self.detector, marker_id=MARKER_ID, detect_every=DETECT_EVERY,
+            marker_search=self.marker_search if ROI_SEARCH else None, detect_scale=DETECT_SCALE
+        )
+
+        # The servos are driven by their own fixed-rate loop, detection only feeds it measurements
+        self.control = ControlLoop(
+            (pan_output, tilt_output), controller, rate=CONTROL_RATE, telemetry=self.telemetry,
+            estimator=TargetEstimator(n_axes=2) if TARGET_PREDICTION else None, profiler=profiler
+        )
+
+    def start(self):
+        """Start the servo driver and the control loop, then the detection thread."""
+        servo_driver.start()
+        self.control.start()
+        return super().start()
+
+    def process(self, seq, raw_frame, timestamp, annotate):
+        """Detect the marker, update the servos and draw the annotated frame if a viewer is watching."""
+        calibrated_camera = self.calibrated_camera
+        profiler = self.profiler
+
+        # With LUMA_CAPTURE the stream publishes YuvFrames: their gray view is the Y plane, and the BGR
+        # image is only converted below, for the viewers or frame mode
+        if isinstance(raw_frame, Frame):
+            source = raw_frame
+        else:
+            source = Frame(raw_frame, timestamp, seq, calibrated_camera=calibrated_camera, pool=self.frame_pool)
+
+        # Undistort the full frame only for the viewers (or when detecting on it), straight into
+        # the annotation buffer so drawing on it leaves the camera ring untouched
+        frame = None
+        view_ns = 0  # Viewer-only work, counted as annotation
+        if UNDISTORT_MODE == "frame" or annotate:
+            _, _, w, h = calibrated_camera.roi
+            start = perf_counter_ns()
+            image = source.image
+            frame = calibrated_camera.undistort_frame(
+                image, dst=self.annotation_buffer((h, w) + image.shape[2:], image.dtype)
+            )
+            if UNDISTORT_MODE == "frame":
+                profiler.record("undistort", perf_counter_ns() - start)
+            else:
+                view_ns = perf_counter_ns() - start
+
+        # Marker detection using the predefined ArUco dictionary. In "points" mode detect on the
+        # raw sensor frame and undistort only the marker corners. The Frame converts to gray once for
+        # every detection stage.
+        if UNDISTORT_MODE == "points":
+            search_frame = source
+        else:
+            search_frame = Frame(frame, timestamp, seq, pool=self.frame_pool)
+        with profiler.span("detect"):
+            if FLOW_TRACKING:
+                marker_array = self.marker_tracker.track(search_frame, timestamp)
+            elif ROI_SEARCH:
+                marker_array = self.marker_search.detect(search_frame, timestamp)
+            else:
+                marker_array = find_marker(search_frame, detector=self.detector, scale=DETECT_SCALE)
+        if UNDISTORT_MODE == "points" and marker_array:
+            with profiler.span("undistort"):
+                corners = calibrated_camera.undistort_points(
+                    np.array([marker for marker, _ in marker_array])
+                )
+            marker_array = [(corner, marker_id) for corner, (_, marker_id) in zip(corners, marker_array)]
+
+        if marker_array:
+            # Estimate every marker pose in one batch. Corners are in undistorted image coordinates
+            # in both modes, so the pose uses the undistorted intrinsics and no distortion.
+            with profiler.span("pose"):
+                poses = estimate_poses(
+                    [marker for marker, _ in marker_array],
+                    calibrated_camera.roi_cam_mtx,
+                    calibrated_camera.undistorted_dist,
+                    marker_length=MARKER_LENGTH,
+                    target_point=marker_point if TRACK_POINT else None
+                )
+
+            # Only the tracked marker drives the servos
+            ids = np.array([int(marker_id) for _, marker_id in marker_array])
+            tracked = np.flatnonzero(ids == MARKER_ID)
+            if tracked.size:
+                i = tracked[0]
+                pan_error, tilt_error = poses.pan_errors[i], poses.tilt_errors[i]
+
+                # Hand the measurement to the control loop, with the capture time of the frame
+                self.control.update(pan_error, tilt_error, timestamp=timestamp)
+
+                frame_log.info("Pan Error: %.2f, Tilt Error: %.2f | Pan Angle: %s, Tilt Angle: %s",
+                               pan_error, tilt_error, pan_output.angle, tilt_output.angle)
+
+        if not annotate:
+            return None
+
+        start = perf_counter_ns()
+        if marker_array:
+            render_markers(frame, marker_array, poses, calibrated_camera.roi_cam_mtx,
+                           calibrated_camera.undistorted_dist, MARKER_LENGTH)
+        # Draw a marker at the center of the frame
+        center = (frame.shape[1] // 2, frame.shape[0] // 2)
+        draw_center_frame(frame, center)
+        if PROFILE_OVERLAY:
+            profiler.draw(frame)
+        profiler.record("annotate", view_ns + perf_counter_ns() - start)
+        return frame
+
+    def finish(self):
+        """Stop the control loop and the servo driver, then save and plot the run data."""
+        self.control.stop()
+        servo_driver.stop()
+        self.telemetry.close()
+        logging.info(f"Saved data at: {self.data_file}")
+        plot_data(self.data_file, config, current_run)
+
+
 def main(stream_instance):
     """
-    Main function to start the Flask app and process the video stream.
-    
+    Main function to start the tracking engine and the Flask app that streams its annotated frames.
+
+    Tracking runs on its own thread from the start, whether or not a browser is connected; viewers only
+    receive the annotated frames.
+
     Parameters:
       - stream_instance: Instance of the video stream.
-    
+
     Returns:
-      - Flask app instance.
+      - Flask app instance, with the running engine as `app.tracking_engine`.
     """
     print("Starting Full Pan–Tilt Tracking")
     app = Flask(__name__)
 
-    def motion_track():
-        """
-        Generator function that processes the video stream, performs marker detection, 
-        applies PID control to adjust servo angles, and streams the output.
-        """
-        start_time = time.time()
-
-        # Start the video stream and log the client connection
-        stream_instace = stream_instance.start()
-        with stream_instance.clients_lock:
-            stream_instance.clients += 1
-            logging.info(f"Client connected. Total clients: {stream_instance.clients}")
-
-        # Initialize an empty data array to store run data
-        data_array = np.empty((0, 5))
-
-        try:
-            while True:
-                frame_data = None
-
-                # Safely retrieve the latest frame from the stream
-                with stream_instance.lock:
-                    if stream_instance.frame_buffer is not None:
-                        frame_data = stream_instance.frame_buffer
-
-                if frame_data is not None:
-                    # Convert byte data to a NumPy array and decode the image
-                    nparr = np.frombuffer(frame_data, dtype=np.uint8)
-                    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-                    # Undistort the frame using the calibrated camera settings
-                    frame = stream_instace.calibrated_camera.undistort_frame(frame)
-
-                    if frame is not None:
-                        elapsed_time = time.time() - start_time
-                        width = stream_instance.width
-                        height = stream_instance.height
-                        center = (width // 2, height // 2)
-
-                        # Draw a marker at the center of the frame
-                        draw_center_frame(frame, center)
-
-                        # Marker detection using the predefined ArUco dictionary
-                        aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT_TYPE)
-                        parameters = cv2.aruco.DetectorParameters()
-                        marker_array = find_marker(frame, aruco_dict, parameters)
-
-                        if marker_array:
-                            for marker, marker_id in marker_array:
-                                # Track and render the marker, obtaining the transformation matrix
-                                transformation_matrix = track_and_render_marker(
-                                    frame,
-                                    marker,
-                                    marker_id,
-                                    camera_matrix=stream_instace.camera_matrix,
-                                    distortion_coefficient=stream_instace.camera_dist,
-                                    marker_length=MARKER_LENGTH
-                                )
-
-                                # Optionally compute an offset point transformation if tracking a point
-                                if TRACK_POINT:
-                                    T0point = transformation_matrix @ marker_point
-                                    tvec = T0point[:-1, -1]
-                                else:
-                                    tvec = transformation_matrix[:-1, -1]
-
-                                x, y, z = tvec
-
-                                # Compute pan error and apply PID correction
-                                pan_error = np.degrees(np.arctan2(x, z))
-                                current_pan = pan_servo.angle if pan_servo.angle is not None else 0
-                                pan_correction = pan_controller.compute(pan_error, elapsed_time)
-                                new_pan = np.clip(current_pan - pan_correction, PAN_MIN, PAN_MAX)
-                                pan_servo.angle = new_pan
-
-                                # Compute tilt error and apply PID correction
-                                tilt_error = np.degrees(np.arctan2(y, z))
-                                current_tilt = tilt_servo.angle if tilt_servo.angle is not None else 0
-                                tilt_correction = tilt_controller.compute(tilt_error, elapsed_time)
-                                new_tilt = np.clip(current_tilt + tilt_correction, TILT_MIN, TILT_MAX)
-                                tilt_servo.angle = new_tilt
-
-                                logging.info(f"Time: {time.time():.2f}s | Pan Error: {pan_error:.2f}, Tilt Error: {tilt_error:.2f}")
-                                logging.info(f"Pan Angle: {pan_servo.angle}, Tilt Angle: {tilt_servo.angle}")
-
-                                # Log the data: elapsed time, pan error, new pan angle, tilt error, new tilt angle
-                                data_entry = np.array([[elapsed_time, pan_error, new_pan, tilt_error, new_tilt]])
-                                data_array = np.vstack((data_array, data_entry))
-
-                    # Re-encode the processed frame to JPEG bytes
-                    ret, jpeg = cv2.imencode('.jpg', frame)
-                    if ret:
-                        frame_data = jpeg.tobytes()
-                    else:
-                        logging.error("Failed to encode frame to JPEG")
-                        continue
-
-                    # Yield the frame data formatted for streaming
-                    yield (b'--frame\r\n'
-                        b'Content-Type: image/jpeg\r\n\r\n' + frame_data + b'\r\n\r\n')
-
-                # Maintain the desired frame rate
-                sleep(1 / stream_instance.framerate)
-        except KeyboardInterrupt:
-            logging.info("Ctrl-C detected. Exiting gracefully...")
-        finally:
-            # On exit, decrement the client count and save run data
-            with stream_instance.clients_lock:
-                stream_instance.clients -= 1
-                logging.info(f"Client disconnected. Remaining clients: {stream_instance.clients}")
-
-            fname = os.path.join(current_run, 'data_pan.csv')
-            np.savetxt(fname, data_array, delimiter=",",
-                    header="Time,Pan_Error,Pan_Angle,Tilt_Error,Tilt_Angle", comments="", fmt="%.5f")
-            logging.info(f"Saved data at: {fname}")
-            plot_data(fname, config, current_run)
+    engine = MarkerTrackingEngine(stream_instance.start()).start()
+    app.tracking_engine = engine
 
     # ---------------------
     # Flask Routes
@@ -327,7 +400,7 @@ def main(stream_instance):
     def video_feed():
         """Route to access the video stream."""
         return Response(
-            motion_track(),
+            engine.mjpeg_frames(),
             mimetype='multipart/x-mixed-replace; boundary=frame'
         )
 
@@ -383,9 +456,16 @@ if __name__ == "__main__":
         calibrated_camera=calibrated_camera,
         framerate=60,
         brightness=0.0,
-        contrast=1.0
+        contrast=1.0,
+        lazy_color=LUMA_CAPTURE,
+        lores_scale=DETECT_SCALE
     ).start()
 
     # Create and run the Flask application
     app = main(stream)
-    app.run(host='0.0.0.0', port=5000)
+    try:
+        app.run(host='0.0.0.0', port=5000, threaded=True)
+    finally:
+        # Stops tracking and saves the run data
+        app.tracking_engine.stop()
+        stream.stop()
@@ -0,0 +1,365 @@
+"""
+servo_driver.py
+
+Servo output driver: angle targets in from any thread, PWM writes out from one writer thread.
+
+Setting `servo.angle` on a gpiozero AngularServo backed by pigpio is a round trip to the pigpio daemon.
+Doing it from the detection thread for every frame puts that latency on the vision hot path, and most of
+those writes move the servo by less than it can resolve. The ServoDriver takes the targets instead:
+
+- Targets are latest-value: a target that is replaced before the writer gets to it is simply dropped
+  (coalesced), setting one never blocks on the GPIO.
+- A writer thread wakes up at a fixed rate and writes each servo whose target moved by more than the
+  deadband since its last write.
+- An optional slew limit (deg/s) bounds how far a servo is commanded per write.
+
+`driver.channels` has one object per servo with an `angle` attribute, so the driver drops in wherever a
+servo is expected (e.g. the ControlLoop). Reading `angle` returns the latest target without touching the
+GPIO.
+
+CountingMockFactory is a gpiozero mock pin factory that counts and times the PWM writes, optionally with
+an artificial write latency, to measure the driver off the Pi.
+
+Usage:
+    driver = ServoDriver((pan_servo, tilt_servo), rate=100, deadband=0.25).start()
+    pan, tilt = driver.channels
+    pan.angle = new_pan          # or driver.set(new_pan, new_tilt)
+    ...
+    driver.stop()
+
+    python -m src.ServoController.servo_driver --latency 0.0001
+
+Dependencies: argparse, logging, threading, time, numpy, gpiozero
+"""
+
+import argparse
+import logging
+import threading
+from time import monotonic, perf_counter_ns, sleep
+
+import numpy as np
+from gpiozero import AngularServo
+from gpiozero.pins.mock import MockFactory, MockPWMPin
+
+
+class ServoChannel:
+    """One servo of a ServoDriver, with the `angle` attribute of a gpiozero servo."""
+
+    def __init__(self, driver, index):
+        self.driver = driver
+        self.index = index
+
+    @property
+    def angle(self):
+        """The latest target angle (not read back from the GPIO)."""
+        return self.driver.targets[self.index]
+
+    @angle.setter
+    def angle(self, value):
+        self.driver.set_angle(self.index, value)
+
+
+class ServoDriver:
+    def __init__(self, servos, rate=100.0, deadband=0.25, slew_rate=None, profiler=None, name="ServoDriver"):
+        """
+        Parameters:
+        - servos (sequence): The servos (gpiozero AngularServo or anything with an `angle` attribute).
+        - rate (float): Write rate in Hz.
+        - deadband (float or sequence): Smallest change in degrees worth writing, per servo or for all.
+        - slew_rate (float or sequence, optional): Maximum commanded speed in deg/s, per servo or for all.
+        - profiler (StageProfiler, optional): Receives every write as the "servo_write" stage.
+        - name (str): Name of the writer thread.
+        """
+        self.servos = tuple(servos)
+        n = len(self.servos)
+        self.period = 1.0 / rate
+        self.deadband = np.broadcast_to(np.asarray(deadband, dtype=np.float64), (n,)).copy()
+        self.slew_rate = (np.broadcast_to(np.asarray(slew_rate, dtype=np.float64), (n,)).copy()
+                          if slew_rate is not None else None)
+        self.profiler = profiler
+        self.name = name
+
+        # Angle limits of each servo, targets are clamped to them
+        self.min_angle = [getattr(servo, "min_angle", -np.inf) for servo in self.servos]
+        self.max_angle = [getattr(servo, "max_angle", np.inf) for servo in self.servos]
+
+        self.lock = threading.Lock()
+        self.targets = [servo.angle for servo in self.servos]
+        self.written = list(self.targets)
+        self.dirty = [False] * n  # Target changed since the writer last looked at it
+
+        self.channels = tuple(ServoChannel(self, i) for i in range(n))
+
+        # Counters and the duration of the last writes (up to 1024)
+        self.sets = 0
+        self.coalesced = 0
+        self.writes = 0
+        self.skipped = 0
+        self.write_ns = np.zeros(1024, dtype=np.int64)
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def set_angle(self, index, angle):
+        """
+        Set the target angle of one servo. Never blocks on the GPIO.
+
+        Parameters:
+        - index (int): Index of the servo.
+        - angle (float): Target angle in degrees, clamped to the servo limits. None releases the servo.
+        """
+        if angle is not None:
+            angle = float(min(max(angle, self.min_angle[index]), self.max_angle[index]))
+        with self.lock:
+            self.sets += 1
+            if self.dirty[index]:
+                self.coalesced += 1
+            self.targets[index] = angle
+            self.dirty[index] = True
+
+    def set(self, *angles):
+        """Set the target angles of all servos at once, in servo order."""
+        if len(angles) != len(self.servos):
+            raise ValueError(f"Expected {len(self.servos)} angles, got {len(angles)}.")
+        for index, angle in enumerate(angles):
+            self.set_angle(index, angle)
+
+    def start(self):
+        """Start the writer thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Stop the writer thread, write the final targets and log the statistics."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        # The last targets go out regardless of the deadband and slew limit
+        self.step(None, final=True)
+        logging.info(f"{self.name} stopped. {self.format_stats()}")
+
+    def step(self, dt, final=False):
+        """
+        Write every servo whose target moved by more than its deadband. Runs on the writer thread.
+
+        Parameters:
+        - dt (float): Time since the previous step in seconds, for the slew limit.
+        - final (bool): Write the exact targets, ignoring the deadband and slew limit.
+        """
+        with self.lock:
+            targets = list(self.targets)
+            self.dirty = [False] * len(self.servos)
+
+        for i, (servo, target, written) in enumerate(zip(self.servos, targets, self.written)):
+            if target == written:
+                continue
+            angle = target
+            if target is not None and written is not None and not final:
+                # The deadband applies to the distance to the target, not to the slew-limited step,
+                # otherwise a slew limit below the deadband would never move the servo
+                change = target - written
+                if abs(change) < self.deadband[i]:
+                    self.skipped += 1
+                    continue
+                if self.slew_rate is not None and dt:
+                    limit = self.slew_rate[i] * dt
+                    change = min(max(change, -limit), limit)
+                angle = written + change
+
+            start = perf_counter_ns()
+            try:
+                servo.angle = angle
+            except Exception as e:
+                logging.error(f"{self.name}: failed to write servo {i}: {e}")
+                continue
+            duration = perf_counter_ns() - start
+            self.write_ns[self.writes % len(self.write_ns)] = duration
+            if self.profiler is not None:
+                self.profiler.record("servo_write", duration)
+            self.writes += 1
+            self.written[i] = angle
+
+    def _run(self):
+        """Fixed-rate write loop on the monotonic clock."""
+        last = monotonic()
+        next_time = last + self.period
+        while not self.stop_event.is_set():
+            delay = next_time - monotonic()
+            if delay > 0:
+                sleep(delay)
+            now = monotonic()
+            dt = now - last
+            last = now
+
+            self.step(dt)
+
+            # Skip the missed steps instead of bursting to catch up
+            next_time += self.period
+            if next_time < monotonic():
+                next_time = monotonic() + self.period
+
+    def stats(self):
+        """
+        Write statistics.
+
+        Returns:
+        - dict: sets, coalesced (targets replaced before being written), writes, skipped (within the
+          deadband), and the mean, p99 and max write time over the last writes (up to 1024) in microseconds.
+        """
+        stats = {"sets": self.sets, "coalesced": self.coalesced, "writes": self.writes, "skipped": self.skipped}
+        write_ns = self.write_ns[:min(self.writes, len(self.write_ns))]
+        if len(write_ns):
+            stats.update(mean_us=write_ns.mean() / 1e3, p99_us=np.percentile(write_ns, 99) / 1e3,
+                         max_us=write_ns.max() / 1e3)
+        return stats
+
+    def format_stats(self):
+        """Write statistics as one log line."""
+        stats = self.stats()
+        line = (f"Targets: {stats['sets']}, Coalesced: {stats['coalesced']}, Writes: {stats['writes']}, "
+                f"Skipped (deadband): {stats['skipped']}")
+        if "mean_us" in stats:
+            line += (f", Write time mean: {stats['mean_us']:.1f} us, P99: {stats['p99_us']:.1f} us, "
+                     f"Max: {stats['max_us']:.1f} us")
+        return line
+
+
+# ========================
+# Mock GPIO Backend
+# ========================
+
+class CountingPWMPin(MockPWMPin):
+    """Mock PWM pin that counts and times its writes. The factory's write_latency is added to each write."""
+
+    def __init__(self, factory, info):
+        super().__init__(factory, info)
+        self.writes = 0
+        self.write_ns = 0
+
+    def _set_state(self, value):
+        start = perf_counter_ns()
+        if self.factory.write_latency:
+            sleep(self.factory.write_latency)
+        super()._set_state(value)
+        self.writes += 1
+        self.write_ns += perf_counter_ns() - start
+
+
+class CountingMockFactory(MockFactory):
+    """gpiozero mock pin factory whose PWM pins count and time their writes."""
+
+    def __init__(self, write_latency=0.0, revision=None):
+        """
+        Parameters:
+        - write_latency (float): Seconds each PWM write takes, e.g. the pigpio daemon round trip.
+        - revision (str, optional): Pi revision to pretend to be.
+        """
+        super().__init__(revision=revision, pin_class=CountingPWMPin)
+        self.write_latency = write_latency
+
+    def write_counts(self):
+        """
+        Returns:
+        - dict: (writes, total write time in seconds) per pin name.
+        """
+        return {str(pin): (pin.writes, pin.write_ns / 1e9)
+                for pin in self.pins.values() if isinstance(pin, CountingPWMPin)}
+
+
+# ========================
+# Benchmark
+# ========================
+
+def slew_check(rate, deadband, slew_rate, move=30.0, timeout=10.0):
+    """
+    Step a driver by hand through a slew-limited move on a mock servo and check that it reaches the target.
+
+    Parameters:
+    - rate (float): Driver write rate in Hz, the step dt is 1 / rate.
+    - deadband (float): Driver deadband in degrees.
+    - slew_rate (float): Slew limit in deg/s.
+    - move (float): Size of the move in degrees.
+    - timeout (float): Simulated seconds after which the move counts as stuck.
+
+    Returns:
+    - tuple: (simulated seconds to get within the deadband of the target, final angle)
+    """
+    factory = CountingMockFactory()
+    servo = AngularServo(17, min_angle=-135, max_angle=135, initial_angle=0, pin_factory=factory)
+    driver = ServoDriver([servo], rate=rate, deadband=deadband, slew_rate=slew_rate)
+    driver.set_angle(0, move)
+    steps = 0
+    while abs(move - driver.written[0]) >= deadband and steps < timeout * rate:
+        driver.step(1.0 / rate)
+        steps += 1
+    final = driver.written[0]
+    servo.close()
+    if abs(move - final) >= deadband:
+        raise RuntimeError(f"Slewed move stuck at {final:.2f} deg of {move:.2f} deg "
+                           f"(slew {slew_rate} deg/s, deadband {deadband} deg).")
+    return steps / rate, final
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare direct servo writes with the ServoDriver on mock pins.")
+    parser.add_argument("--duration", type=float, default=3.0, help="Seconds per run")
+    parser.add_argument("--fps", type=float, default=60.0, help="Rate of the new targets (frames per second)")
+    parser.add_argument("--latency", type=float, default=0.0001, help="Mock PWM write latency in seconds")
+    parser.add_argument("--rate", type=float, default=50.0, help="Driver write rate in Hz")
+    parser.add_argument("--deadband", type=float, default=0.25, help="Driver deadband in degrees")
+    parser.add_argument("--slew-rate", type=float, default=10.0, help="Slew limit in deg/s for the slewed move check")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    n_frames = int(args.duration * args.fps)
+    t = np.arange(n_frames) / args.fps
+    # A slowly moving target with measurement noise, like the tracking output
+    targets = np.column_stack((20 * np.sin(2 * np.pi * t / 4), 10 * np.sin(2 * np.pi * t / 3)))
+    targets += rng.normal(0.0, 0.1, targets.shape)
+
+    def run(use_driver):
+        factory = CountingMockFactory(write_latency=args.latency)
+        servos = (AngularServo(17, min_angle=-135, max_angle=135, pin_factory=factory),
+                  AngularServo(27, min_angle=-90, max_angle=90, pin_factory=factory))
+        writes_before = sum(writes for writes, _ in factory.write_counts().values())
+        driver = ServoDriver(servos, rate=args.rate, deadband=args.deadband).start() if use_driver else None
+        outputs = driver.channels if use_driver else servos
+
+        caller_ns = 0
+        start = monotonic()
+        for k, (pan, tilt) in enumerate(targets):
+            # Pace the targets like camera frames
+            delay = start + k / args.fps - monotonic()
+            if delay > 0:
+                sleep(delay)
+            begin = perf_counter_ns()
+            outputs[0].angle = pan
+            outputs[1].angle = tilt
+            caller_ns += perf_counter_ns() - begin
+
+        if driver is not None:
+            driver.stop()
+        writes = sum(writes for writes, _ in factory.write_counts().values()) - writes_before
+        for servo in servos:
+            servo.close()
+        return caller_ns / n_frames / 1e3, writes, driver
+
+    print(f"{n_frames} frames at {args.fps:.0f} fps, mock write latency {args.latency * 1e6:.0f} us")
+    direct_us, direct_writes, _ = run(False)
+    driver_us, driver_writes, driver = run(True)
+    print(f"{'':28}{'direct':>12}{'driver':>12}")
+    print(f"{'caller time per frame (us)':28}{direct_us:12.1f}{driver_us:12.1f}")
+    print(f"{'PWM writes':28}{direct_writes:12d}{driver_writes:12d}")
+    print(driver.format_stats())
+
+    # At the default 10 deg/s and 50 Hz a step is 0.2 deg, below the deadband
+    seconds, final = slew_check(args.rate, args.deadband, args.slew_rate)
+    print(f"Slewed 30 deg move at {args.slew_rate:g} deg/s: reached {final:.2f} deg in {seconds:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
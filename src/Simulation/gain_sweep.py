@@ -0,0 +1,390 @@
+"""
+gain_sweep.py
+
+Search PID gains on the simulated pan/tilt plant.
+
+Candidate (Kp, Ki, Kd) gains come from a grid or a random sample. Every candidate is simulated on every
+trajectory at once: the runs of a chunk of candidates are one batch of the plant (one MultiAxisPID row
+per run), and the chunks are spread over a process pool. The two axes do not interact in the plant, so
+every run tries the candidate on pan and tilt at the same time and each axis gets its own ranking.
+
+Each candidate is scored per axis by (averaged over the trajectories, on the true tracking error, after
+the target starts moving):
+- RMS error in degrees.
+- Overshoot: how far the servo goes past the range of the target, in degrees.
+- Settling time: seconds until the error stays within the tolerance for the rest of the run (inf if it
+  never does, which is common on trajectories that keep moving such as sine, so the default sweep uses
+  step and ramp).
+- Travel: total servo travel in degrees, a proxy for wear and jitter.
+
+The ranked tables (sweep_pan.csv, sweep_tilt.csv) and the Pareto-front plots (pareto_pan.png,
+pareto_tilt.png) are written to the run directory. The hand-picked gains of the tracking scripts are
+always included, so their rank shows in the log.
+
+Usage:
+    python -m src.Simulation.gain_sweep --law rate --samples 2000 --trajectories step ramp sine
+
+Dependencies: argparse, concurrent.futures, dataclasses, datetime, logging, os, time, numpy,
+              matplotlib (for the plots)
+"""
+
+import argparse
+import datetime
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from time import perf_counter
+
+import numpy as np
+
+from ..PID import MultiAxisPID
+from ..logging_utils import setup_logging
+from .pan_tilt_plant import (PanTiltPlant, ServoModel, CameraModel, simulate, trajectory, TRAJECTORIES,
+                             DEFAULT_GAINS, PAN_MIN, PAN_MAX, TILT_MIN, TILT_MAX, SIGNS,
+                             MAX_SERVO_RATE, MAX_INTEGRAL, DERIVATIVE_TAU)
+
+METRICS = ["RMS", "Overshoot", "Settling_Time", "Travel"]
+TABLE_COLUMNS = ["Rank", "Candidate", "Kp", "Ki", "Kd"] + METRICS + ["Pareto"]
+
+# Default search ranges (low, high) of Kp, Ki, Kd per control law
+DEFAULT_RANGES = {
+    "frame": ((0.05, 0.6), (0.0, 1.0), (0.0, 0.02)),
+    "rate": ((5.0, 60.0), (0.0, 20.0), (0.0, 1.5)),
+}
+
+
+@dataclass
+class SweepSettings:
+    """Everything a worker needs to evaluate candidates (sent to the worker processes)."""
+    law: str = "rate"
+    trajectories: tuple = ("step", "ramp")
+    amplitude: tuple = (20.0, 10.0)
+    period: float = 4.0
+    start: float = 0.5
+    duration: float = 10.0
+    control_rate: float = 100.0
+    camera: CameraModel = field(default_factory=CameraModel)
+    servo: ServoModel = field(default_factory=ServoModel)
+    tolerance: float = 1.0
+    seed: int = 0
+
+
+def candidate_grid(ranges, points):
+    """
+    Every combination of evenly spaced gains.
+
+    Parameters:
+    - ranges (tuple): (low, high) of Kp, Ki and Kd.
+    - points (int): Values per gain.
+
+    Returns:
+    - numpy.ndarray: Candidates, shape (points**3, 3).
+    """
+    axes = [np.linspace(low, high, points) for low, high in ranges]
+    return np.stack(np.meshgrid(*axes, indexing="ij"), axis=-1).reshape(-1, 3)
+
+
+def candidate_sample(ranges, samples, seed=None):
+    """
+    Uniformly sampled gains.
+
+    Parameters:
+    - ranges (tuple): (low, high) of Kp, Ki and Kd.
+    - samples (int): Number of candidates.
+    - seed (int, optional): Seed of the sample.
+
+    Returns:
+    - numpy.ndarray: Candidates, shape (samples, 3).
+    """
+    low, high = np.array(ranges, dtype=np.float64).T
+    return np.random.default_rng(seed).uniform(low, high, (samples, 3))
+
+
+def batch_controller(law, gains):
+    """
+    One MultiAxisPID for a batch of runs.
+
+    Parameters:
+    - law (str): "frame" or "rate".
+    - gains (numpy.ndarray): (Kp, Ki, Kd) of every run and axis, shape (n_runs, 2, 3).
+
+    Returns:
+    - MultiAxisPID: Without limits for the frame law (the same as a PIDController per axis and run), with
+      the limits of vs_motion.py for the rate law.
+    """
+    kp, ki, kd = gains[..., 0], gains[..., 1], gains[..., 2]
+    if law == "frame":
+        return MultiAxisPID(kp, ki, kd)
+    return MultiAxisPID(
+        kp, ki, kd,
+        position_limits=([PAN_MIN, TILT_MIN], [PAN_MAX, TILT_MAX]),
+        signs=SIGNS,
+        output_limits=MAX_SERVO_RATE,
+        integral_limits=MAX_INTEGRAL,
+        derivative_tau=DERIVATIVE_TAU
+    )
+
+
+def score(result, start, tolerance):
+    """
+    Tracking metrics of every run and axis.
+
+    Parameters:
+    - result (SimulationResult): The simulation result.
+    - start (float): Time the target starts moving; earlier samples are ignored.
+    - tolerance (float): Error band for the settling time in degrees.
+
+    Returns:
+    - numpy.ndarray: METRICS of every run and axis, shape (n_runs, 2, 4).
+    """
+    moving = result.time >= start
+    time = result.time[moving]
+    targets = result.targets[moving]
+    positions = result.positions[moving]
+    error = targets - positions
+
+    rms = np.sqrt(np.mean(error ** 2, axis=0))
+    overshoot = np.maximum(np.maximum(positions - targets.max(axis=0),
+                                      targets.min(axis=0) - positions).max(axis=0), 0.0)
+    travel = np.abs(np.diff(positions, axis=0)).sum(axis=0)
+
+    # Settling time: first sample after the last one outside the tolerance band
+    outside = np.abs(error) > tolerance
+    last_outside = len(time) - 1 - np.argmax(outside[::-1], axis=0)
+    settled = np.minimum(last_outside + 1, len(time) - 1)
+    settling = np.where(outside.any(axis=0), time[settled] - start, 0.0)
+    settling = np.where(outside[-1], np.inf, settling)
+
+    return np.stack((rms, overshoot, settling, travel), axis=-1)
+
+
+def evaluate(candidates, settings):
+    """
+    Simulate a chunk of candidates on every trajectory. Runs in the worker processes.
+
+    Parameters:
+    - candidates (numpy.ndarray): (Kp, Ki, Kd) candidates, shape (n_candidates, 3).
+    - settings (SweepSettings): The sweep settings.
+
+    Returns:
+    - numpy.ndarray: METRICS of every candidate and axis averaged over the trajectories,
+      shape (n_candidates, 2, 4).
+    """
+    n_candidates, n_trajectories = len(candidates), len(settings.trajectories)
+    targets = [trajectory(name, settings.amplitude, settings.period, settings.start)
+               for name in settings.trajectories]
+
+    # Runs are candidate-major: run = candidate * n_trajectories + trajectory
+    gains = np.repeat(np.repeat(candidates[:, None, :], 2, axis=1), n_trajectories, axis=0)
+
+    def target(t):
+        return np.tile(np.stack([f(t) for f in targets]), (n_candidates, 1))
+
+    plant = PanTiltPlant(
+        pan=ServoModel(settings.servo.max_rate, settings.servo.time_constant, settings.servo.deadband,
+                       PAN_MIN, PAN_MAX),
+        tilt=ServoModel(settings.servo.max_rate, settings.servo.time_constant, settings.servo.deadband,
+                        TILT_MIN, TILT_MAX),
+        camera=settings.camera,
+        n_runs=n_candidates * n_trajectories,
+        seed=settings.seed
+    )
+    with np.errstate(over="ignore", invalid="ignore"):
+        result = simulate(batch_controller(settings.law, gains), plant, target, settings.duration,
+                          law=settings.law, control_rate=settings.control_rate)
+        metrics = score(result, settings.start, settings.tolerance)
+    # Diverged runs score as badly as possible
+    metrics = np.where(np.isnan(metrics), np.inf, metrics)
+    return metrics.reshape(n_candidates, n_trajectories, 2, len(METRICS)).mean(axis=1)
+
+
+def run_sweep(candidates, settings, workers=None, chunk_size=64):
+    """
+    Evaluate all candidates, in chunks over a process pool.
+
+    Parameters:
+    - candidates (numpy.ndarray): (Kp, Ki, Kd) candidates, shape (n_candidates, 3).
+    - settings (SweepSettings): The sweep settings.
+    - workers (int, optional): Number of processes (default: one per CPU, 1 to run in this process).
+    - chunk_size (int): Candidates simulated together in one batch.
+
+    Returns:
+    - numpy.ndarray: METRICS of every candidate and axis, shape (n_candidates, 2, 4).
+    """
+    chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+    if workers == 1 or len(chunks) == 1:
+        results = [evaluate(chunk, settings) for chunk in chunks]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(evaluate, chunks, [settings] * len(chunks)))
+    return np.concatenate(results)
+
+
+def pareto_front(metrics):
+    """
+    Candidates that no other candidate beats on every metric.
+
+    Parameters:
+    - metrics (numpy.ndarray): Metrics to minimize, shape (n_candidates, n_metrics).
+
+    Returns:
+    - numpy.ndarray: True for the candidates on the Pareto front.
+    """
+    front = np.ones(len(metrics), dtype=bool)
+    for i, point in enumerate(metrics):
+        if not front[i]:
+            continue
+        dominated = np.all(metrics <= point, axis=1) & np.any(metrics < point, axis=1)
+        if dominated.any():
+            front[i] = False
+        else:
+            # Everything this candidate beats is off the front
+            front &= ~(np.all(point <= metrics, axis=1) & np.any(point < metrics, axis=1))
+    return front
+
+
+def ranked_table(candidates, metrics, rank_by="RMS"):
+    """
+    Candidates sorted by one metric, ties broken by the others in METRICS order.
+
+    Parameters:
+    - candidates (numpy.ndarray): (Kp, Ki, Kd) candidates, shape (n_candidates, 3).
+    - metrics (numpy.ndarray): METRICS of one axis, shape (n_candidates, 4).
+    - rank_by (str): Metric to rank by.
+
+    Returns:
+    - numpy.ndarray: Rows of TABLE_COLUMNS, best first.
+    """
+    primary = METRICS.index(rank_by)
+    keys = [metrics[:, m] for m in reversed(range(len(METRICS))) if m != primary] + [metrics[:, primary]]
+    order = np.lexsort(keys)
+    front = pareto_front(metrics)
+    return np.column_stack((np.arange(1, len(order) + 1), order, candidates[order], metrics[order],
+                            front[order]))
+
+
+def save_table(path, table):
+    """Save a ranked table as CSV."""
+    fmt = ["%d", "%d"] + ["%.5f"] * (3 + len(METRICS)) + ["%d"]
+    np.savetxt(path, table, delimiter=",", header=",".join(TABLE_COLUMNS), comments="", fmt=fmt)
+
+
+def plot_pareto(table, axis_name, path_to_save, law):
+    """
+    Plot RMS error against servo travel for every candidate, highlighting the Pareto front and the best.
+
+    Parameters:
+    - table (numpy.ndarray): Ranked table of one axis (see ranked_table).
+    - axis_name (str): "pan" or "tilt".
+    - path_to_save (str): Directory to save pareto_<axis_name>.png in.
+    - law (str): Control law, for the title.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    column = {name: i for i, name in enumerate(TABLE_COLUMNS)}
+    # Diverged candidates would squash the plot; the settling time may be inf for tracking trajectories
+    finite = np.all(np.isfinite(table[:, [column["RMS"], column["Overshoot"], column["Travel"]]]), axis=1)
+    rows = table[finite]
+    front = rows[rows[:, column["Pareto"]] == 1]
+
+    fig, ax = plt.subplots(figsize=(15, 8))
+    points = ax.scatter(rows[:, column["Travel"]], rows[:, column["RMS"]], c=rows[:, column["Overshoot"]],
+                        s=12, cmap="viridis", label="Candidates")
+    fig.colorbar(points, ax=ax, label="Overshoot (deg)")
+    ax.scatter(front[:, column["Travel"]], front[:, column["RMS"]], s=40, facecolors="none",
+               edgecolors="red", label="Pareto front")
+    best = table[0]
+    ax.annotate(f"Best: Kp {best[column['Kp']]:.3g}, Ki {best[column['Ki']]:.3g}, Kd {best[column['Kd']]:.3g}",
+                (best[column["Travel"]], best[column["RMS"]]), xytext=(10, 10), textcoords="offset points")
+    # Unstable candidates are orders of magnitude off, log axes keep the front readable
+    ax.set_xscale("log")
+    ax.set_yscale("log")
+    ax.set_xlabel("Servo Travel (deg)")
+    ax.set_ylabel("RMS Error (deg)")
+    ax.set_title(f"Gain Sweep - {axis_name.capitalize()} ({law} law)")
+    ax.legend()
+    fig.tight_layout()
+
+    plot_path = os.path.join(path_to_save, f"pareto_{axis_name}.png")
+    fig.savefig(plot_path)
+    plt.close(fig)
+    logging.info(f"{axis_name.capitalize()} Pareto plot saved at: {plot_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sweep PID gains on the simulated pan/tilt plant.")
+    parser.add_argument("--law", default="rate", choices=("frame", "rate"), help="Control law")
+    parser.add_argument("--trajectories", nargs="+", default=["step", "ramp"], choices=sorted(TRAJECTORIES))
+    parser.add_argument("--samples", type=int, default=1000, help="Number of random candidates")
+    parser.add_argument("--grid", type=int, help="Use a grid with this many values per gain instead")
+    parser.add_argument("--kp", type=float, nargs=2, metavar=("LOW", "HIGH"), help="Kp range")
+    parser.add_argument("--ki", type=float, nargs=2, metavar=("LOW", "HIGH"), help="Ki range")
+    parser.add_argument("--kd", type=float, nargs=2, metavar=("LOW", "HIGH"), help="Kd range")
+    parser.add_argument("--rank-by", default="RMS", choices=METRICS, help="Metric to rank by")
+    parser.add_argument("--duration", type=float, default=10.0, help="Simulated time per run in seconds")
+    parser.add_argument("--amplitude", type=float, nargs=2, default=(20.0, 10.0), metavar=("PAN", "TILT"))
+    parser.add_argument("--period", type=float, default=4.0, help="Period of the target motion in seconds")
+    parser.add_argument("--tolerance", type=float, default=1.0, help="Settling band in degrees")
+    parser.add_argument("--control-rate", type=float, default=100.0, help="Rate law loop rate in Hz")
+    parser.add_argument("--fps", type=float, default=60.0, help="Camera frame rate")
+    parser.add_argument("--latency", type=float, default=0.05, help="Camera latency in seconds")
+    parser.add_argument("--noise", type=float, default=0.05, help="Measurement noise in degrees")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: one per CPU)")
+    parser.add_argument("--chunk-size", type=int, default=64, help="Candidates per batch")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the sample and the noise")
+    parser.add_argument("--output", help="Run directory (default: src/Simulation/runs/sweep_<timestamp>)")
+    parser.add_argument("--no-plot", action="store_true", help="Skip the Pareto plots")
+    args = parser.parse_args()
+
+    setup_logging(level=logging.INFO)
+
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    current_run = args.output or os.path.join(os.path.dirname(__file__), "runs", f"sweep_{timestamp}")
+    os.makedirs(current_run, exist_ok=True)
+
+    ranges = tuple(given or default for given, default in zip((args.kp, args.ki, args.kd), DEFAULT_RANGES[args.law]))
+    if args.grid:
+        candidates = candidate_grid(ranges, args.grid)
+    else:
+        candidates = candidate_sample(ranges, args.samples, args.seed)
+    # The hand-picked gains go last, so their rank can be reported
+    baseline = np.array(DEFAULT_GAINS[args.law], dtype=np.float64)
+    candidates = np.concatenate((candidates, baseline))
+    baseline_index = {"pan": len(candidates) - 2, "tilt": len(candidates) - 1}
+
+    settings = SweepSettings(
+        law=args.law, trajectories=tuple(args.trajectories), amplitude=tuple(args.amplitude),
+        period=args.period, duration=args.duration, control_rate=args.control_rate,
+        camera=CameraModel(fps=args.fps, latency=args.latency, noise=args.noise),
+        tolerance=args.tolerance, seed=args.seed
+    )
+
+    logging.info(f"Sweeping {len(candidates)} candidates x {len(settings.trajectories)} trajectories "
+                 f"({args.law} law, {args.duration:.1f}s each).")
+    start = perf_counter()
+    metrics = run_sweep(candidates, settings, workers=args.workers, chunk_size=args.chunk_size)
+    elapsed = perf_counter() - start
+    simulated = len(candidates) * len(settings.trajectories) * args.duration
+    logging.info(f"Simulated {simulated:.0f}s in {elapsed:.1f}s ({simulated / max(elapsed, 1e-9):.0f}x real time).")
+
+    for axis, axis_name in enumerate(("pan", "tilt")):
+        table = ranked_table(candidates, metrics[:, axis], rank_by=args.rank_by)
+        table_path = os.path.join(current_run, f"sweep_{axis_name}.csv")
+        save_table(table_path, table)
+        logging.info(f"{axis_name.capitalize()} ranking saved at: {table_path}")
+
+        best = table[0]
+        baseline_rank = int(table[table[:, 1] == baseline_index[axis_name], 0][0])
+        logging.info(f"Best {axis_name}: Kp {best[2]:.4g}, Ki {best[3]:.4g}, Kd {best[4]:.4g} | "
+                     + ", ".join(f"{name}: {value:.3f}" for name, value in zip(METRICS, best[5:9]))
+                     + f" | Hand-picked gains rank {baseline_rank} of {len(table)}")
+
+        if not args.no_plot:
+            plot_pareto(table, axis_name, current_run, args.law)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,509 @@
+"""
+pan_tilt_plant.py
+
+Offline pan/tilt plant for tuning the controllers without the hardware.
+
+The plant models the two servos (rate limit, first-order lag, deadband, angle limits) and the camera
+(frame rate, latency, measurement noise). A synthetic target moves along a scripted trajectory, and the
+same control laws as the tracking scripts close the loop:
+
+- "frame": one PIDController update per camera frame with the true time between frames, and the output
+  added to the servo angle (ft_pd.py, full_tracking.py, smpid.py).
+- "rate": a MultiAxisPID rate controller on a fixed-rate loop that corrects the latest measurement by the
+  servo motion since its frame was captured (ControlLoop, used by vs_motion.py).
+
+The simulation is event driven: the servos only change at camera captures, measurement deliveries and
+control steps, and between two events their response to the constant command has a closed form. No
+fixed-step integration is needed, so a 20 s run at 60 fps takes a fraction of a second. A batch of runs
+(one row per run, see MultiAxisPID) costs little more per event than a single run: 1000 runs of 20 s
+take about a second, thousands of times faster than real time.
+
+The run data is written with the same schema as vs_motion (Time, Pan_Error, Pan_Angle, Tilt_Error,
+Tilt_Angle), so the plotting scripts work on simulated runs unchanged.
+
+Usage:
+    python -m src.Simulation.pan_tilt_plant --trajectory step --duration 10 --law rate
+
+Dependencies: argparse, collections, dataclasses, datetime, logging, os, time, numpy, matplotlib (for --plot)
+"""
+
+import argparse
+import datetime
+import logging
+import os
+from collections import deque, namedtuple
+from dataclasses import dataclass
+from time import perf_counter
+
+import numpy as np
+
+from ..PID import PIDController, MultiAxisPID
+from ..target_estimator import TargetEstimator
+from ..logging_utils import setup_logging
+
+# Servo limits and directions of the pan/tilt mechanism (same as vs_motion.py)
+PAN_MIN, PAN_MAX = -135, 135
+TILT_MIN, TILT_MAX = -90, 90
+# Direction each servo turns to reduce a positive error: pan - correction, tilt + correction
+SIGNS = (-1.0, 1.0)
+
+COLUMNS = ["Time", "Pan_Error", "Pan_Angle", "Tilt_Error", "Tilt_Angle"]
+
+# Run data of a simulation. Arrays are (n_steps,) for time and (n_steps, n_runs, 2) otherwise, with the
+# (pan, tilt) values of every run at every control update.
+# - errors: The errors the controller acted on (measured, delayed, noisy).
+# - angles: The commanded servo angles.
+# - positions: The actual servo angles.
+# - targets: The target angles.
+SimulationResult = namedtuple("SimulationResult", ["time", "errors", "angles", "positions", "targets"])
+
+
+@dataclass
+class ServoModel:
+    """
+    One hobby servo.
+
+    - max_rate (float): Maximum speed in deg/s.
+    - time_constant (float): Time constant of the first-order lag near the commanded angle in seconds.
+    - deadband (float): The servo does not move while within this many degrees of the command.
+    - min_angle, max_angle (float): Angle limits in degrees.
+    """
+    max_rate: float = 400.0
+    time_constant: float = 0.04
+    deadband: float = 0.5
+    min_angle: float = -90.0
+    max_angle: float = 90.0
+
+
+@dataclass
+class CameraModel:
+    """
+    The camera and detection pipeline.
+
+    - fps (float): Frame rate.
+    - latency (float): Seconds from frame capture until its measurement reaches the controller.
+    - noise (float): Standard deviation of the measured angle in degrees.
+    """
+    fps: float = 60.0
+    latency: float = 0.05
+    noise: float = 0.05
+
+
+def servo_response(position, command, duration, max_rate, time_constant=0.0, deadband=0.0):
+    """
+    Servo angle after holding a constant command for some time (closed form).
+
+    Far from the command the servo turns at its maximum rate. Once the remaining distance is below
+    max_rate * time_constant it closes in exponentially, and it stops as soon as it is within the deadband.
+    A servo that starts within the deadband does not move.
+
+    Parameters:
+    - position (array): Current servo angles.
+    - command (array): Commanded angles, broadcastable to position.
+    - duration (float or array): Time the command is held in seconds.
+    - max_rate, time_constant, deadband (float or array): Servo parameters, see ServoModel.
+
+    Returns:
+    - numpy.ndarray: The servo angles after the duration.
+    """
+    position = np.asarray(position, dtype=np.float64)
+    offset = np.asarray(command, dtype=np.float64) - position
+    distance = np.abs(offset)
+    time_constant = np.maximum(time_constant, 1e-9)
+
+    # Phase 1: saturated at max_rate until the distance reaches the knee
+    knee = np.maximum(max_rate * time_constant, deadband)
+    linear = np.minimum(duration, np.maximum(distance - knee, 0.0) / max_rate)
+    remaining = distance - max_rate * linear
+
+    # Phase 2: exponential approach, stopping at the deadband
+    with np.errstate(divide="ignore", invalid="ignore"):
+        stop = time_constant * np.log(remaining / deadband)
+    exponential = np.maximum(np.fmin(duration - linear, stop), 0.0)
+    remaining = remaining * np.exp(-exponential / time_constant)
+
+    return position + np.sign(offset) * (distance - remaining)
+
+
+class PanTiltPlant:
+    """
+    Pan and tilt servos with a camera looking at the target, for a batch of independent runs.
+
+    Angles are arrays of shape (n_runs, 2) with the (pan, tilt) angle of every run.
+    """
+
+    def __init__(self, pan=None, tilt=None, camera=None, n_runs=1, signs=SIGNS, seed=None):
+        """
+        Parameters:
+        - pan, tilt (ServoModel, optional): The servos. Default to the limits of the mechanism.
+        - camera (CameraModel, optional): The camera.
+        - n_runs (int): Number of runs simulated side by side.
+        - signs (tuple): Direction each servo turns to reduce a positive error (-1 or +1).
+        - seed (int, optional): Seed of the measurement noise.
+        """
+        self.servo_models = (pan or ServoModel(min_angle=PAN_MIN, max_angle=PAN_MAX),
+                             tilt or ServoModel(min_angle=TILT_MIN, max_angle=TILT_MAX))
+        self.camera = camera or CameraModel()
+        self.n_runs = n_runs
+        self.signs = np.asarray(signs, dtype=np.float64)
+        self.rng = np.random.default_rng(seed)
+
+        def per_axis(name):
+            return np.array([getattr(servo, name) for servo in self.servo_models], dtype=np.float64)
+
+        self.max_rate = per_axis("max_rate")
+        self.time_constant = per_axis("time_constant")
+        self.deadband = per_axis("deadband")
+        self.min_angle = per_axis("min_angle")
+        self.max_angle = per_axis("max_angle")
+        self.reset()
+
+    def reset(self, angles=0.0):
+        """Put every servo at rest at the given angles and the clock at 0."""
+        self.position = np.broadcast_to(np.clip(angles, self.min_angle, self.max_angle),
+                                        (self.n_runs, 2)).astype(np.float64)
+        self.command = self.position.copy()
+        self.time = 0.0
+
+    def set_command(self, angles):
+        """Command new servo angles (clipped to the servo limits)."""
+        self.command = np.clip(angles, self.min_angle, self.max_angle)
+
+    def advance(self, t):
+        """Move the servos to time t under the current command."""
+        if t > self.time:
+            self.position = servo_response(self.position, self.command, t - self.time,
+                                           self.max_rate, self.time_constant, self.deadband)
+            self.time = t
+
+    def measure(self, targets):
+        """
+        Errors the camera measures for the current servo angles.
+
+        Parameters:
+        - targets (array): Target angles, broadcastable to (n_runs, 2).
+
+        Returns:
+        - numpy.ndarray: (pan, tilt) errors in degrees of every run.
+        """
+        errors = self.signs * (targets - self.position)
+        if self.camera.noise > 0:
+            errors = errors + self.rng.normal(0.0, self.camera.noise, errors.shape)
+        return errors
+
+
+# ========================
+# Target Trajectories
+# ========================
+
+def _step(t, amplitude, period, start):
+    return np.where(t >= start, 1.0, 0.0) * amplitude
+
+
+def _ramp(t, amplitude, period, start):
+    # Constant speed from 0 to the amplitude over one period, then hold
+    return np.clip((t - start) / period, 0.0, 1.0) * amplitude
+
+
+def _sine(t, amplitude, period, start):
+    return np.where(t >= start, np.sin(2 * np.pi * (t - start) / period), 0.0) * amplitude
+
+
+def _square(t, amplitude, period, start):
+    # Alternating steps between +amplitude and -amplitude every half period
+    phase = np.floor(2 * (t - start) / period) % 2
+    return np.where(t >= start, 1.0 - 2.0 * phase, 0.0) * amplitude
+
+
+def _figure8(t, amplitude, period, start):
+    angle = 2 * np.pi * np.maximum(t - start, 0.0) / period
+    return np.array([np.sin(angle), np.sin(2 * angle)]) * amplitude
+
+
+TRAJECTORIES = {"step": _step, "ramp": _ramp, "sine": _sine, "square": _square, "figure8": _figure8}
+
+
+def trajectory(name, amplitude=(20.0, 10.0), period=4.0, start=0.5):
+    """
+    Scripted target motion.
+
+    Parameters:
+    - name (str): One of TRAJECTORIES: step, ramp, sine, square or figure8.
+    - amplitude (tuple): (pan, tilt) amplitude in degrees.
+    - period (float): Period of the motion (duration of the ramp) in seconds.
+    - start (float): Time the target starts moving in seconds.
+
+    Returns:
+    - callable: Maps a time in seconds to the (pan, tilt) target angles.
+    """
+    if name not in TRAJECTORIES:
+        raise ValueError(f"Unknown trajectory '{name}'. Choose from: {', '.join(TRAJECTORIES)}")
+    function = TRAJECTORIES[name]
+    amplitude = np.asarray(amplitude, dtype=np.float64)
+    return lambda t: function(t, amplitude, period, start)
+
+
+# ========================
+# Closed Loop
+# ========================
+
+def _frame_outputs(controller, errors, dt):
+    """PID outputs of every run for the frame law, from a MultiAxisPID or a (pan, tilt) PIDController pair."""
+    if isinstance(controller, MultiAxisPID):
+        return controller.compute(errors, dt)
+    return np.array([[pid.compute(error, dt) for pid, error in zip(controller, row)] for row in errors])
+
+
+def simulate(controller, plant, target, duration, law="frame", control_rate=100.0, initial_angles=0.0,
+             estimator=None):
+    """
+    Run the closed loop.
+
+    Parameters:
+    - controller: A (pan, tilt) pair of PIDController for the "frame" law with a single run, or a
+      MultiAxisPID for both axes (required for the "rate" law and for batches of runs).
+    - plant (PanTiltPlant): The plant. It is reset before the run.
+    - target (callable): Maps a time in seconds to the target angles, broadcastable to (n_runs, 2).
+    - duration (float): Simulated time in seconds.
+    - law (str): "frame" or "rate", see the module docstring.
+    - control_rate (float): Rate of the control loop in Hz for the "rate" law.
+    - initial_angles (float or array): Servo angles at the start.
+    - estimator (TargetEstimator, optional): Predict the target between measurements in the "rate" law,
+      as ControlLoop does with an estimator. It is reset before the run.
+
+    Returns:
+    - SimulationResult: The run data at every control update.
+    """
+    if law not in ("frame", "rate"):
+        raise ValueError(f"Unknown control law '{law}', expected 'frame' or 'rate'.")
+    if law == "rate" and not isinstance(controller, MultiAxisPID):
+        raise ValueError("The rate law needs a MultiAxisPID controller.")
+    if plant.n_runs > 1 and not isinstance(controller, MultiAxisPID):
+        raise ValueError("A batch of runs needs a MultiAxisPID controller.")
+
+    plant.reset(initial_angles)
+    if estimator is not None:
+        estimator.reset()
+    if isinstance(controller, MultiAxisPID):
+        controller.reset((plant.n_runs, 2))
+    else:
+        for pid in controller:
+            pid.reset()
+
+    # Events in time order; at equal times a frame is captured before it is delivered
+    CAPTURE, DELIVERY, STEP = 0, 1, 2
+    captures = np.arange(0.0, duration, 1.0 / plant.camera.fps)
+    events = [(t, CAPTURE) for t in captures]
+    events += [(t + plant.camera.latency, DELIVERY) for t in captures if t + plant.camera.latency <= duration]
+    if law == "rate":
+        period = 1.0 / control_rate
+        events += [(t, STEP) for t in np.arange(period, duration, period)]
+    events.sort()
+
+    pending = deque()  # Measurements on their way to the controller: (errors, capture time)
+    latest = None
+    estimated = None  # Latest measurement fed to the estimator
+    last_capture = None
+    # Commanded angles over the last second, to correct the measurements (see ControlLoop)
+    history = deque(maxlen=max(2, int(control_rate)))
+    records = []
+
+    def command_at(timestamp):
+        angles = plant.command
+        for t, commanded in reversed(history):
+            angles = commanded
+            if t <= timestamp:
+                break
+        return angles
+
+    for t, kind in events:
+        plant.advance(t)
+
+        if kind == CAPTURE:
+            pending.append((plant.measure(target(t)), t))
+            continue
+
+        if kind == DELIVERY:
+            errors, captured = pending.popleft()
+            if law == "rate":
+                latest = (errors, captured)
+                continue
+            # Frame law: one update per frame with the time between the frames
+            dt = captured - last_capture if last_capture is not None else 0.0
+            last_capture = captured
+            plant.set_command(plant.command + plant.signs * _frame_outputs(controller, errors, dt))
+        else:
+            if latest is None:
+                continue
+            errors, captured = latest
+            if estimator is None:
+                errors = errors - plant.signs * (plant.command - command_at(captured))
+            else:
+                if estimated is not latest:
+                    estimator.update(command_at(captured) + plant.signs * errors, captured)
+                    estimated = latest
+                errors = plant.signs * (estimator.predict(t) - plant.command)
+            plant.set_command(controller.command(plant.command, errors, period))
+            history.append((t, plant.command))
+
+        records.append((t, errors, plant.command, plant.position,
+                        np.broadcast_to(target(t), (plant.n_runs, 2))))
+
+    if not records:
+        empty = np.zeros((0, plant.n_runs, 2))
+        return SimulationResult(np.zeros(0), empty, empty, empty, empty)
+    time, errors, angles, positions, targets = zip(*records)
+    return SimulationResult(np.array(time), np.array(errors), np.array(angles),
+                            np.array(positions), np.array(targets))
+
+
+def write_csv(path, result, run=0):
+    """
+    Save one run in the vs_motion CSV schema (Time, Pan_Error, Pan_Angle, Tilt_Error, Tilt_Angle).
+
+    Parameters:
+    - path (str): CSV file to write.
+    - result (SimulationResult): The simulation result.
+    - run (int): Which run of the batch to save.
+    """
+    data = np.column_stack((result.time,
+                            result.errors[:, run, 0], result.angles[:, run, 0],
+                            result.errors[:, run, 1], result.angles[:, run, 1]))
+    np.savetxt(path, data, delimiter=",", header=",".join(COLUMNS), comments="", fmt="%.5f")
+
+
+def plot_result(result, path_to_save, title="", run=0):
+    """
+    Plot the target, commanded and actual angle and the error of both axes.
+
+    Parameters:
+    - result (SimulationResult): The simulation result.
+    - path_to_save (str): Directory to save pan_response.png and tilt_response.png in.
+    - title (str): Title of the plots.
+    - run (int): Which run of the batch to plot.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    for axis, name in enumerate(("pan", "tilt")):
+        fig, (ax_angle, ax_error) = plt.subplots(2, 1, figsize=(15, 8), sharex=True)
+        ax_angle.plot(result.time, result.targets[:, run, axis], label="Target")
+        ax_angle.plot(result.time, result.angles[:, run, axis], label="Commanded")
+        ax_angle.plot(result.time, result.positions[:, run, axis], label="Servo")
+        ax_angle.set_ylabel("Angle (deg)")
+        ax_angle.legend()
+        ax_error.plot(result.time, result.errors[:, run, axis], label=f"{name.capitalize()} Error")
+        ax_error.set_xlabel("Time (s)")
+        ax_error.set_ylabel("Error (deg)")
+        ax_error.legend()
+        fig.suptitle(f"Simulated {name.capitalize()} Response\n{title}")
+        fig.tight_layout()
+        plot_path = os.path.join(path_to_save, f"{name}_response.png")
+        fig.savefig(plot_path)
+        plt.close(fig)
+        logging.info(f"{name.capitalize()} plot saved at: {plot_path}")
+
+
+# ========================
+# Command Line
+# ========================
+
+# Default gains per law: the per-frame gains of pan_response.py (Kd per frame at 60 fps converted to
+# seconds) and the rate gains of vs_motion.py
+DEFAULT_GAINS = {
+    "frame": ((0.5, 0.0, 0.008), (0.5, 0.0, 0.008)),
+    "rate": ((30.0, 0.0, 0.5), (30.0, 0.0, 0.5)),
+}
+# Rate controller limits of vs_motion.py
+MAX_SERVO_RATE = 300.0
+MAX_INTEGRAL = 20.0
+DERIVATIVE_TAU = 0.02
+
+
+def build_controller(law, pan_gains, tilt_gains):
+    """
+    Controller for a single run, set up like the tracking scripts.
+
+    Parameters:
+    - law (str): "frame" or "rate".
+    - pan_gains, tilt_gains (tuple): (Kp, Ki, Kd) of each axis.
+
+    Returns:
+    - A (pan, tilt) PIDController pair for the frame law, a MultiAxisPID for the rate law.
+    """
+    if law == "frame":
+        return PIDController(*pan_gains), PIDController(*tilt_gains)
+    (kp_pan, ki_pan, kd_pan), (kp_tilt, ki_tilt, kd_tilt) = pan_gains, tilt_gains
+    return MultiAxisPID(
+        Kp=[kp_pan, kp_tilt], Ki=[ki_pan, ki_tilt], Kd=[kd_pan, kd_tilt],
+        position_limits=([PAN_MIN, TILT_MIN], [PAN_MAX, TILT_MAX]),
+        signs=SIGNS,
+        output_limits=MAX_SERVO_RATE,
+        integral_limits=MAX_INTEGRAL,
+        derivative_tau=DERIVATIVE_TAU
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate the pan/tilt tracking loop offline.")
+    parser.add_argument("--trajectory", default="step", choices=sorted(TRAJECTORIES))
+    parser.add_argument("--amplitude", type=float, nargs=2, default=(20.0, 10.0), metavar=("PAN", "TILT"),
+                        help="Target amplitude in degrees")
+    parser.add_argument("--period", type=float, default=4.0, help="Period of the target motion in seconds")
+    parser.add_argument("--duration", type=float, default=10.0, help="Simulated time in seconds")
+    parser.add_argument("--law", default="rate", choices=("frame", "rate"), help="Control law")
+    parser.add_argument("--pan", type=float, nargs=3, metavar=("KP", "KI", "KD"), help="Pan gains")
+    parser.add_argument("--tilt", type=float, nargs=3, metavar=("KP", "KI", "KD"), help="Tilt gains")
+    parser.add_argument("--control-rate", type=float, default=100.0, help="Rate law loop rate in Hz")
+    parser.add_argument("--fps", type=float, default=60.0, help="Camera frame rate")
+    parser.add_argument("--latency", type=float, default=0.05, help="Camera latency in seconds")
+    parser.add_argument("--noise", type=float, default=0.05, help="Measurement noise in degrees")
+    parser.add_argument("--max-rate", type=float, default=400.0, help="Servo speed in deg/s")
+    parser.add_argument("--time-constant", type=float, default=0.04, help="Servo lag in seconds")
+    parser.add_argument("--deadband", type=float, default=0.5, help="Servo deadband in degrees")
+    parser.add_argument("--estimator", action="store_true", help="Rate law: predict the target with a TargetEstimator")
+    parser.add_argument("--seed", type=int, default=0, help="Seed of the measurement noise")
+    parser.add_argument("--output", help="Run directory (default: src/Simulation/runs/run_<timestamp>)")
+    parser.add_argument("--plot", action="store_true", help="Save plots of the response")
+    args = parser.parse_args()
+
+    setup_logging(level=logging.INFO)
+
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    current_run = args.output or os.path.join(os.path.dirname(__file__), "runs", f"run_{timestamp}")
+    os.makedirs(current_run, exist_ok=True)
+
+    pan_gains = tuple(args.pan) if args.pan else DEFAULT_GAINS[args.law][0]
+    tilt_gains = tuple(args.tilt) if args.tilt else DEFAULT_GAINS[args.law][1]
+    controller = build_controller(args.law, pan_gains, tilt_gains)
+
+    servo = dict(max_rate=args.max_rate, time_constant=args.time_constant, deadband=args.deadband)
+    plant = PanTiltPlant(
+        pan=ServoModel(min_angle=PAN_MIN, max_angle=PAN_MAX, **servo),
+        tilt=ServoModel(min_angle=TILT_MIN, max_angle=TILT_MAX, **servo),
+        camera=CameraModel(fps=args.fps, latency=args.latency, noise=args.noise),
+        seed=args.seed
+    )
+    target = trajectory(args.trajectory, amplitude=args.amplitude, period=args.period)
+
+    start = perf_counter()
+    estimator = TargetEstimator(n_axes=2) if args.estimator else None
+    result = simulate(controller, plant, target, args.duration, law=args.law, control_rate=args.control_rate,
+                      estimator=estimator)
+    elapsed = perf_counter() - start
+    logging.info(f"Simulated {args.duration:.1f}s ({len(result.time)} control updates) in {elapsed * 1e3:.1f} ms, "
+                 f"{args.duration / max(elapsed, 1e-9):.0f}x real time.")
+
+    data_file = os.path.join(current_run, "data_pan.csv")
+    write_csv(data_file, result)
+    logging.info(f"Saved data at: {data_file}")
+
+    if args.plot:
+        plot_result(result, current_run,
+                    title=f"{args.trajectory}, {args.law} law, pan (Kp, Ki, Kd): {pan_gains}, "
+                          f"tilt: {tilt_gains}")
+
+
+if __name__ == "__main__":
+    main()
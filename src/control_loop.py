@@ -0,0 +1,247 @@
+"""
+control_loop.py
+
+Pan/tilt control on its own fixed-rate thread, decoupled from detection.
+
+Detection publishes the latest pan/tilt error together with the capture timestamp of the frame it was
+measured on (`update`). The control loop wakes up on a monotonic clock at a fixed rate (e.g. 100 Hz), runs
+one MultiAxisPID update for all axes with the true time since the previous step, and commands the servos.
+The servo response is therefore set by the loop rate and the gains, not by how fast or regularly frames
+arrive.
+
+Between two measurements the servos keep moving, so the error measured on an older frame is corrected by
+how far each servo has turned since that frame was captured. The commanded angles are kept in a short
+history to look up the angle at capture time.
+
+Control law (per axis, `sign` is the controller's sign: -1 for pan and +1 for tilt in the tracking scripts):
+    error_now = error - sign * (angle_now - angle_at_capture)
+    angle_new = clip(angle_now + sign * controller_output(error_now, dt) * dt, angle_min, angle_max)
+
+The PID output is an angular rate, so the gains do not depend on the loop rate: Kp is in 1/s, Ki in 1/s^2
+and Kd is unitless.
+
+With a TargetEstimator the correction above is replaced by a prediction: every new measurement is turned
+into a target angle (angle_at_capture + sign * error) and fed to the estimator, and every step controls on
+    error_now = sign * (predicted_target(now) - angle_now)
+so the servos also follow the target's motion since the frame was captured, not just their own.
+
+Timestamps must come from the same clock as time.monotonic() (the camera sensor timestamps do).
+
+Dependencies: logging, threading, collections, time, numpy
+"""
+
+import logging
+import threading
+from collections import deque
+from time import monotonic, sleep
+
+import numpy as np
+
+from .logging_utils import RateLimitedLogger
+
+
+class ControlLoop:
+    def __init__(self, servos, controller, rate=100.0, timeout=0.5,
+                 telemetry=None, stats_interval=10.0, estimator=None, profiler=None, name="ControlLoop"):
+        """
+        Parameters:
+        - servos (sequence): One servo per axis, e.g. (pan_servo, tilt_servo), with an `angle` attribute
+          (gpiozero AngularServo or compatible).
+        - controller (MultiAxisPID): Controller for all axes, with the servo limits and directions.
+        - rate (float): Control loop rate in Hz.
+        - timeout (float): Seconds without a new measurement before the target counts as lost.
+        - telemetry (TelemetryRecorder, optional): Receives (Time, Error, Angle) of every axis in turn,
+          e.g. (Time, Pan_Error, Pan_Angle, Tilt_Error, Tilt_Angle), for every step that commanded the servos.
+        - stats_interval (float): Seconds between jitter statistics in the log (0 to disable).
+        - estimator (TargetEstimator, optional): Predicts the target between measurements (see above).
+        - profiler (StageProfiler, optional): Receives the duration of every step as the "control" stage.
+        - name (str): Name of the loop thread.
+        """
+        if controller.n_axes != len(servos):
+            raise ValueError(f"The controller has {controller.n_axes} axes for {len(servos)} servos.")
+        self.servos = tuple(servos)
+        self.controller = controller
+        self.period = 1.0 / rate
+        self.timeout = timeout
+        self.telemetry = telemetry
+        self.stats_interval = stats_interval
+        self.estimator = estimator
+        self.profiler = profiler
+        self.name = name
+
+        self.angles = np.array([servo.angle if servo.angle is not None else 0.0 for servo in self.servos],
+                               dtype=np.float64)
+        # Commanded angles over the last second: (time, angles)
+        self.history = deque(maxlen=max(2, int(rate)))
+
+        self.lock = threading.Lock()
+        self.measurement = None  # (errors, capture timestamp, arrival time)
+        self.measurement_count = 0
+        self.estimated_count = 0  # measurement_count of the last measurement fed to the estimator
+
+        # Loop timing, one entry per step
+        self.intervals = np.zeros(1024)
+        self.steps = 0
+        self.overruns = 0
+
+        self.stop_event = threading.Event()
+        self.thread = None
+        self.start_time = None
+        # A step that keeps failing is logged once per second, with the count of the failures in between
+        self.error_log = RateLimitedLogger(interval=1.0)
+
+    def update(self, *errors, timestamp=None):
+        """
+        Publish the latest measurement. Called from the detection thread.
+
+        Parameters:
+        - errors (float): One error per axis in degrees, e.g. (pan_error, tilt_error), measured on one frame.
+        - timestamp (float, optional): Capture time of that frame (monotonic clock). Defaults to now.
+        """
+        now = monotonic()
+        with self.lock:
+            self.measurement = (np.array(errors, dtype=np.float64),
+                                now if timestamp is None else timestamp, now)
+            self.measurement_count += 1
+
+    def start(self):
+        """Start the control thread."""
+        if self.thread is not None and self.thread.is_alive():
+            return self
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True, name=self.name)
+        self.thread.start()
+        return self
+
+    def stop(self, timeout=1.0):
+        """Stop the control thread and log the timing statistics."""
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+        logging.info(f"{self.name} stopped. {self.format_stats()}")
+        if self.estimator is not None:
+            logging.info(f"{self.name} target estimator: {self.estimator.format_stats()}")
+
+    def angle_at(self, timestamp):
+        """Commanded angles at a past time, from the command history."""
+        angles = self.angles
+        for t, commanded in reversed(self.history):
+            angles = commanded
+            if t <= timestamp:
+                break
+        return angles
+
+    def step(self, now, dt):
+        """
+        Run one control step.
+
+        Parameters:
+        - now (float): Current time (monotonic clock).
+        - dt (float): Time since the previous step in seconds.
+
+        Returns:
+        - bool: True if the servos were commanded, False if there is no recent measurement.
+        """
+        with self.lock:
+            measurement, count = self.measurement, self.measurement_count
+
+        if measurement is None or now - measurement[2] > self.timeout:
+            # Target lost: hold the servos and start the controllers fresh on the next measurement
+            if measurement is not None:
+                with self.lock:
+                    if self.measurement is measurement:
+                        self.measurement = None
+                self.controller.reset()
+                if self.estimator is not None:
+                    self.estimator.reset()
+                logging.info(f"{self.name}: no measurement for {self.timeout}s, holding position.")
+            return False
+
+        errors, captured, _ = measurement
+        signs = self.controller.signs
+        if self.estimator is None:
+            # Correct the measured error by how far the servos moved since the frame was captured
+            errors = errors - signs * (self.angles - self.angle_at(captured))
+        else:
+            if count != self.estimated_count:
+                self.estimator.update(self.angle_at(captured) + signs * errors, captured)
+                self.estimated_count = count
+            errors = signs * (self.estimator.predict(now) - self.angles)
+
+        self.angles = self.controller.command(self.angles, errors, dt)
+        for servo, angle in zip(self.servos, self.angles):
+            servo.angle = angle
+        self.history.append((now, self.angles))
+
+        if self.telemetry is not None:
+            self.telemetry.record(now - self.start_time, *np.column_stack((errors, self.angles)).ravel())
+        return True
+
+    def _run(self):
+        """Fixed-rate loop on the monotonic clock."""
+        self.start_time = monotonic()
+        last = self.start_time
+        next_time = self.start_time + self.period
+        last_stats = self.start_time
+
+        while not self.stop_event.is_set():
+            delay = next_time - monotonic()
+            if delay > 0:
+                sleep(delay)
+            now = monotonic()
+            dt = now - last
+            last = now
+
+            self.intervals[self.steps % len(self.intervals)] = dt
+            self.steps += 1
+
+            try:
+                if self.profiler is not None:
+                    with self.profiler.span("control"):
+                        self.step(now, dt)
+                else:
+                    self.step(now, dt)
+            except Exception as e:
+                self.error_log.error("%s step failed: %s", self.name, e)
+
+            # Schedule the next step; skip the missed ones instead of bursting to catch up
+            next_time += self.period
+            if next_time < monotonic():
+                self.overruns += 1
+                next_time = monotonic() + self.period
+
+            if self.stats_interval and now - last_stats >= self.stats_interval:
+                logging.info(f"{self.name}: {self.format_stats()}")
+                last_stats = now
+
+    def stats(self):
+        """
+        Loop timing statistics over the last steps (up to 1024).
+
+        Returns:
+        - dict: steps, overruns, and the mean, std, p99 and max step interval and the mean absolute
+          jitter (deviation from the configured period), all in milliseconds.
+        """
+        intervals = self.intervals[:min(self.steps, len(self.intervals))]
+        if not len(intervals):
+            return {"steps": 0, "overruns": 0}
+        jitter = np.abs(intervals - self.period)
+        return {
+            "steps": self.steps,
+            "overruns": self.overruns,
+            "mean_ms": intervals.mean() * 1e3,
+            "std_ms": intervals.std() * 1e3,
+            "p99_ms": np.percentile(intervals, 99) * 1e3,
+            "max_ms": intervals.max() * 1e3,
+            "jitter_ms": jitter.mean() * 1e3,
+        }
+
+    def format_stats(self):
+        """Loop timing statistics as one log line."""
+        stats = self.stats()
+        if not stats["steps"]:
+            return "No steps run."
+        return (f"Steps: {stats['steps']}, Period: {self.period * 1e3:.2f} ms, "
+                f"Mean: {stats['mean_ms']:.2f} ms, Std: {stats['std_ms']:.2f} ms, "
+                f"P99: {stats['p99_ms']:.2f} ms, Max: {stats['max_ms']:.2f} ms, "
+                f"Jitter: {stats['jitter_ms']:.3f} ms, Overruns: {stats['overruns']}")
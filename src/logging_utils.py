@@ -0,0 +1,139 @@
+"""
+logging_utils.py
+
+Logging setup shared by the entry points, with the file I/O off the tracking threads.
+
+setup_logging() configures the root logger with a single QueueHandler. Records are put on an in-memory
+queue, and a QueueListener thread writes them to the run log file (and optionally the console). A
+logging call on the detection or control thread therefore costs formatting the record, never a write
+to the SD card. The listener is stopped at exit, so the records still in the queue end up in the file.
+
+Per-frame messages should go through a RateLimitedLogger: it passes at most one record per call site per
+interval and drops the rest before they are formatted, adding the number of dropped records to the next
+one it passes. Use %-style arguments rather than f-strings with it, so a dropped record is never
+formatted. Per-frame numbers belong in a TelemetryRecorder, not in the text log.
+
+Usage:
+    setup_logging(os.path.join(current_run, "Vs_Motion.log"))
+    frame_log = RateLimitedLogger(interval=1.0)
+    frame_log.info("Pan error: %.2f, Tilt error: %.2f", pan_error, tilt_error)   # per frame
+
+Dependencies: atexit, logging, queue, threading, time
+"""
+
+import atexit
+import logging
+import logging.handlers
+import queue
+import threading
+from time import monotonic
+
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+_listener = None
+
+
+def setup_logging(log_file=None, level=logging.INFO, fmt=LOG_FORMAT, console=False):
+    """
+    Route the root logger through a queue to a background writer thread.
+
+    Calling it again replaces the previous setup (the previous listener is flushed and stopped).
+
+    Parameters:
+    - log_file (str, optional): Log file to append to.
+    - level (int): Minimum level of the records to keep.
+    - fmt (str): Record format.
+    - console (bool): Also write the records to stderr. Defaults to True when there is no log file.
+
+    Returns:
+    - logging.handlers.QueueListener: The running listener.
+    """
+    global _listener
+    stop_logging()
+
+    formatter = logging.Formatter(fmt)
+    handlers = []
+    if log_file is not None:
+        handlers.append(logging.FileHandler(log_file))
+    if console or log_file is None:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    return _listener
+
+
+def stop_logging():
+    """Write the queued records, stop the writer thread and close its handlers."""
+    global _listener
+    if _listener is None:
+        return
+    listener, _listener = _listener, None
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+# Runs before logging's own shutdown hook (atexit is last in, first out)
+atexit.register(stop_logging)
+
+
+class RateLimitedLogger:
+    """Logger wrapper that passes at most one record per call site (message template) per interval."""
+
+    def __init__(self, logger=None, interval=1.0):
+        """
+        Parameters:
+        - logger (logging.Logger, optional): Logger to pass the records to. Defaults to the root logger.
+        - interval (float): Shortest time in seconds between two records with the same message template.
+        """
+        self.logger = logger if logger is not None else logging.getLogger()
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.last = {}        # Time of the last record passed, per message template
+        self.suppressed = {}  # Records dropped since then, per message template
+
+    def log(self, level, msg, *args):
+        """
+        Log a record unless one with the same template passed less than `interval` seconds ago.
+
+        Returns:
+        - bool: Whether the record was passed on.
+        """
+        if not self.logger.isEnabledFor(level):
+            return False
+        now = monotonic()
+        with self.lock:
+            last = self.last.get(msg)
+            if last is not None and now - last < self.interval:
+                self.suppressed[msg] = self.suppressed.get(msg, 0) + 1
+                return False
+            self.last[msg] = now
+            suppressed = self.suppressed.pop(msg, 0)
+        if suppressed:
+            msg = f"{msg} ({suppressed} similar suppressed)"
+        # stacklevel points the record at the caller, not at this wrapper
+        self.logger.log(level, msg, *args, stacklevel=3)
+        return True
+
+    def debug(self, msg, *args):
+        return self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        return self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        return self.log(logging.WARNING, msg, *args)
+
+    def error(self, msg, *args):
+        return self.log(logging.ERROR, msg, *args)
@@ -2,8 +2,10 @@ import cv2
 import time
 import numpy as np
 # Import marker detection and camera feed utilities
+from ..ArUcoMarker.detector_registry import get_detector
 from ..ArUcoMarker.utils import find_marker, track_and_render_marker, draw_center_frame
 from . import WebcamVideoStreamThreaded, VideoShow
+from ..telemetry import TelemetryRecorder
 
 ARUCO_DICT_TYPE = cv2.aruco.DICT_ARUCO_ORIGINAL
 MARKER_LENGTH = 0.046  # meters
@@ -12,27 +14,30 @@ def main(src=0):
     print("Starting Camera Calibration Mode (No Control)")
     start_time = time.time()
     # Data columns: Time, Pan_Error (deg), Tilt_Error (deg), tvec_x, tvec_y, tvec_z
-    data_array = np.empty((0, 6))
+    telemetry = TelemetryRecorder("data_calib.csv", ["Time", "Pan_Error", "Tilt_Error", "tvec_x", "tvec_y", "tvec_z"])
     
     video_stream = WebcamVideoStreamThreaded(src).start()
     video_display = VideoShow(video_stream.frame).start()
+    frames = video_stream.bus.subscribe()
+    # Build the detector once and reuse it for every frame
+    detector = get_detector(ARUCO_DICT_TYPE)
     
     try:
         while True:
             elapsed_time = time.time() - start_time
             if video_stream.stopped:
                 break
-            frame = video_stream.frame
-            if frame is None:
+            # Wait for a frame we have not processed yet
+            item = frames.wait(timeout=1.0)
+            if item is None:
                 continue
+            frame = item[1]
             
             frame_height, frame_width = frame.shape[:2]
             center = (frame_width // 2, frame_height // 2)
             draw_center_frame(frame, center)
             
-            aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT_TYPE)
-            parameters = cv2.aruco.DetectorParameters()
-            marker_array = find_marker(frame, aruco_dict, parameters)
+            marker_array = find_marker(frame, detector=detector)
             
             if marker_array:
                 for marker, marker_id in marker_array:
@@ -54,9 +59,8 @@ def main(src=0):
                     tilt_error_deg = np.degrees(tilt_error_rad)
                     
                     # Log calibration data
-                    data_entry = np.array([[elapsed_time, np.abs(pan_error_deg), np.abs(tilt_error_deg),
-                                            x, y, z]])
-                    data_array = np.vstack((data_array, data_entry))
+                    telemetry.record(elapsed_time, np.abs(pan_error_deg), np.abs(tilt_error_deg),
+                                     x, y, z)
             
             video_display.frame = frame
 
@@ -66,8 +70,7 @@ def main(src=0):
         video_stream.stop()
         video_display.stop()
         cv2.destroyAllWindows()
-        np.savetxt("data_calib.csv", data_array, delimiter=",",
-                   header="Time,Pan_Error,Tilt_Error,tvec_x,tvec_y,tvec_z", comments="", fmt="%.5f")
+        telemetry.close()
         print("Data saved to data_calib.csv")
 
 if __name__ == "__main__":
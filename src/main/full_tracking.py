@@ -4,9 +4,11 @@ import numpy as np
 from gpiozero import Device, AngularServo
 from gpiozero.pins.pigpio import PiGPIOFactory
 # Import marker detection and camera feed utilities
+from ..ArUcoMarker.detector_registry import get_detector
 from ..ArUcoMarker.utils import find_marker, track_and_render_marker, draw_center_frame
 from . import WebcamVideoStreamThreaded, VideoShow
 from ..PID import PIDController
+from ..telemetry import TelemetryRecorder
 
 # Configure gpiozero to use the PiGPIOFactory
 Device.pin_factory = PiGPIOFactory()
@@ -37,28 +39,33 @@ def main(src=0):
     print("Starting Full Pan–Tilt Tracking")
     start_time = time.time()
     # Data columns: Time, Pan_Error (deg), Pan_Angle, Tilt_Error (deg), Tilt_Angle
-    data_array = np.empty((0, 5))
+    telemetry = TelemetryRecorder("data_main.csv", ["Time", "Pan_Error", "Pan_Angle", "Tilt_Error", "Tilt_Angle"])
     
     video_stream = WebcamVideoStreamThreaded(src).start()
     video_display = VideoShow(video_stream.frame).start()
+    frames = video_stream.bus.subscribe()
+    # Capture time of the frame the controllers were last updated with
+    last_control_time = None
+    # Build the detector once and reuse it for every frame
+    detector = get_detector(ARUCO_DICT_TYPE)
     
     try:
         while True:
             elapsed_time = time.time() - start_time
             if video_stream.stopped:
                 break
-            frame = video_stream.frame
-            if frame is None:
+            # Wait for a frame we have not processed yet
+            item = frames.wait(timeout=1.0)
+            if item is None:
                 continue
+            _, frame, timestamp = item
 
             frame_height, frame_width = frame.shape[:2]
             center = (frame_width // 2, frame_height // 2)
             draw_center_frame(frame, center)
             
             # Marker detection
-            aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT_TYPE)
-            parameters = cv2.aruco.DetectorParameters()
-            marker_array = find_marker(frame, aruco_dict, parameters)
+            marker_array = find_marker(frame, detector=detector)
             
             if marker_array:
                 for marker, marker_id in marker_array:
@@ -86,8 +93,11 @@ def main(src=0):
                     current_tilt = tilt_servo.angle if tilt_servo.angle is not None else 90  # assume center for tilt
                     
                     # Compute corrections using PID controllers
-                    pan_correction = pan_controller.compute(pan_error_deg, elapsed_time)
-                    tilt_correction = tilt_controller.compute(tilt_error_deg,elapsed_time)
+                    # Time since the previous control update (not since the start of the run)
+                    dt = timestamp - last_control_time if last_control_time is not None else 0
+                    last_control_time = timestamp
+                    pan_correction = pan_controller.compute(pan_error_deg, dt)
+                    tilt_correction = tilt_controller.compute(tilt_error_deg, dt)
                     
                     # Update servo angles
                     new_pan = current_pan - pan_correction
@@ -101,9 +111,8 @@ def main(src=0):
                     tilt_servo.angle = new_tilt
                     
                     # Log data: time, pan error, pan angle, tilt error, tilt angle
-                    data_entry = np.array([[elapsed_time, np.abs(pan_error_deg), new_pan,
-                                            np.abs(tilt_error_deg), new_tilt]])
-                    data_array = np.vstack((data_array, data_entry))
+                    telemetry.record(elapsed_time, np.abs(pan_error_deg), new_pan,
+                                     np.abs(tilt_error_deg), new_tilt)
             
             video_display.frame = frame
 
@@ -113,8 +122,7 @@ def main(src=0):
         video_stream.stop()
         video_display.stop()
         cv2.destroyAllWindows()
-        np.savetxt("data_main.csv", data_array, delimiter=",",
-                   header="Time,Pan_Error,Pan_Angle,Tilt_Error,Tilt_Angle", comments="", fmt="%.5f")
+        telemetry.close()
         print("Data saved to data_main.csv")
 
 if __name__ == "__main__":
@@ -3,9 +3,11 @@ import time
 import numpy as np
 from gpiozero import Device, AngularServo
 from gpiozero.pins.pigpio import PiGPIOFactory
+from ..ArUcoMarker.detector_registry import get_detector
 from ..ArUcoMarker.utils import find_marker, track_and_render_marker, draw_center_frame
 from . import WebcamVideoStreamThreaded, VideoShow
 from ..PID import PIDController
+from ..telemetry import TelemetryRecorder
 
 Device.pin_factory = PiGPIOFactory()
 
@@ -28,27 +30,30 @@ def main(src=0):
     print("Starting Tilt-Only Tracking")
     start_time = time.time()
     # Data columns: Time, Tilt_Error (deg), Tilt_Angle
-    data_array = np.empty((0, 3))
+    telemetry = TelemetryRecorder("data_tilt.csv", ["Time", "Tilt_Error", "Tilt_Angle"])
     
     video_stream = WebcamVideoStreamThreaded(src).start()
     video_display = VideoShow(video_stream.frame).start()
+    frames = video_stream.bus.subscribe()
+    # Build the detector once and reuse it for every frame
+    detector = get_detector(ARUCO_DICT_TYPE)
     
     try:
         while True:
             elapsed_time = time.time() - start_time
             if video_stream.stopped:
                 break
-            frame = video_stream.frame
-            if frame is None:
+            # Wait for a frame we have not processed yet
+            item = frames.wait(timeout=1.0)
+            if item is None:
                 continue
+            frame = item[1]
 
             frame_height, frame_width = frame.shape[:2]
             center = (frame_width // 2, frame_height // 2)
             draw_center_frame(frame, center)
             
-            aruco_dict = cv2.aruco.getPredefinedDictionary(ARUCO_DICT_TYPE)
-            parameters = cv2.aruco.DetectorParameters()
-            marker_array = find_marker(frame, aruco_dict, parameters)
+            marker_array = find_marker(frame, detector=detector)
             
             if marker_array:
                 for marker, marker_id in marker_array:
@@ -77,8 +82,7 @@ def main(src=0):
                     tilt_servo.angle = new_tilt
                     
                     # Log time, absolute error, and new tilt angle
-                    data_entry = np.array([[elapsed_time, np.abs(tilt_error_deg), new_tilt]])
-                    data_array = np.vstack((data_array, data_entry))
+                    telemetry.record(elapsed_time, np.abs(tilt_error_deg), new_tilt)
             
             video_display.frame = frame
 
@@ -88,8 +92,7 @@ def main(src=0):
         video_stream.stop()
         video_display.stop()
         cv2.destroyAllWindows()
-        np.savetxt("data_tilt.csv", data_array, delimiter=",",
-                   header="Time,Tilt_Error,Tilt_Angle", comments="", fmt="%.5f")
+        telemetry.close()
         print("Data saved to data_tilt.csv")
 
 if __name__ == "__main__":
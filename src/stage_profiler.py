@@ -0,0 +1,185 @@
+"""
+stage_profiler.py
+
+Per-stage latency profiler for the tracking pipelines.
+
+Every stage of a frame's trip through the pipeline (capture, decode, undistort, detect, pose, control,
+servo write, annotate, encode) is timed with perf_counter_ns spans. The last durations of every stage
+(1024 by default) are kept in a fixed-size ring, so recording a span is a couple of stores. Percentiles
+(p50/p95/p99) are only computed when a summary is asked for: in the run log, or on the stream overlay,
+where the table is rendered at most a few times per second and copied onto the frames in between.
+
+The stages run on different threads (capture thread, tracking thread, control loop, servo writer,
+viewers), so one profiler is shared by all of them; recording is thread-safe.
+
+Usage:
+    profiler = StageProfiler()
+    with profiler.span("detect"):
+        marker_array = find_marker(frame, detector=detector)
+
+    start = perf_counter_ns()
+    ...
+    profiler.record("capture", perf_counter_ns() - start)
+
+    logging.info(f"Stage latency: {profiler.format_stats()}")
+    profiler.draw(frame)
+
+Dependencies: threading, time, cv2, numpy
+"""
+
+import threading
+from time import monotonic, perf_counter_ns
+
+import cv2
+import numpy as np
+
+# Pipeline stages in the order a frame goes through them
+STAGES = ("capture", "decode", "undistort", "detect", "pose", "control", "servo_write", "annotate", "encode")
+PERCENTILES = (50, 95, 99)
+
+
+class _Span:
+    """Context manager timing one span of a stage."""
+    __slots__ = ("profiler", "stage", "start")
+
+    def __init__(self, profiler, stage):
+        self.profiler = profiler
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.record(self.stage, perf_counter_ns() - self.start)
+
+
+class StageProfiler:
+    def __init__(self, stages=STAGES, size=1024, overlay_interval=0.5):
+        """
+        Parameters:
+        - stages (sequence of str): Stage names, in display order. Other names are added when first recorded.
+        - size (int): Number of durations kept per stage.
+        - overlay_interval (float): Seconds between two refreshes of the overlay text.
+        """
+        self.size = size
+        self.overlay_interval = overlay_interval
+        self.lock = threading.Lock()
+        self.durations = {}  # Last durations of every stage in nanoseconds
+        self.counts = {}     # Spans recorded per stage
+        for stage in stages:
+            self._add(stage)
+
+        self._overlay = None  # Rendered overlay table
+        self._overlay_time = None
+
+    def _add(self, stage):
+        self.durations[stage] = np.zeros(self.size, dtype=np.int64)
+        self.counts[stage] = 0
+
+    def span(self, stage):
+        """
+        Time a block of code as one span of a stage.
+
+        Parameters:
+        - stage (str): Stage name.
+
+        Returns:
+        - context manager: Records the time spent inside the `with` block.
+        """
+        return _Span(self, stage)
+
+    def record(self, stage, duration_ns):
+        """
+        Record one span measured by the caller.
+
+        Parameters:
+        - stage (str): Stage name.
+        - duration_ns (int): Duration in nanoseconds (from perf_counter_ns).
+        """
+        with self.lock:
+            if stage not in self.durations:
+                self._add(stage)
+            count = self.counts[stage]
+            self.durations[stage][count % self.size] = duration_ns
+            self.counts[stage] = count + 1
+
+    def reset(self):
+        """Forget every recorded span."""
+        with self.lock:
+            for stage in self.durations:
+                self.counts[stage] = 0
+        self._overlay = None
+
+    def stats(self):
+        """
+        Latency percentiles of every stage with at least one span, over its last spans (up to `size`).
+
+        Returns:
+        - dict: Per stage name, a dict with count, mean_ms and p50_ms/p95_ms/p99_ms.
+        """
+        with self.lock:
+            snapshot = [(stage, count, self.durations[stage][:min(count, self.size)].copy())
+                        for stage, count in self.counts.items() if count]
+        stats = {}
+        for stage, count, durations in snapshot:
+            values = np.percentile(durations, PERCENTILES) / 1e6
+            stats[stage] = {"count": count, "mean_ms": durations.mean() / 1e6,
+                            **{f"p{q}_ms": value for q, value in zip(PERCENTILES, values)}}
+        return stats
+
+    def format_stats(self):
+        """Latency percentiles of every stage as one log line."""
+        stats = self.stats()
+        if not stats:
+            return "no spans recorded"
+        return " | ".join(
+            f"{stage}: p50 {s['p50_ms']:.2f} p95 {s['p95_ms']:.2f} p99 {s['p99_ms']:.2f} ms"
+            for stage, s in stats.items()
+        )
+
+    def _render_overlay(self, shape, dtype, line_height, scale, color):
+        """Render the latency table into a small opaque patch."""
+        stats = self.stats()
+        rows = [("stage", "p50", "p95", "p99 ms")] + [
+            (stage, f"{s['p50_ms']:.2f}", f"{s['p95_ms']:.2f}", f"{s['p99_ms']:.2f}") for stage, s in stats.items()
+        ]
+        # The font is proportional, so every column starts at a fixed offset
+        column = int(60 * scale / 0.45)
+        columns = (0, 2 * column, 3 * column, 4 * column)
+        patch = np.zeros((line_height * len(rows) + line_height // 2, 5 * column + 10) + tuple(shape[2:]), dtype)
+        for i, row in enumerate(rows):
+            y = line_height * (i + 1)
+            for x, text in zip(columns, row):
+                cv2.putText(patch, text, (x + 5, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, 1, cv2.LINE_AA)
+        return patch
+
+    def draw(self, frame, origin=(10, 10), line_height=18, scale=0.45, color=(255, 255, 255)):
+        """
+        Draw the stage latencies on a frame, one line per stage, in an opaque box. The table is rendered
+        at most every `overlay_interval` seconds and copied onto the frame in between, so drawing it on
+        every frame costs one small copy.
+
+        Parameters:
+        - frame (numpy.ndarray): The frame to draw on.
+        - origin (tuple): Top left corner of the box in pixels.
+        - line_height (int): Distance between two lines in pixels.
+        - scale (float): Font scale.
+        - color (tuple): Text color.
+
+        Returns:
+        - numpy.ndarray: The frame.
+        """
+        now = monotonic()
+        patch = self._overlay
+        if (patch is None or now - self._overlay_time >= self.overlay_interval
+                or patch.dtype != frame.dtype or patch.shape[2:] != frame.shape[2:]):
+            patch = self._overlay = self._render_overlay(frame.shape, frame.dtype, line_height, scale, color)
+            self._overlay_time = now
+
+        x, y = origin
+        h = min(patch.shape[0], frame.shape[0] - y)
+        w = min(patch.shape[1], frame.shape[1] - x)
+        if h > 0 and w > 0:
+            frame[y:y + h, x:x + w] = patch[:h, :w]
+        return frame
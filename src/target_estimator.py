@@ -0,0 +1,171 @@
+"""
+target_estimator.py
+
+Constant-velocity Kalman filter of the target direction, for predicting it between camera frames.
+
+Every detection is already one capture-plus-processing latency old when it arrives, and frames come at
+30-60 fps while the servos can be commanded much faster. The estimator is fed the timestamped detections
+and can be asked at any time where the target is now, so the control loop can steer towards the
+predicted position at its own rate.
+
+The filter tracks the target angle of every axis in the frame of the mount, i.e. the servo angle at
+capture plus the measured error (with the servo's sign), not the error itself: the error also changes
+when the servos move, which a constant-velocity model of the target must not see as target motion. The
+error to control on is then sign * (predicted target - current servo angle).
+
+Each axis is an independent filter with state (angle, angular rate) and white-noise acceleration. Every
+update reports its innovation and normalized innovation squared (NIS, chi-square distributed with one
+degree of freedom per axis). Detections with an NIS above the gate are rejected as outliers (e.g. a
+marker detection on the wrong object); after max_rejects rejections in a row the filter restarts from the
+new detection, since the target has most likely really jumped.
+
+All arrays have shape (..., n_axes): leading dimensions filter independent batches (e.g. simulated runs).
+
+Usage:
+    estimator = TargetEstimator(n_axes=2)
+    estimator.update(angles + signs * errors, timestamp)   # detection thread or control loop
+    target = estimator.predict(monotonic())                 # any time
+
+Dependencies: threading, numpy
+"""
+
+import threading
+
+import numpy as np
+
+
+class TargetEstimator:
+    def __init__(self, n_axes=2, process_noise=1000.0, measurement_noise=1.0, initial_rate=100.0,
+                 gate=13.8, max_rejects=5, max_horizon=0.2):
+        """
+        Parameters:
+        - n_axes (int): Number of axes, e.g. 2 for (pan, tilt).
+        - process_noise (float or array): Spectral density of the target's angular acceleration in
+          deg^2/s^3, per axis or for all. Higher follows faster motion, lower smooths more.
+        - measurement_noise (float or array): Standard deviation of a detection in degrees. Besides the
+          detection noise this covers the servo lagging behind its commanded angle (the target angle is
+          built from the commanded angle), so keep it around a degree or the gate rejects good detections
+          while the servos move.
+        - initial_rate (float): Standard deviation of the unknown angular rate of a new target in deg/s.
+        - gate (float): NIS above which a detection is rejected (13.8 is the 99.9% chi-square quantile for
+          2 axes).
+        - max_rejects (int): Rejections in a row after which the filter restarts from the detection.
+        - max_horizon (float): Longest extrapolation in seconds, so a lost target is not predicted to run off.
+        """
+        self.n_axes = n_axes
+        self.q = np.broadcast_to(np.asarray(process_noise, dtype=np.float64), (n_axes,)).copy()
+        self.r = np.broadcast_to(np.asarray(measurement_noise, dtype=np.float64) ** 2, (n_axes,)).copy()
+        self.initial_rate = initial_rate
+        self.gate = gate
+        self.max_rejects = max_rejects
+        self.max_horizon = max_horizon
+
+        self.lock = threading.Lock()
+        self.updates = 0
+        self.rejected = 0
+        self.reset()
+
+    def reset(self):
+        """Forget the target, e.g. after losing it."""
+        with self.lock:
+            self.angle = None        # Estimated target angle (..., n_axes)
+            self.rate = None         # Estimated angular rate (..., n_axes)
+            self.p00 = self.p01 = self.p11 = None  # Covariance of (angle, rate) per axis
+            self.timestamp = None    # Time of the estimate
+            self.rejects = None      # Rejections in a row (...)
+            self.innovation = None   # Innovation of the last detection (..., n_axes)
+            self.nis = None          # Normalized innovation squared of the last detection (...)
+
+    @property
+    def initialized(self):
+        """True once the filter has seen a detection."""
+        return self.angle is not None
+
+    def _initial_state(self, measurement):
+        zeros = np.zeros_like(measurement)
+        return (measurement.copy(), zeros, zeros + self.r, zeros.copy(), zeros + self.initial_rate ** 2)
+
+    def _predicted(self, dt):
+        """State and covariance dt seconds after the current estimate (state unchanged)."""
+        dt2 = dt * dt
+        angle = self.angle + self.rate * dt
+        p00 = self.p00 + 2 * dt * self.p01 + dt2 * self.p11 + self.q * dt2 * dt / 3
+        p01 = self.p01 + dt * self.p11 + self.q * dt2 / 2
+        p11 = self.p11 + self.q * dt
+        return angle, self.rate, p00, p01, p11
+
+    def update(self, measurement, timestamp):
+        """
+        Feed one detection.
+
+        Parameters:
+        - measurement (array): Target angles in degrees, shape (..., n_axes).
+        - timestamp (float): Capture time of the detection in seconds.
+
+        Returns:
+        - numpy.ndarray or bool: Whether the detection was accepted (per batch). False for a detection
+          older than the current estimate, which is ignored.
+        """
+        measurement = np.asarray(measurement, dtype=np.float64)
+        with self.lock:
+            if self.angle is None or self.angle.shape != measurement.shape:
+                self.angle, self.rate, self.p00, self.p01, self.p11 = self._initial_state(measurement)
+                self.timestamp = timestamp
+                self.rejects = np.zeros(measurement.shape[:-1], dtype=np.int64)
+                self.innovation = np.zeros_like(measurement)
+                self.nis = np.zeros(measurement.shape[:-1])
+                self.updates += 1
+                return np.ones(measurement.shape[:-1], dtype=bool)
+
+            dt = timestamp - self.timestamp
+            if dt < 0:
+                return False
+            angle, rate, p00, p01, p11 = self._predicted(dt)
+
+            innovation = measurement - angle
+            s = p00 + self.r
+            nis = np.sum(innovation ** 2 / s, axis=-1)
+            accepted = nis <= self.gate
+
+            # Kalman gain of (angle, rate) for an angle measurement
+            k0, k1 = p00 / s, p01 / s
+            updated = (angle + k0 * innovation, rate + k1 * innovation,
+                       (1 - k0) * p00, (1 - k0) * p01, p11 - k1 * p01)
+
+            self.rejects = np.where(accepted, 0, self.rejects + 1)
+            restart = (self.rejects > self.max_rejects)[..., None]
+            accept = accepted[..., None]
+            state = [np.where(restart, initial, np.where(accept, new, predicted))
+                     for initial, new, predicted in zip(self._initial_state(measurement), updated,
+                                                        (angle, rate, p00, p01, p11))]
+            self.angle, self.rate, self.p00, self.p01, self.p11 = state
+            self.rejects = np.where(restart[..., 0], 0, self.rejects)
+            self.timestamp = timestamp
+            self.innovation = innovation
+            self.nis = nis
+            self.updates += 1
+            self.rejected += int(np.count_nonzero(~accepted))
+            return accepted
+
+    def predict(self, timestamp):
+        """
+        Predicted target angles at a given time (at most max_horizon past the last detection).
+
+        Parameters:
+        - timestamp (float): Time to predict for, on the clock of the detection timestamps.
+
+        Returns:
+        - numpy.ndarray or None: Target angles (..., n_axes), or None before the first detection.
+        """
+        with self.lock:
+            if self.angle is None:
+                return None
+            horizon = min(max(timestamp - self.timestamp, 0.0), self.max_horizon)
+            return self.angle + self.rate * horizon
+
+    def format_stats(self):
+        """Estimator statistics as one log line."""
+        line = f"Detections: {self.updates}, Rejected: {self.rejected}"
+        if self.nis is not None and np.size(self.nis) == 1:
+            line += f", Last NIS: {np.ravel(self.nis)[0]:.2f}"
+        return line
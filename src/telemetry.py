@@ -0,0 +1,132 @@
+"""
+telemetry.py
+
+Run data recorder for the tracking loops.
+
+Rows are written into preallocated chunks with one contiguous array per column, so recording a frame is
+a few stores instead of growing an array with np.vstack (which copies the whole run every frame). Full
+chunks are handed to a background writer thread that appends them to the CSV file and returns the chunk
+for reuse. The per-frame cost stays flat over long runs, and everything up to the last full chunk is
+already on disk if the program crashes.
+
+The CSV matches what the scripts used to write with np.savetxt: one header line with the column names,
+comma separated values, "%.5f" by default.
+
+Usage:
+    telemetry = TelemetryRecorder("data_main.csv", ["Time", "Pan_Error", "Pan_Angle"])
+    telemetry.record(elapsed_time, pan_error, new_pan)
+    ...
+    telemetry.close()
+
+Dependencies: logging, queue, threading, numpy
+"""
+
+import logging
+import queue
+import threading
+
+import numpy as np
+
+
+class TelemetryRecorder:
+    def __init__(self, path, columns, chunk_size=256, fmt="%.5f", dtype=np.float64):
+        """
+        Create the CSV file, write its header and start the writer thread.
+
+        Parameters:
+        - path (str): CSV file to write. An existing file is overwritten.
+        - columns (list of str): The fixed schema, one name per column.
+        - chunk_size (int): Rows per chunk. At most this many rows are lost if the program crashes.
+        - fmt (str): Number format of the values.
+        - dtype (numpy.dtype): Data type of the columns.
+        """
+        self.path = path
+        self.columns = list(columns)
+        self.chunk_size = chunk_size
+        self.fmt = fmt
+        self.dtype = dtype
+        self.rows = 0
+
+        self.lock = threading.Lock()
+        self._chunk = self._new_chunk()
+        self._filled = 0
+        # Chunks written to disk, ready for reuse
+        self._free = queue.SimpleQueue()
+        self._pending = queue.Queue()
+        self.closed = False
+
+        self.file = open(path, "w")
+        self.file.write(",".join(self.columns) + "\n")
+        self.file.flush()
+
+        self.writer_thread = threading.Thread(target=self._write_chunks, daemon=True, name="TelemetryWriter")
+        self.writer_thread.start()
+
+    def _new_chunk(self):
+        return np.empty((len(self.columns), self.chunk_size), dtype=self.dtype)
+
+    def record(self, *values):
+        """
+        Record one row.
+
+        Parameters:
+        - values: One value per column, in schema order.
+        """
+        if len(values) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} values ({', '.join(self.columns)}), got {len(values)}.")
+        with self.lock:
+            if self.closed:
+                return
+            self._chunk[:, self._filled] = values
+            self._filled += 1
+            self.rows += 1
+            if self._filled == self.chunk_size:
+                self._submit()
+
+    def _submit(self):
+        """Hand the current chunk to the writer and continue in a free one (lock held)."""
+        self._pending.put((self._chunk, self._filled))
+        try:
+            self._chunk = self._free.get_nowait()
+        except queue.Empty:
+            self._chunk = self._new_chunk()
+        self._filled = 0
+
+    def flush(self):
+        """Hand the rows recorded so far to the writer, without waiting for the chunk to fill up."""
+        with self.lock:
+            if self._filled and not self.closed:
+                self._submit()
+
+    def _write_chunks(self):
+        """Writer thread: append every submitted chunk to the file."""
+        while True:
+            item = self._pending.get()
+            if item is None:
+                break
+            chunk, filled = item
+            try:
+                np.savetxt(self.file, chunk[:, :filled].T, delimiter=",", fmt=self.fmt)
+                self.file.flush()
+            except Exception as e:
+                logging.error(f"Error writing telemetry to {self.path}: {e}")
+            if filled == self.chunk_size:
+                self._free.put(chunk)
+
+    def close(self):
+        """Write the remaining rows, stop the writer thread and close the file."""
+        with self.lock:
+            if self.closed:
+                return
+            if self._filled:
+                self._submit()
+            self.closed = True
+        self._pending.put(None)
+        self.writer_thread.join()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()